@@ -0,0 +1,405 @@
+import io
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+
+import anyio
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+
+import jobs
+import metrics
+import models
+import storage
+import tiles
+
+# 项目导入导出：一个归档里放 project.json (项目、分组、场景、热点、自定义图标) 和它引用的全部上传文件。
+# 导出边读文件边写响应，不落临时文件，内存占用与项目大小无关；导入按顺序边读请求体边写进存储，
+# 最后在一个事务里批量建记录，并把热点的 target_scene_id 换成新场景的 id
+MANIFEST_NAME = "project.json"
+FORMAT = "panorama-project"
+FORMAT_VERSION = 1
+MAX_MANIFEST_BYTES = 64 * 1024 * 1024
+ZIP64_LIMIT = 2 ** 31 - 1
+
+# 导出哪些字段；id 只在归档内部用来表示引用关系
+SCENE_FIELDS = (
+    "name", "image_url", "cover_url", "thumb_url", "blurhash", "preview", "sort_order",
+    "initial_heading", "initial_pitch", "fov_min", "fov_max", "fov_default",
+    "limit_h_min", "limit_h_max", "limit_v_min", "limit_v_max",
+)
+HOTSPOT_FIELDS = (
+    "x", "y", "z", "text", "type", "content", "icon_type", "icon_url", "scale", "use_fixed_size", "sort_order",
+)
+ICON_FIELDS = ("name", "url", "sprite_url", "sprite_manifest")
+# 可能引用上传文件的字段，导入时换成新地址
+URL_FIELDS = ("cover_url", "image_url", "thumb_url", "icon_url", "content", "url", "sprite_url")
+# 导入时不随归档带来的站内地址只认系统图标，其它 (别人的上传、任意路径) 一律置空
+SYSTEM_ICON_RE = re.compile(r"^/static/icons/system/[\w-]+(\.[\w-]+)*$")
+
+
+# ===========================
+#          导出
+# ===========================
+
+def _upload_path(url):
+    """存储里的文件返回磁盘路径，其它地址 (系统图标、外链、普通文本) 返回 None"""
+    if not isinstance(url, str) or not url.startswith("/" + storage.UPLOAD_ROOT + "/"):
+        return None
+    path = os.path.normpath(url.lstrip("/"))
+    if not path.startswith(os.path.normpath(storage.UPLOAD_ROOT) + os.sep):
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def build_manifest(db, project_id: int, owner_id: int):
+    """项目不存在返回 None；files 为 {地址: {name, size}}，name 是文件在归档里的路径"""
+    P, G, S, H, I = models.Project, models.SceneGroup, models.Scene, models.Hotspot, models.HotspotIcon
+
+    project = db.execute(
+        select(P.name, P.category, P.cover_url).where(P.id == project_id, P.owner_id == owner_id)
+    ).first()
+    if project is None:
+        return None
+    groups = [g._asdict() for g in db.execute(select(G.id, G.name).where(G.project_id == project_id).order_by(G.id))]
+    scenes = [s._asdict() for s in db.execute(
+        select(S.id, S.group_id, *(S.__table__.c[f] for f in SCENE_FIELDS))
+        .join(G, S.group_id == G.id)
+        .where(G.project_id == project_id)
+        .order_by(S.group_id, S.sort_order, S.id)
+    )]
+    hotspots = [h._asdict() for h in db.execute(
+        select(H.source_scene_id, H.target_scene_id, *(H.__table__.c[f] for f in HOTSPOT_FIELDS))
+        .join(S, H.source_scene_id == S.id)
+        .join(G, S.group_id == G.id)
+        .where(G.project_id == project_id)
+        .order_by(H.source_scene_id, H.sort_order, H.id)
+    )]
+    icon_urls = {h["icon_url"] for h in hotspots if h["icon_type"] == "custom"}
+    icons = [i._asdict() for i in db.execute(
+        select(*(I.__table__.c[f] for f in ICON_FIELDS))
+        .where(I.owner_id == owner_id, I.category == "custom", I.url.in_(icon_urls))
+        .order_by(I.id)
+    )] if icon_urls else []
+
+    files = {}
+    for row in [project._asdict(), *scenes, *hotspots, *icons]:
+        for field in URL_FIELDS:
+            url = row.get(field)
+            path = url not in files and _upload_path(url)
+            if path:
+                rel = os.path.relpath(path, storage.UPLOAD_ROOT).replace(os.sep, "/")
+                files[url] = {"name": "files/" + rel, "size": os.path.getsize(path)}
+
+    return {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "exported_at": datetime.now().isoformat(),
+        "project": project._asdict(),
+        "groups": groups,
+        "scenes": scenes,
+        "hotspots": hotspots,
+        "icons": icons,
+        "files": files,
+    }
+
+
+def _entries(manifest: dict):
+    """(归档内路径, 大小, 打开函数)，清单总在第一个，导入时据此决定后面的文件怎么处理"""
+    data = json.dumps(manifest, ensure_ascii=False).encode()
+    yield MANIFEST_NAME, len(data), lambda: io.BytesIO(data)
+    for url, entry in manifest["files"].items():
+        path = url.lstrip("/")
+        yield entry["name"], entry["size"], lambda path=path: open(path, "rb")
+
+
+def _copy(name: str, opener, size: int):
+    """按块读出文件；导出期间文件被改动 (大小对不上) 时中止，不生成损坏的归档"""
+    remaining = size
+    with opener() as f:
+        while remaining > 0:
+            chunk = f.read(min(storage.CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    if remaining:
+        raise IOError(f"文件在导出过程中被修改: {name}")
+
+
+def stream_tar(manifest: dict):
+    """
+    直接拼 tar 的头和数据块，不经过 tarfile 的缓冲：
+    每个文件只占一个读缓冲区，生成器交给 StreamingResponse 在线程池里迭代
+    """
+    mtime = int(time.time())
+    written = 0
+    for name, size, opener in _entries(manifest):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        info.mode = 0o644
+        header = info.tobuf(tarfile.PAX_FORMAT)
+        yield header
+        for chunk in _copy(name, opener, size):
+            yield chunk
+        padding = -size % tarfile.BLOCKSIZE
+        if padding:
+            yield tarfile.NUL * padding
+        written += len(header) + size + padding
+    # 结尾两个空块，整体补齐到记录长度，与 tarfile 写出的一致
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(written + end) % tarfile.RECORDSIZE
+    yield tarfile.NUL * end
+
+
+class _Sink:
+    """zipfile 的输出目标：不可 seek，写入的数据由生成器随时取走"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def stream_zip(manifest: dict):
+    """
+    输出不可 seek 时 zipfile 用数据描述符记录大小和 CRC，照样可以边写边发。
+    全景图本身已经压缩过，文件用 STORED，只有清单做压缩
+    """
+    sink = _Sink()
+    date_time = datetime.now().timetuple()[:6]
+    with zipfile.ZipFile(sink, "w") as zf:
+        for name, size, opener in _entries(manifest):
+            info = zipfile.ZipInfo(name, date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED if name == MANIFEST_NAME else zipfile.ZIP_STORED
+            with zf.open(info, "w", force_zip64=size > ZIP64_LIMIT) as dst:
+                for chunk in _copy(name, opener, size):
+                    dst.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+# ===========================
+#          导入
+# ===========================
+
+class BodyReader:
+    """
+    把异步的请求体变成同步的文件对象，在线程池里交给 tarfile 按顺序读取，
+    每次只从事件循环取一块，不会把整个请求体读进内存。
+    没有 Content-Length 的分块请求绕过了中间件的检查，这里按实际读到的字节数限制
+    """
+
+    def __init__(self, chunks, max_bytes: int = None):
+        self._chunks = chunks.__aiter__()
+        self._buf = bytearray()
+        self._eof = False
+        self._max_bytes = max_bytes
+        self._received = 0
+
+    async def _next(self):
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def _fill(self, size: int):
+        while not self._eof and (size < 0 or len(self._buf) < size):
+            chunk = anyio.from_thread.run(self._next)
+            if chunk is None:
+                self._eof = True
+                continue
+            self._received += len(chunk)
+            if self._max_bytes and self._received > self._max_bytes:
+                raise HTTPException(status_code=413, detail="Archive too large")
+            self._buf += chunk
+
+    def peek(self, size: int) -> bytes:
+        self._fill(size)
+        return bytes(self._buf[:size])
+
+    def read(self, size: int = -1) -> bytes:
+        self._fill(size)
+        if size < 0 or size >= len(self._buf):
+            data, self._buf = bytes(self._buf), bytearray()
+        else:
+            data = bytes(self._buf[:size])
+            del self._buf[:size]
+        return data
+
+
+def _tar_members(fileobj):
+    """r|* 顺序读取，同时支持 .tar.gz；每个成员必须在取下一个之前读完"""
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+        for member in tf:
+            if member.isfile():
+                yield member.name, member.size, tf.extractfile(member)
+
+
+def _zip_members(fileobj):
+    """zip 的目录在文件末尾，没法边收边解，先落到上传目录里的临时文件再读"""
+    os.makedirs(storage.UPLOAD_ROOT, exist_ok=True)
+    with tempfile.TemporaryFile(dir=storage.UPLOAD_ROOT, prefix=".import-") as spool:
+        shutil.copyfileobj(fileobj, spool, storage.CHUNK_SIZE)
+        spool.seek(0)
+        with zipfile.ZipFile(spool) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    with zf.open(info) as f:
+                        yield info.filename, info.file_size, f
+
+
+def _read_manifest(members) -> dict:
+    first = next(members, None)
+    if first is None or first[0] != MANIFEST_NAME:
+        raise HTTPException(status_code=400, detail=f"Archive must start with {MANIFEST_NAME}")
+    _, size, f = first
+    if size > MAX_MANIFEST_BYTES:
+        raise HTTPException(status_code=413, detail="Manifest too large")
+    try:
+        manifest = json.loads(f.read())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid manifest")
+    if not isinstance(manifest, dict) or manifest.get("format") != FORMAT:
+        raise HTTPException(status_code=400, detail="Not a project archive")
+    if manifest.get("version") != FORMAT_VERSION:
+        raise HTTPException(status_code=400, detail=f"Unsupported archive version: {manifest.get('version')}")
+    return manifest
+
+
+def _store_files(members, files: dict) -> dict:
+    """
+    把清单里列出的文件写进存储，返回 {旧地址: 新地址}。
+    内容寻址，已有的文件不会重复占空间；导入失败时已写入的文件没人引用，由 sweeper 过了宽限期回收
+    """
+    by_name = {entry["name"]: (url, entry["size"]) for url, entry in files.items()}
+    stored = {}
+    for name, size, f in members:
+        if name not in by_name or by_name[name][0] in stored:
+            continue
+        url, expected_size = by_name[name]
+        if size > storage.MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"File too large: {name}")
+        started = time.perf_counter()
+        blob = storage.save_stream(f, name)
+        metrics.record_upload("import", blob.size, time.perf_counter() - started)
+        if blob.size != expected_size:
+            raise HTTPException(status_code=400, detail=f"Size mismatch: {name}")
+        stored[url] = blob.url
+    missing = len(by_name) - len(stored)
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Archive is incomplete: {missing} files missing")
+    return stored
+
+
+def _insert(db, model, rows):
+    """批量插入并按顺序返回新记录的 id"""
+    if not rows:
+        return []
+    return list(db.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), rows))
+
+
+def import_archive(db, fileobj, owner_id: int, name: str = None) -> dict:
+    """
+    在线程池里调用。fileobj 为 tar (可 gzip 压缩) 或 zip，按开头几个字节区分。
+    返回新项目的 id、各类记录数和需要在 commit 之后启动的任务
+    """
+    members = _zip_members(fileobj) if fileobj.peek(4) == b"PK\x03\x04" else _tar_members(fileobj)
+    try:
+        manifest = _read_manifest(members)
+        urls = _store_files(members, manifest.get("files") or {})
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError) as e:
+        # 归档损坏或被截断
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+    finally:
+        members.close()
+
+    def remap(row: dict, fields) -> dict:
+        out = {f: row.get(f) for f in fields}
+        for f in URL_FIELDS:
+            value = out.get(f)
+            if value in urls:
+                out[f] = urls[value]
+            elif isinstance(value, str) and value.startswith("/") and not SYSTEM_ICON_RE.match(value):
+                out[f] = None
+        return out
+
+    try:
+        project = remap(manifest["project"], ("name", "category", "cover_url"))
+        project_id, = _insert(db, models.Project, [{**project, "name": name or project["name"], "owner_id": owner_id}])
+
+        groups = manifest["groups"]
+        group_ids = dict(zip(
+            (g["id"] for g in groups),
+            _insert(db, models.SceneGroup, [{"name": g["name"], "project_id": project_id} for g in groups]),
+        ))
+
+        scenes = [s for s in manifest["scenes"] if s["group_id"] in group_ids]
+        scene_rows = [{**remap(s, SCENE_FIELDS), "group_id": group_ids[s["group_id"]]} for s in scenes]
+        scene_ids = dict(zip((s["id"] for s in scenes), _insert(db, models.Scene, scene_rows)))
+
+        # 指向归档外场景的跳转 (导出时已失效的引用) 置空，与场景被删后的处理一致
+        hotspot_rows = [
+            {
+                **remap(h, HOTSPOT_FIELDS),
+                "source_scene_id": scene_ids[h["source_scene_id"]],
+                "target_scene_id": scene_ids.get(h["target_scene_id"]),
+            }
+            for h in manifest["hotspots"] if h["source_scene_id"] in scene_ids
+        ]
+        hotspot_count = len(_insert(db, models.Hotspot, hotspot_rows))
+
+        # 自定义图标加进当前用户的图标库，已有同一个文件的不重复添加
+        icons = [i for i in (remap(i, ICON_FIELDS) for i in manifest.get("icons") or []) if i["url"]]
+        owned = set(db.scalars(select(models.HotspotIcon.url).where(
+            models.HotspotIcon.owner_id == owner_id,
+            models.HotspotIcon.url.in_([i["url"] for i in icons]),
+        ))) if icons else set()
+        icon_rows = [
+            {**i, "category": "custom", "owner_id": owner_id}
+            for i in {i["url"]: i for i in icons if i["url"] not in owned}.values()
+        ]
+        _insert(db, models.HotspotIcon, icon_rows)
+    except (KeyError, TypeError, ValueError) as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Invalid manifest: {e}")
+
+    # 瓦片不放进归档，和新建项目一样在后台重新切 (开启切片时)；缩略图只补缺的
+    new_jobs = [jobs.create_job(db, "tiles", scene_id=sid, image_url=row["image_url"])
+                for sid, row in zip(scene_ids.values(), scene_rows) if row["image_url"]] if tiles.ENABLED else []
+    missing_thumbs = [sid for sid, row in zip(scene_ids.values(), scene_rows) if not row["thumb_url"]]
+    if missing_thumbs:
+        new_jobs.append(jobs.create_job(db, "thumbnails", scene_ids=missing_thumbs))
+    variant_urls = [row["image_url"] for row in scene_rows if row["image_url"]]
+    variant_urls += [i["url"] for i in icon_rows if storage.normalize_ext(i["url"]) in (".png", ".jpg")]
+    if variant_urls:
+        new_jobs.append(jobs.create_job(db, "variants", urls=list(dict.fromkeys(variant_urls))))
+    db.commit()
+
+    return {
+        "project_id": project_id,
+        "groups": len(group_ids),
+        "scenes": len(scene_ids),
+        "hotspots": hotspot_count,
+        "icons": len(icon_rows),
+        "files": len(urls),
+        "job_ids": [job.id for job in new_jobs],
+    }
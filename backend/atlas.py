@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+import models
+from cache import LRUCache
+from database import SessionLocal
+from static_files import STATIC_DIR, file_version
+
+# 图标纹理图集：用户可见的全部图标 (系统 + 自己的自定义图标) 拼成一张或几张大图，
+# 前端每个会话只加载一次纹理，热点按 UV 取各自的区域
+ATLAS_ROOT = "static/atlas"
+CELL_ROOT = os.path.join(ATLAS_ROOT, "cells")
+CELL_SIZE = int(os.getenv("ATLAS_CELL", "128"))
+# 每个格子四周向外复制边缘像素，避免 mipmap / 线性过滤时采到相邻图标
+PADDING = 2
+# WebGL 普遍支持的最大纹理边长，超出的图标放到下一页
+MAX_PAGE_SIZE = int(os.getenv("ATLAS_MAX_SIZE", "4096"))
+
+# user_id -> (图标集合签名, 图集清单)；上传、删除图标后签名变化，重新生成
+_manifests = LRUCache(int(float(os.getenv("ATLAS_CACHE_MB", "16")) * 1024 * 1024))
+_build_lock = threading.Lock()
+
+
+def _icon_path(url: str):
+    if not url or not url.startswith("/static/"):
+        return None
+    return os.path.join(STATIC_DIR, url[len("/static/"):])
+
+
+def visible_icons(db, user_id: int):
+    """与 GET /icons/ 相同的可见范围，系统图标在前，各自按 id 排序"""
+    Icon = models.HotspotIcon
+    return (
+        db.query(Icon.id, Icon.name, Icon.url, Icon.category, Icon.sprite_url, Icon.sprite_manifest)
+        .filter((Icon.category == "system") | ((Icon.category == "custom") & (Icon.owner_id == user_id)))
+        .order_by(Icon.category.desc(), Icon.id)
+        .all()
+    )
+
+
+def _signature(icons) -> str:
+    return hashlib.sha1(json.dumps([(i.id, i.url, i.sprite_url) for i in icons]).encode()).hexdigest()
+
+
+def _cell(url: str):
+    """
+    图标缩放到 CELL_SIZE 的正方形格子 (与前端把图标贴到正方形精灵上的效果一致)，
+    结果按 URL + 文件版本缓存在磁盘上。SVG、动图和无法解码的文件返回 None
+    """
+    path = _icon_path(url)
+    try:
+        stat_result = os.stat(path) if path else None
+    except OSError:
+        stat_result = None
+    if stat_result is None or path.lower().endswith(".svg"):
+        return None, None
+    key = hashlib.sha1(f"{url}|{file_version(stat_result)}|{CELL_SIZE}".encode()).hexdigest()
+    cell_path = os.path.join(CELL_ROOT, key[:2], key + ".png")
+    if not os.path.exists(cell_path):
+        try:
+            with Image.open(path) as im:
+                if getattr(im, "n_frames", 1) > 1:
+                    return None, None
+                cell = im.convert("RGBA").resize((CELL_SIZE, CELL_SIZE), Image.LANCZOS)
+        except Exception:
+            return None, None
+        os.makedirs(os.path.dirname(cell_path), exist_ok=True)
+        tmp_path = cell_path + ".tmp"
+        cell.save(tmp_path, format="PNG")
+        os.replace(tmp_path, cell_path)
+    return key, cell_path
+
+
+def _page_layout():
+    stride = CELL_SIZE + 2 * PADDING
+    per_row = max(1, MAX_PAGE_SIZE // stride)
+    per_page = per_row * per_row
+    return stride, per_row, per_page
+
+
+def _compose_page(cell_paths, columns: int, rows: int, stride: int, out_path: str):
+    page = np.zeros((rows * stride, columns * stride, 4), dtype=np.uint8)
+    for i, cell_path in enumerate(cell_paths):
+        with Image.open(cell_path) as cell:
+            pixels = np.asarray(cell.convert("RGBA"))
+        x, y = (i % columns) * stride, (i // columns) * stride
+        page[y:y + stride, x:x + stride] = np.pad(pixels, ((PADDING, PADDING), (PADDING, PADDING), (0, 0)), mode="edge")
+    tmp_path = out_path + ".tmp"
+    Image.fromarray(page).save(tmp_path, format="PNG", optimize=True)
+    os.replace(tmp_path, out_path)
+
+
+def build(icons) -> dict:
+    """
+    生成图集清单。页图片以所含格子的内容哈希命名：图标集合变化时只有格子列表变了的页
+    需要重新拼接，新图标也只需要单独缩放一次
+    """
+    stride, per_row, per_page = _page_layout()
+    packed, excluded = [], []
+    for icon in icons:
+        key, cell_path = _cell(icon.url)
+        if key is None:
+            excluded.append(icon.url)
+        else:
+            packed.append((icon, key, cell_path))
+
+    pages, entries = [], {}
+    for start in range(0, len(packed), per_page):
+        chunk = packed[start:start + per_page]
+        columns = min(per_row, len(chunk))
+        rows = -(-len(chunk) // columns)
+        page_key = hashlib.sha1(f"{CELL_SIZE}|{PADDING}|{columns}|".encode() + "|".join(k for _, k, _ in chunk).encode()).hexdigest()
+        page_path = os.path.join(ATLAS_ROOT, page_key + ".png")
+        if not os.path.exists(page_path):
+            os.makedirs(ATLAS_ROOT, exist_ok=True)
+            _compose_page([p for _, _, p in chunk], columns, rows, stride, page_path)
+        width, height = columns * stride, rows * stride
+        page_index = len(pages)
+        pages.append({"url": "/" + page_path.replace(os.sep, "/"), "width": width, "height": height})
+
+        for i, (icon, _, _) in enumerate(chunk):
+            x = (i % columns) * stride + PADDING
+            y = (i // columns) * stride + PADDING
+            entries[icon.url] = {
+                "id": icon.id, "name": icon.name, "page": page_index,
+                "x": x, "y": y, "w": CELL_SIZE, "h": CELL_SIZE,
+                # WebGL 约定，原点在左下：offset = (u0, v0)，repeat = (u1 - u0, v1 - v0)
+                "uv": [x / width, 1 - (y + CELL_SIZE) / height, (x + CELL_SIZE) / width, 1 - y / height],
+            }
+
+    # 动图不进图集，转码好的精灵图单独列出，前端按帧平移 UV 播放
+    sprites = {
+        icon.url: {"url": icon.sprite_url, **json.loads(icon.sprite_manifest)}
+        for icon in icons if icon.sprite_url and icon.sprite_manifest
+    }
+    key = hashlib.sha1((_signature(icons) + "|".join(p["url"] for p in pages)).encode()).hexdigest()[:16]
+    return {
+        "key": key, "cell": CELL_SIZE, "padding": PADDING, "pages": pages,
+        "icons": entries, "sprites": sprites, "excluded": excluded,
+    }
+
+
+def get_atlas(db, user_id: int) -> dict:
+    """取用户当前图标集合对应的图集，集合没变时直接用内存里的清单"""
+    icons = visible_icons(db, user_id)
+    signature = _signature(icons)
+    cached = _manifests.get(user_id)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with _build_lock:
+        manifest = build(icons)
+    _manifests.put(user_id, (signature, manifest), 256 + 256 * len(icons))
+    return manifest
+
+
+def rebuild_for_user(user_id: int):
+    """图标上传 / 删除后在后台预先生成，前端下次请求直接命中"""
+    with SessionLocal() as db:
+        get_atlas(db, user_id)
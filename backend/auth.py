@@ -1,22 +1,55 @@
+import os
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 import models
+from cache import TTLCache
 from database import get_db
 
 # 密钥配置 (真实生产环境要放在环境变量里)
 SECRET_KEY = "u8x/A?D(G+KbPeShVmYq3t6w9z$C&F)H@McQfTjWnZr4"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 
+ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 已验证的 token 缓存：命中时既不解码 JWT 也不查用户表
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+
+# 运维接口 (全局的垃圾回收报告等) 只对这些用户名开放，逗号分隔；未配置时任何人都不能访问
+OPERATORS = frozenset(u.strip() for u in os.getenv("OPERATOR_USERS", "").split(",") if u.strip())
+
+# bcrypt 成本因子；min/max 都设成同一个值，旧成本的哈希在登录时会被重新计算
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/swagger_login")
 
+# token -> CurrentUser，过期时间取 token 的 exp 和 AUTH_CACHE_TTL 中较早的一个
+token_cache = TTLCache(AUTH_CACHE_SIZE)
+# 缓存未命中时实际查询用户表的次数
+auth_stats = {"user_queries": 0}
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """已登录用户的身份快照，接口里只用到 id 和用户名"""
+    id: int
+    username: str
+
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -30,7 +63,20 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def invalidate_user(user_id: int):
+    token_cache.discard_where(lambda u: u.id == user_id)
+
+# 用户被修改或删除时 (例如改密码、重新哈希)，它的 token 缓存立即失效
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _on_user_changed(mapper, connection, target):
+    invalidate_user(target.id)
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -39,12 +85,30 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
+        user_id: Optional[int] = payload.get("uid")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.username == username).first()
+
+    auth_stats["user_queries"] += 1
+    if user_id is not None:
+        # 新 token 带用户 id，走主键查询
+        user = db.get(models.User, user_id)
+        if user is not None and user.username != username:
+            user = None
+    else:
+        user = db.query(models.User).filter(models.User.username == username).first()
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+
+    current = CurrentUser(id=user.id, username=user.username)
+    token_cache.put(token, current, min(payload["exp"], time.time() + AUTH_CACHE_TTL))
+    return current
+
+
+def get_operator(current_user: CurrentUser = Depends(get_current_user)):
+    """运维接口的依赖：不在 OPERATOR_USERS 里的用户返回 403"""
+    if current_user.username not in OPERATORS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operator only")
+    return current_user
@@ -0,0 +1,132 @@
+"""
+混合读写并发压测：多个客户端同时读取项目详情、修改热点和场景，
+对比不同数据库配置下的延迟和 "database is locked" 等失败次数。
+
+    cd backend && python -m bench.bench_db_concurrency --clients 16 --seconds 10
+
+每种配置在独立子进程里运行 (配置在导入 database 时读取环境变量)。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from bench.common import BACKEND_DIR
+
+PROFILES = {
+    # 改造前的等价配置：回滚日志模式、FULL 同步、驱动默认的 5 秒等待
+    "legacy": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_CACHE_KB": "2000",
+               "SQLITE_MMAP_MB": "0", "SQLITE_BUSY_TIMEOUT_MS": "5000"},
+    "tuned": {},
+}
+
+
+async def drive(args):
+    from bench.common import use_temp_workdir
+    use_temp_workdir()
+    import httpx
+    import jobs
+    import main
+    import startup
+
+    startup.run()
+    jobs.start = lambda job_id: None
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await client.post("/auth/register", json={"username": "bench", "password": "bench"})
+        token = (await client.post("/auth/login", json={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        project = (await client.post(
+            "/projects/create_full/", data={"name": "bench", "category": "其他"}, headers=headers,
+            files=[("files", (f"{i}.jpg", os.urandom(256) + bytes([i]), "image/jpeg")) for i in range(args.scenes)],
+        )).json()
+        group_id = project["groups"][0]["id"]
+        scene_ids = [s["id"] for s in project["groups"][0]["scenes"]]
+        hotspot_ids = []
+        for sid in scene_ids:
+            for _ in range(args.hotspots):
+                r = await client.post("/hotspots/", json={"x": 0, "y": 0, "z": 0, "source_scene_id": sid})
+                hotspot_ids.append(r.json()["id"])
+
+        rng = random.Random(0)
+        samples = {"read": [], "write": []}
+        failures = {"read": 0, "write": 0}
+        deadline = time.perf_counter() + args.seconds
+
+        async def one_request():
+            if rng.random() < args.write_ratio:
+                kind = "write"
+                op = rng.choice(("hotspot", "scene", "reorder"))
+                if op == "hotspot":
+                    call = client.put(f"/hotspots/{rng.choice(hotspot_ids)}", json={"x": rng.random()})
+                elif op == "scene":
+                    call = client.put(f"/scenes/{rng.choice(scene_ids)}", json={"initial_heading": rng.random()})
+                else:
+                    order = scene_ids[:]
+                    rng.shuffle(order)
+                    call = client.post(f"/groups/{group_id}/reorder_scenes", json=order)
+            else:
+                kind = "read"
+                call = client.get(f"/projects/{project['id']}", headers=headers)
+            start = time.perf_counter()
+            try:
+                r = await call
+                ok = r.status_code < 400
+            except Exception:
+                ok = False
+            samples[kind].append((time.perf_counter() - start) * 1000)
+            if not ok:
+                failures[kind] += 1
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                await one_request()
+
+        await asyncio.gather(*(worker() for _ in range(args.clients)))
+
+    result = {}
+    for kind, values in samples.items():
+        values.sort()
+        n = len(values)
+        result[kind] = {
+            "requests": n,
+            "failures": failures[kind],
+            "rps": round(n / args.seconds, 1),
+            "p50_ms": round(values[n // 2], 2) if n else None,
+            "p99_ms": round(values[min(n - 1, int(n * 0.99))], 2) if n else None,
+        }
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--scenes", type=int, default=50)
+    parser.add_argument("--hotspots", type=int, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    parser.add_argument("--profile", choices=sorted(PROFILES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        asyncio.run(drive(args))
+        return
+
+    report = {"shape": vars(args), "results": {}}
+    for name, overrides in PROFILES.items():
+        env = {**os.environ, **overrides}
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.bench_db_concurrency", *sys.argv[1:], "--profile", name],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        report["results"][name] = json.loads(out.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+批量热点编辑：逐个调用 POST/PUT/DELETE /hotspots 与一次 POST /hotspots/batch 对比
+(请求数、SQL 条数、耗时)。
+
+    cd backend && python -m bench.bench_hotspot_batch --hotspots 40
+"""
+import argparse
+import json
+import time
+
+from bench.common import QueryCounter, use_temp_workdir
+
+
+def hotspot(scene_id, i):
+    return {"x": i, "y": 0.0, "z": -1.0, "text": f"h{i}", "type": "text", "source_scene_id": scene_id}
+
+
+def per_hotspot(client, headers, scene_id, n):
+    ids = []
+    for i in range(n):
+        ids.append(client.post("/hotspots/", json=hotspot(scene_id, i), headers=headers).json()["id"])
+    for i in ids:
+        client.put(f"/hotspots/{i}", json={"scale": 2.0, "text": "moved"}, headers=headers).raise_for_status()
+    for i in ids:
+        client.delete(f"/hotspots/{i}", headers=headers).raise_for_status()
+    return 3 * n
+
+
+def batched(client, headers, scene_id, n):
+    r = client.post("/hotspots/batch", json={"create": [hotspot(scene_id, i) for i in range(n)]}, headers=headers)
+    ids = r.json()["created_ids"]
+    client.post("/hotspots/batch", json={"update": [{"id": i, "scale": 2.0, "text": "moved"} for i in ids]}, headers=headers).raise_for_status()
+    client.post("/hotspots/batch", json={"delete": ids}, headers=headers).raise_for_status()
+    return 3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hotspots", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    use_temp_workdir()
+    from fastapi.testclient import TestClient
+    import main as app_main
+    import models
+    import startup
+    from database import SessionLocal, engine
+
+    startup.run()
+    client = TestClient(app_main.app)
+    client.post("/auth/register", json={"username": "bench", "password": "bench"})
+    token = client.post("/auth/login", json={"username": "bench", "password": "bench"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    with SessionLocal() as db:
+        owner = db.query(models.User).filter(models.User.username == "bench").one()
+        project = models.Project(name="bench", category="其他", owner_id=owner.id)
+        group = models.SceneGroup(name="默认分组", project=project)
+        scene = models.Scene(name="s", image_url="/static/x.jpg", group=group)
+        db.add(scene)
+        db.commit()
+        scene_id = scene.id
+
+    report = {"shape": vars(args), "results": {}}
+    for name, fn in (("per_hotspot", per_hotspot), ("batch", batched)):
+        fn(client, headers, scene_id, args.hotspots)
+        samples = []
+        with QueryCounter(engine) as counter:
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                requests = fn(client, headers, scene_id, args.hotspots)
+                samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        report["results"][name] = {
+            "requests": requests,
+            "queries": counter.count // args.repeat,
+            "median_ms": round(samples[len(samples) // 2], 2),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
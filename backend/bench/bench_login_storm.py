@@ -0,0 +1,110 @@
+"""
+登录高峰：大量并发登录时，其它接口 (GET /projects/{id}) 的延迟。
+对比旧的同步登录 (bcrypt 在请求线程里算) 与独立哈希进程池。
+
+    cd backend && python -m bench.bench_login_storm --logins 200 --clients 50
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bench.common import use_temp_workdir
+
+
+def add_legacy_route(app, models, schemas, get_db, auth):
+    """按改造前的 login 原样实现"""
+    from fastapi import Depends, HTTPException
+
+    @app.post("/bench/legacy_login")
+    def legacy_login(user: schemas.UserLogin, db=Depends(get_db)):
+        db_user = db.query(models.User).filter(models.User.username == user.username).first()
+        if not db_user or not auth.verify_password(user.password, db_user.hashed_password):
+            raise HTTPException(status_code=401, detail="Incorrect username or password")
+        return {"access_token": auth.create_access_token(data={"sub": db_user.username}), "token_type": "bearer"}
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else 0.0
+
+
+async def storm(client, path, logins, clients, probe_path, headers):
+    remaining = [logins]
+    statuses = {}
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            r = await client.post(path, json={"username": "bench", "password": "bench"})
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    probe_ms = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            t = time.perf_counter()
+            r = await client.get(probe_path, headers=headers)
+            r.raise_for_status()
+            probe_ms.append((time.perf_counter() - t) * 1000)
+            await asyncio.sleep(0.005)
+
+    start = time.perf_counter()
+    probe_task = asyncio.create_task(probe())
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+    return {
+        "seconds": round(elapsed, 3),
+        "logins_per_s": round(logins / elapsed, 1),
+        "statuses": statuses,
+        "probe_p50_ms": round(percentile(probe_ms, 0.5), 2),
+        "probe_p99_ms": round(percentile(probe_ms, 0.99), 2),
+    }
+
+
+async def main_async(args):
+    use_temp_workdir()
+    import httpx
+    import auth
+    import hashing
+    import main
+    import models
+    import schemas
+    import startup
+    from database import SessionLocal, get_db
+
+    startup.run()
+    add_legacy_route(main.app, models, schemas, get_db, auth)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await client.post("/auth/register", json={"username": "bench", "password": "bench"})
+        token = (await client.post("/auth/login", json={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        with SessionLocal() as db:
+            owner = db.query(models.User).filter(models.User.username == "bench").one()
+            project = models.Project(name="bench", category="其他", owner_id=owner.id)
+            db.add(project)
+            db.commit()
+            probe_path = f"/projects/{project.id}"
+
+        report = {"shape": vars(args), "bcrypt_rounds": auth.BCRYPT_ROUNDS, "results": {}}
+        for name, path in (("legacy", "/bench/legacy_login"), ("pool", "/auth/login")):
+            report["results"][name] = await storm(client, path, args.logins, args.clients, probe_path, headers)
+        report["hash_pool"] = hashing.snapshot()
+    hashing.shutdown()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=50)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+对比 read_project 的旧实现 (ORM 懒加载 + Python 排序 + pydantic) 与
+loaders.load_project_tree 的查询条数和延迟。
+
+    cd backend && python -m bench.bench_project_load --scenes 300 --hotspots 10
+"""
+import argparse
+import json
+import random
+
+from bench.common import QueryCounter, measure, use_temp_workdir
+
+
+def build_tour(db, models, groups: int, scenes: int, hotspots: int):
+    user = models.User(username="bench", hashed_password="x")
+    db.add(user)
+    db.flush()
+    project = models.Project(name="bench", category="其他", owner_id=user.id)
+    db.add(project)
+    db.flush()
+
+    rng = random.Random(0)
+    all_scenes = []
+    for g in range(groups):
+        group = models.SceneGroup(name=f"group {g}", project_id=project.id)
+        db.add(group)
+        db.flush()
+        for i in range(scenes // groups):
+            scene = models.Scene(
+                name=f"scene {g}-{i}", image_url=f"/static/uploads/{g}_{i}.jpg",
+                group_id=group.id, sort_order=rng.randint(0, 1000),
+            )
+            db.add(scene)
+            all_scenes.append(scene)
+    db.flush()
+    for scene in all_scenes:
+        for i in range(hotspots):
+            db.add(models.Hotspot(
+                x=rng.random(), y=rng.random(), z=rng.random(), text=f"h{i}",
+                target_scene_id=rng.choice(all_scenes).id, source_scene_id=scene.id,
+                sort_order=rng.randint(0, 100),
+            ))
+    db.commit()
+    return user.id, project.id
+
+
+def legacy_read_project(db, models, schemas, project_id, owner_id):
+    db_project = db.query(models.Project).filter(
+        models.Project.id == project_id, models.Project.owner_id == owner_id
+    ).first()
+    for group in db_project.groups:
+        group.scenes.sort(key=lambda s: s.sort_order)
+        for scene in group.scenes:
+            scene.hotspots.sort(key=lambda h: h.sort_order)
+    return schemas.Project.model_validate(db_project).model_dump_json().encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--groups", type=int, default=3)
+    parser.add_argument("--scenes", type=int, default=300)
+    parser.add_argument("--hotspots", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    use_temp_workdir()
+    import database, loaders, models, schemas
+
+    database.sync_schema(database.engine)
+    db = database.SessionLocal()
+    owner_id, project_id = build_tour(db, models, args.groups, args.scenes, args.hotspots)
+
+    def legacy():
+        session = database.SessionLocal()
+        try:
+            return legacy_read_project(session, models, schemas, project_id, owner_id)
+        finally:
+            session.close()
+
+    def loader():
+        session = database.SessionLocal()
+        try:
+            return loaders.dump_json(loaders.load_project_tree(session, project_id, owner_id))
+        finally:
+            session.close()
+
+    # 两条路径的输出必须一致；prefetch (导航图的预加载建议) 只有新路径会计算，比较前去掉
+    expected, actual = json.loads(legacy()), json.loads(loader())
+    for tree in (expected, actual):
+        for group in tree["groups"]:
+            for scene in group["scenes"]:
+                scene.pop("prefetch", None)
+    assert expected == actual, "loader output differs from schemas.Project"
+
+    report = {"shape": vars(args), "results": {}}
+    for name, fn in (("legacy", legacy), ("loader", loader)):
+        with QueryCounter(database.engine) as counter:
+            fn()
+        report["results"][name] = {"queries": counter.count, **measure(fn, repeat=args.repeat)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+启动耗时：系统图标目录里有几千个图标时，旧的全量同步 (每次 listdir + 读出全部记录、逐条 add)
+与按目录清单增量同步的对比。分别测冷启动 (空库)、目录未变化、新增一个文件三种情况。
+
+    cd backend && python -m bench.bench_startup --icons 5000
+"""
+import argparse
+import json
+import os
+import time
+
+from bench.common import use_temp_workdir
+
+
+def legacy_init_system_icons(db, models):
+    """改造前 main.init_system_icons 的逻辑 (去掉打印)"""
+    system_dir = "static/icons/system"
+    disk_files = set(f for f in os.listdir(system_dir) if f.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".svg")))
+    db_icons = db.query(models.HotspotIcon).filter(models.HotspotIcon.category == "system").all()
+    db_icon_map = {icon.name: icon for icon in db_icons}
+    to_add = disk_files - set(db_icon_map)
+    to_delete = set(db_icon_map) - disk_files
+    for filename in to_add:
+        db.add(models.HotspotIcon(name=filename, url=f"/static/icons/system/{filename}", category="system", owner_id=None))
+    for filename in to_delete:
+        db.delete(db_icon_map[filename])
+    if to_add or to_delete:
+        db.commit()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--icons", type=int, default=5000)
+    args = parser.parse_args()
+
+    use_temp_workdir()
+    os.makedirs("static/icons/system", exist_ok=True)
+    for i in range(args.icons):
+        with open(f"static/icons/system/icon_{i:05d}.png", "wb") as f:
+            f.write(b"\x89PNG" + i.to_bytes(4, "big"))
+
+    start = time.perf_counter()
+    import main as app_main  # noqa: F401  导入本身不再触碰数据库
+    import_ms = round((time.perf_counter() - start) * 1000, 2)
+    import models
+    import startup
+    from database import SessionLocal, sync_schema, engine
+
+    sync_schema(engine)
+    report = {"shape": vars(args), "import_main_ms": import_ms, "results": {}}
+
+    def reset():
+        with SessionLocal() as db:
+            db.query(models.HotspotIcon).delete()
+            db.commit()
+        if os.path.exists(startup.ICON_MANIFEST):
+            os.remove(startup.ICON_MANIFEST)
+
+    def add_one(tag):
+        # 目录 mtime 的精度有限，稍等一下再改动
+        time.sleep(0.01)
+        with open(f"static/icons/system/new_{tag}.png", "wb") as f:
+            f.write(b"\x89PNG")
+
+    def run_legacy():
+        with SessionLocal() as db:
+            legacy_init_system_icons(db, models)
+
+    def run_incremental():
+        with SessionLocal() as db:
+            startup.sync_system_icons(db)
+
+    for name, fn in (("legacy", run_legacy), ("incremental", run_incremental)):
+        reset()
+        results = {"cold_ms": timed(fn), "unchanged_ms": timed(fn)}
+        add_one(name)
+        results["one_added_ms"] = timed(fn)
+        results["unchanged_again_ms"] = timed(fn)
+        report["results"][name] = results
+
+    reset()
+    report["results"]["startup_run_unchanged_ms"] = (startup.run(), timed(startup.run))[1]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+上传吞吐量：旧的同步实现 (逐个 shutil.copyfileobj、分多次 commit) 与
+新的异步分块并发写入对比。
+
+    cd backend && python -m bench.bench_upload --files 8 --size-mb 16 --clients 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+
+from bench.common import use_temp_workdir
+
+
+def add_legacy_route(app, models, get_db, get_current_user):
+    """按改造前的 create_project_full 原样实现，挂在单独的路径上用于对比"""
+    from typing import List
+    from fastapi import Depends, File, Form, UploadFile
+
+    @app.post("/bench/legacy_create_full/")
+    def legacy_create_full(
+        name: str = Form(...), category: str = Form(...), files: List[UploadFile] = File(...),
+        db=Depends(get_db), current_user=Depends(get_current_user),
+    ):
+        db_project = models.Project(name=name, category=category, owner_id=current_user.id)
+        db.add(db_project)
+        db.commit()
+        db.refresh(db_project)
+        default_group = models.SceneGroup(name="默认分组", project_id=db_project.id)
+        db.add(default_group)
+        db.commit()
+        db.refresh(default_group)
+        for i, file in enumerate(files):
+            file_path = f"static/uploads/legacy_{time.time_ns()}_{i}_{file.filename}"
+            with open(file_path, "wb") as buffer:
+                shutil.copyfileobj(file.file, buffer)
+            db.add(models.Scene(name=file.filename, image_url=f"/{file_path}", group_id=default_group.id))
+        db.commit()
+        return {"id": db_project.id}
+
+
+async def run(client, path, headers, payloads, clients):
+    queue = list(payloads)
+
+    async def worker():
+        while queue:
+            files = queue.pop()
+            r = await client.post(path, data={"name": "bench", "category": "其他"}, files=files, headers=headers)
+            r.raise_for_status()
+
+    # 上传期间持续请求一个轻量接口，观察上传是否拖慢其它请求
+    probe_ms = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            t = time.perf_counter()
+            await client.get("/projects/summary", headers=headers)
+            probe_ms.append((time.perf_counter() - t) * 1000)
+            await asyncio.sleep(0.005)
+
+    start = time.perf_counter()
+    probe_task = asyncio.create_task(probe())
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+    probe_ms.sort()
+    p95 = probe_ms[int(len(probe_ms) * 0.95)] if probe_ms else 0.0
+    return elapsed, p95
+
+
+async def main_async(args):
+    use_temp_workdir()
+    import httpx
+    import jobs
+    import main
+    import models
+    import startup
+    from auth import get_current_user
+    from database import get_db
+
+    startup.run()
+    # 只测上传本身，切片任务不派发
+    jobs.start = lambda job_id: None
+    add_legacy_route(main.app, models, get_db, get_current_user)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await client.post("/auth/register", json={"username": "bench", "password": "bench"})
+        token = (await client.post("/auth/login", json={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        size = int(args.size_mb * 1024 * 1024)
+        total_mb = args.requests * args.files * args.size_mb
+        report = {"shape": vars(args), "results": {}}
+        for name, path in (("legacy", "/bench/legacy_create_full/"), ("async", "/projects/create_full/")):
+            # 每个文件内容不同，避免内容寻址去重让新实现占便宜
+            payloads = [
+                [("files", (f"{r}_{i}.jpg", os.urandom(size), "image/jpeg")) for i in range(args.files)]
+                for r in range(args.requests)
+            ]
+            elapsed, probe_p95 = await run(client, path, headers, payloads, args.clients)
+            report["results"][name] = {
+                "seconds": round(elapsed, 3),
+                "mb_per_s": round(total_mb / elapsed, 1),
+                "probe_p95_ms": round(probe_p95, 2),
+            }
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--clients", type=int, default=4)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_temp_workdir() -> str:
+    """
+    切到临时目录后再导入后端模块：数据库和 static 都是相对路径，
+    压测数据不会写进真实的 panorama.db
+    """
+    workdir = tempfile.mkdtemp(prefix="panorama-bench-")
+    os.chdir(workdir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    return workdir
+
+
+class QueryCounter:
+    """统计 with 块内引擎执行的 SQL 条数"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def measure(fn, repeat: int = 20, warmup: int = 2) -> dict:
+    """多次执行 fn，返回毫秒级延迟统计"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+    }
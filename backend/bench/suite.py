@@ -0,0 +1,333 @@
+"""
+后端基准测试套件：用 bench.synthetic 按指定规模生成数据，在进程内驱动真实的 FastAPI 应用，
+逐个场景测延迟、吞吐量和每个请求的 SQL 条数，输出 JSON 报告。
+带上 --baseline (之前某次提交跑出的报告) 时逐项对比，超过阈值的算回归，退出码为 1。
+
+    cd backend && python -m bench.suite --shape medium --out bench-head.json
+    cd backend && python -m bench.suite --shape medium --baseline bench-main.json
+
+SQL 条数取自响应头 Server-Timing (metrics.MetricsMiddleware 按请求统计)，并发时也准确。
+后台任务 (切片、缩略图、格式变体) 不派发，只测接口本身；登录耗时取决于 BCRYPT_ROUNDS。
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from bench import synthetic
+from bench.common import BACKEND_DIR, use_temp_workdir
+
+# 对比基线时的默认阈值：延迟允许变慢的比例 + 绝对余量 (小于 1 ms 的接口噪声占比大)，SQL 条数不允许增加
+LATENCY_TOLERANCE = 0.25
+LATENCY_SLACK_MS = 1.0
+QUERY_TOLERANCE = 0
+
+_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+class Scenario:
+    """一类请求；build(i) 返回第 i 次请求的 (method, url, httpx 参数)，prepare 在计时之外执行"""
+
+    def __init__(self, name, build, weight: float = 1.0, prepare=None, upload_bytes: int = 0):
+        self.name = name
+        self.build = build
+        self.weight = weight
+        self.prepare = prepare
+        self.upload_bytes = upload_bytes
+
+
+def percentile(samples, q):
+    return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else 0.0
+
+
+def summarize(latencies, queries, statuses, elapsed: float, upload_bytes: int) -> dict:
+    latencies = sorted(latencies)
+    n = len(latencies)
+    result = {
+        "requests": n,
+        "errors": sum(count for status, count in statuses.items() if int(status) >= 400),
+        "statuses": statuses,
+        "p50_ms": round(percentile(latencies, 0.5), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "max_ms": round(latencies[-1], 3) if n else 0.0,
+        "mean_ms": round(statistics.fmean(latencies), 3) if n else 0.0,
+        "rps": round(n / elapsed, 1) if elapsed else 0.0,
+        "queries_median": statistics.median(queries) if queries else None,
+        "queries_max": max(queries) if queries else None,
+    }
+    if upload_bytes:
+        result["mb_per_s"] = round(upload_bytes * n / elapsed / 1024 / 1024, 2) if elapsed else 0.0
+    return result
+
+
+async def run_scenario(client, headers, scenario: Scenario, repeat: int, concurrency: int, warmup: int) -> dict:
+    async def one(i):
+        if scenario.prepare:
+            scenario.prepare(i)
+        method, url, kwargs = scenario.build(i)
+        start = time.perf_counter()
+        r = await client.request(method, url, headers={**headers, **kwargs.pop("headers", {})}, **kwargs)
+        return (time.perf_counter() - start) * 1000, r
+
+    for i in range(warmup):
+        await one(-1 - i)
+
+    latencies, queries, statuses = [], [], {}
+    counter = iter(range(repeat))
+
+    async def worker():
+        for i in counter:
+            ms, r = await one(i)
+            latencies.append(ms)
+            status = str(r.status_code)
+            statuses[status] = statuses.get(status, 0) + 1
+            m = _QUERIES_RE.search(r.headers.get("server-timing", ""))
+            if m:
+                queries.append(int(m.group(1)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, queries, statuses, time.perf_counter() - start, scenario.upload_bytes)
+
+
+def build_scenarios(fixture: dict, shape: dict, seed: int):
+    import versioning
+
+    rng = random.Random(seed)
+    tours = fixture["tours"]
+    # 读取用第一个作品，修改集中在最后一个作品上，避免读场景的缓存被写场景打乱
+    read_tour, write_tour = tours[0], tours[-1]
+    read_id = read_tour["id"]
+    group = write_tour["groups"][0]
+    scene_ids = [s["id"] for s in group["scenes"]]
+    scene = group["scenes"][0]
+    hotspot_ids = [h for s in group["scenes"] for h in s["hotspot_ids"]]
+    etag = {}
+
+    def shuffled(ids):
+        ids = ids[:]
+        rng.shuffle(ids)
+        return ids
+
+    def remember_etag(i):
+        if "value" not in etag:
+            etag["value"] = versioning.project_etag(read_id, *_project_stamp(read_id))
+
+    def new_hotspot(i):
+        return ("POST", "/hotspots/", {"json": {
+            "x": rng.uniform(-500, 500), "y": 0.0, "z": rng.uniform(-500, 500), "text": f"new {i}",
+            "type": "scene", "target_scene_id": rng.choice(scene_ids), "source_scene_id": scene["id"],
+        }})
+
+    def update_hotspot(i):
+        return ("PUT", f"/hotspots/{rng.choice(hotspot_ids)}", {"json": {"x": rng.uniform(-500, 500), "scale": 1.5}})
+
+    # 每次上传的内容都不同，避免内容寻址去重让上传直接命中已有文件
+    pano = synthetic.panorama_jpeg(rng, shape["pano_width"])
+    icon = synthetic.icon_png(rng)
+
+    def upload_scene(i):
+        data = pano + i.to_bytes(8, "big", signed=True)
+        return ("POST", f"/groups/{group['id']}/upload_scene", {"files": [("files", (f"upload_{i}.jpg", data, "image/jpeg"))]})
+
+    def upload_icon(i):
+        data = icon + i.to_bytes(8, "big", signed=True)
+        return ("POST", "/icons/", {"files": [("file", (f"upload_{i}.png", data, "image/png"))]})
+
+    password = {"username": fixture["username"], "password": fixture["password"]}
+    return [
+        # 登录主要是 bcrypt 的耗时，次数少一些
+        Scenario("login", lambda i: ("POST", "/auth/login", {"json": password}), weight=0.2),
+        Scenario("list_projects", lambda i: ("GET", "/projects/", {})),
+        Scenario("project_summary", lambda i: ("GET", "/projects/summary", {})),
+        Scenario("read_project", lambda i: ("GET", f"/projects/{read_id}", {})),
+        Scenario("read_project_cold", lambda i: ("GET", f"/projects/{read_id}", {}),
+                 prepare=lambda i: versioning.project_cache.clear()),
+        Scenario("read_project_304", lambda i: ("GET", f"/projects/{read_id}", {"headers": {"If-None-Match": etag["value"]}}),
+                 prepare=remember_etag),
+        Scenario("create_hotspot", new_hotspot),
+        Scenario("update_hotspot", update_hotspot),
+        Scenario("reorder_scenes", lambda i: ("POST", f"/groups/{group['id']}/reorder_scenes", {"json": shuffled(scene_ids)})),
+        Scenario("reorder_hotspots", lambda i: ("POST", f"/scenes/{scene['id']}/reorder_hotspots", {"json": shuffled(scene["hotspot_ids"])})),
+        Scenario("upload_scene", upload_scene, weight=0.5, upload_bytes=len(pano) + 8),
+        Scenario("upload_icon", upload_icon, weight=0.5, upload_bytes=len(icon) + 8),
+    ]
+
+
+def _project_stamp(project_id: int):
+    """(salt, version)，与 read_project 生成 ETag 用的一致"""
+    import models
+    import versioning
+    from database import SessionLocal
+
+    with SessionLocal() as db:
+        project = db.get(models.Project, project_id)
+        return versioning.project_salt(project.created_at), project.version
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    import auth
+    return {
+        "commit": commit,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sqlite": sqlite3.sqlite_version,
+        "bcrypt_rounds": auth.BCRYPT_ROUNDS,
+    }
+
+
+def compare(report: dict, baseline: dict, latency_tolerance: float, slack_ms: float, query_tolerance: int):
+    """返回超出阈值的指标列表；两边都有的场景才比较"""
+    regressions = []
+    for name, current in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            limit = base[metric] * (1 + latency_tolerance) + slack_ms
+            if current[metric] > limit:
+                regressions.append({"scenario": name, "metric": metric, "baseline": base[metric],
+                                    "current": current[metric], "limit": round(limit, 3)})
+        if current["queries_max"] is not None and base.get("queries_max") is not None:
+            limit = base["queries_max"] + query_tolerance
+            if current["queries_max"] > limit:
+                regressions.append({"scenario": name, "metric": "queries_max", "baseline": base["queries_max"],
+                                    "current": current["queries_max"], "limit": limit})
+        if current["errors"] > base.get("errors", 0):
+            regressions.append({"scenario": name, "metric": "errors", "baseline": base.get("errors", 0),
+                                "current": current["errors"], "limit": base.get("errors", 0)})
+    return regressions
+
+
+def print_table(report: dict, baseline=None):
+    """人看的摘要，写到 stderr，stdout 留给 JSON"""
+    out = sys.stderr
+    out.write(f"{'scenario':<20}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>10}{'queries':>9}")
+    out.write(f"{'base p50':>10}{'change':>9}\n" if baseline else "\n")
+    for name, r in report["results"].items():
+        out.write(f"{name:<20}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['rps']:>10.1f}{str(r['queries_max']):>9}")
+        base = (baseline or {}).get("results", {}).get(name)
+        if base and base["p50_ms"]:
+            out.write(f"{base['p50_ms']:>10.2f}{(r['p50_ms'] / base['p50_ms'] - 1) * 100:>+8.0f}%")
+        out.write("\n")
+
+
+async def main_async(args, shape: dict) -> dict:
+    use_temp_workdir()
+    import httpx
+    import hashing
+    import jobs
+    import main
+    import startup
+    from database import SessionLocal
+
+    startup.run()
+    jobs.start = lambda job_id: None
+
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        fixture = synthetic.generate(db, shape, args.seed)
+    report = {
+        "environment": environment(),
+        "shape": shape,
+        "seed": args.seed,
+        "run": {"repeat": args.repeat, "concurrency": args.concurrency, "warmup": args.warmup},
+        "fixture": {**fixture["counts"], "generate_s": round(time.perf_counter() - started, 2)},
+        "results": {},
+    }
+
+    scenarios = build_scenarios(fixture, shape, args.seed)
+    only = set(args.only.split(",")) if args.only else None
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        token = (await client.post("/auth/login", json={"username": fixture["username"], "password": fixture["password"]})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for scenario in scenarios:
+            if only and scenario.name not in only:
+                continue
+            repeat = max(1, int(args.repeat * scenario.weight))
+            report["results"][scenario.name] = await run_scenario(
+                client, headers, scenario, repeat, args.concurrency, args.warmup,
+            )
+    hashing.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", choices=sorted(synthetic.SHAPES), default="small")
+    for key in ("users", "projects", "groups", "scenes", "hotspots", "icons", "panoramas", "pano_width"):
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, help=f"覆盖规模里的 {key}")
+    parser.add_argument("--repeat", type=int, default=50, help="每个场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="只跑这些场景，逗号分隔")
+    parser.add_argument("--out", help="报告写到文件，默认输出到 stdout")
+    parser.add_argument("--baseline", help="用于对比的基线报告")
+    parser.add_argument("--latency-tolerance", type=float, default=LATENCY_TOLERANCE)
+    parser.add_argument("--latency-slack-ms", type=float, default=LATENCY_SLACK_MS)
+    parser.add_argument("--query-tolerance", type=int, default=QUERY_TOLERANCE)
+    args = parser.parse_args()
+
+    shape = dict(synthetic.SHAPES[args.shape])
+    for key in shape:
+        if getattr(args, key) is not None:
+            shape[key] = getattr(args, key)
+
+    baseline = None
+    if args.baseline:
+        with open(os.path.abspath(args.baseline), encoding="utf-8") as f:
+            baseline = json.load(f)
+    out_path = os.path.abspath(args.out) if args.out else None
+
+    # 启动和后端各处的 print 改到 stderr，stdout 只有 JSON 报告
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(main_async(args, shape))
+
+    exit_code = 0
+    if baseline is not None:
+        if baseline.get("shape") != shape or baseline.get("run", {}).get("concurrency") != args.concurrency:
+            sys.stderr.write("基线的数据规模或并发数与本次不同，结果不可比\n")
+            exit_code = 2
+        else:
+            report["baseline"] = {"commit": baseline.get("environment", {}).get("commit"), "path": args.baseline}
+            report["regressions"] = compare(
+                report, baseline, args.latency_tolerance, args.latency_slack_ms, args.query_tolerance,
+            )
+            exit_code = 1 if report["regressions"] else 0
+
+    print_table(report, baseline if exit_code != 2 else None)
+    for r in report.get("regressions", []):
+        sys.stderr.write(f"回归: {r['scenario']} {r['metric']} {r['baseline']} -> {r['current']} (上限 {r['limit']})\n")
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+合成压测数据：按给定规模 (用户 × 作品 × 分组 × 场景 × 热点、图标数、全景图尺寸)
+直接写入当前工作目录下的数据库和 static，不经过接口。同一个 seed 生成的数据完全相同。
+调用前先 use_temp_workdir()，避免写进真实的 panorama.db。
+"""
+import io
+import random
+
+import numpy as np
+from PIL import Image
+from sqlalchemy import insert
+
+PASSWORD = "bench"
+
+# 每个用户的作品数、每个作品的分组数、每个分组的场景数、每个场景的热点数
+SHAPES = {
+    "small": {"users": 1, "projects": 3, "groups": 2, "scenes": 5, "hotspots": 5,
+              "icons": 4, "panoramas": 2, "pano_width": 1024},
+    "medium": {"users": 3, "projects": 8, "groups": 4, "scenes": 10, "hotspots": 8,
+               "icons": 12, "panoramas": 4, "pano_width": 2048},
+    "large": {"users": 4, "projects": 10, "groups": 6, "scenes": 20, "hotspots": 12,
+              "icons": 32, "panoramas": 6, "pano_width": 4096},
+}
+
+HOTSPOT_TYPES = ("scene", "scene", "scene", "text", "image", "link")
+
+
+def panorama_jpeg(rng: random.Random, width: int, quality: int = 85) -> bytes:
+    """2:1 的等距柱状图：平滑的色带加噪声，压缩率接近真实照片"""
+    height = width // 2
+    gen = np.random.default_rng(rng.getrandbits(32))
+    ys = np.linspace(0, 1, height)[:, None, None]
+    xs = np.linspace(0, 2 * np.pi, width)[None, :, None]
+    phase = gen.uniform(0, 2 * np.pi, 3)
+    base = 128 + 80 * np.sin(xs + phase) * np.cos(ys * np.pi)
+    noise = gen.normal(0, 12, (height, width, 3))
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def icon_png(rng: random.Random, size: int = 64) -> bytes:
+    color = tuple(rng.randrange(256) for _ in range(3)) + (255,)
+    im = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    im.paste(color, (size // 4, size // 4, size * 3 // 4, size * 3 // 4))
+    buf = io.BytesIO()
+    im.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _insert(db, model, rows):
+    """批量插入并按顺序返回新记录的 id"""
+    if not rows:
+        return []
+    return list(db.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), rows))
+
+
+def generate(db, shape: dict, seed: int = 0) -> dict:
+    """
+    生成 shape 描述的全部数据，返回压测要用到的 id：
+    第一个用户 (bench) 的作品树，以及生成的全景图、图标地址
+    """
+    import auth
+    import models
+    import placeholders
+    import storage
+
+    rng = random.Random(seed)
+    hashed = auth.get_password_hash(PASSWORD)
+
+    # 全景图只生成几张，所有场景轮流引用；占位图随全景图一起算好，作品数据的体积与真实情况一致
+    panoramas = []
+    for _ in range(shape["panoramas"]):
+        data = panorama_jpeg(rng, shape["pano_width"])
+        blob = storage.save_bytes(data, ".jpg")
+        with Image.open(io.BytesIO(data)) as im:
+            blurhash, preview = placeholders.from_panorama(np.asarray(im.convert("RGB")))
+        panoramas.append({"url": blob.url, "blurhash": blurhash, "preview": preview})
+
+    user_ids = _insert(db, models.User, [
+        {"username": "bench" if u == 0 else f"bench{u}", "hashed_password": hashed}
+        for u in range(shape["users"])
+    ])
+
+    icon_urls = {}
+    for user_id in user_ids:
+        urls = [storage.save_bytes(icon_png(rng), ".png").url for _ in range(shape["icons"])]
+        _insert(db, models.HotspotIcon, [
+            {"name": f"icon_{i}.png", "url": url, "category": "custom", "owner_id": user_id}
+            for i, url in enumerate(urls)
+        ])
+        icon_urls[user_id] = urls
+
+    tours = []
+    counts = {"users": len(user_ids), "projects": 0, "groups": 0, "scenes": 0, "hotspots": 0}
+    for user_id in user_ids:
+        project_ids = _insert(db, models.Project, [
+            {"name": f"tour {p}", "category": "其他", "owner_id": user_id, "cover_url": panoramas[0]["url"]}
+            for p in range(shape["projects"])
+        ])
+        for project_id in project_ids:
+            tour = {"id": project_id, "groups": []}
+            group_ids = _insert(db, models.SceneGroup, [
+                {"name": f"group {g}", "project_id": project_id}
+                for g in range(shape["groups"])
+            ])
+            scene_rows = []
+            for group_id in group_ids:
+                for s in range(shape["scenes"]):
+                    pano = rng.choice(panoramas)
+                    scene_rows.append({
+                        "name": f"scene {s}", "group_id": group_id, "sort_order": s,
+                        "image_url": pano["url"], "blurhash": pano["blurhash"], "preview": pano["preview"],
+                        "initial_heading": rng.uniform(-180, 180),
+                    })
+            scene_ids = _insert(db, models.Scene, scene_rows)
+
+            hotspot_rows = []
+            for scene_id in scene_ids:
+                for h in range(shape["hotspots"]):
+                    kind = rng.choice(HOTSPOT_TYPES)
+                    custom_icon = rng.random() < 0.5 and icon_urls[user_id]
+                    hotspot_rows.append({
+                        "x": rng.uniform(-500, 500), "y": rng.uniform(-100, 100), "z": rng.uniform(-500, 500),
+                        "text": f"hotspot {h}", "type": kind, "sort_order": h, "source_scene_id": scene_id,
+                        "target_scene_id": rng.choice(scene_ids) if kind == "scene" else None,
+                        "content": rng.choice(icon_urls[user_id]) if kind == "image" and icon_urls[user_id] else None,
+                        "icon_type": "custom" if custom_icon else "system",
+                        "icon_url": rng.choice(custom_icon) if custom_icon else "arrow_move",
+                    })
+            hotspot_ids = _insert(db, models.Hotspot, hotspot_rows)
+
+            per_scene = shape["hotspots"]
+            per_group = shape["scenes"]
+            for g, group_id in enumerate(group_ids):
+                scenes = []
+                for i in range(g * per_group, (g + 1) * per_group):
+                    scenes.append({"id": scene_ids[i], "hotspot_ids": hotspot_ids[i * per_scene:(i + 1) * per_scene]})
+                tour["groups"].append({"id": group_id, "scenes": scenes})
+            if user_id == user_ids[0]:
+                tours.append(tour)
+            counts["projects"] += 1
+            counts["groups"] += len(group_ids)
+            counts["scenes"] += len(scene_ids)
+            counts["hotspots"] += len(hotspot_ids)
+    db.commit()
+
+    return {
+        "username": "bench",
+        "password": PASSWORD,
+        "counts": counts,
+        "tours": tours,
+        "panoramas": [p["url"] for p in panoramas],
+        "icons": icon_urls[user_ids[0]] if user_ids else [],
+    }
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    按字节数限制容量的 LRU 缓存，超出上限时淘汰最久未使用的条目。
+    同步接口跑在线程池里，读写都加锁
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: int):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if size > self.max_bytes:
+                return
+            self._data[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data), "bytes": self.size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            }
+
+
+class TTLCache:
+    """按条目数限制容量、每个条目单独过期的缓存，满了淘汰最久未使用的"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, expires_at: float):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate):
+        """删除 predicate(value) 为真的条目"""
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(v)]:
+                del self._data[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._data), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,121 @@
+import asyncio
+import os
+
+from sqlalchemy import func, insert, select
+from starlette.concurrency import run_in_threadpool
+
+import loaders
+import metrics
+import models
+from database import SessionLocal
+
+# 项目变更日志：修改接口在 bump_version 的同一个事务里记下改了哪些对象 (记到新的版本号下)。
+# 编辑器带上自己手里的版本号拉取之后的变更，只更新改动的节点，不再整棵重新下载；
+# 事件流按版本号轮询数据库，多个 worker 进程之间也能互相看到
+ENTITIES = ("project", "group", "scene", "hotspot")
+# 实体 -> 响应里的键
+_KEYS = {"group": "groups", "scene": "scenes", "hotspot": "hotspots"}
+RETAIN_VERSIONS = int(os.getenv("CHANGE_LOG_VERSIONS", "500"))  # 每个项目保留最近多少个版本的日志，由 sweeper 清理
+POLL_SECONDS = float(os.getenv("CHANGE_POLL_S", "1"))
+KEEPALIVE_SECONDS = 15
+
+
+def record(db, project_id, entity: str, ids, deleted: bool = False):
+    """
+    在 bump_version 之后调用，随调用方的 commit 一起生效。
+    新建的对象要先 flush 拿到 id；级联删除的下级对象不用单独记录
+    """
+    ids = [i for i in dict.fromkeys(ids) if i is not None]
+    if project_id is None or not ids:
+        return
+    version = select(models.Project.version).where(models.Project.id == project_id).scalar_subquery()
+    db.execute(insert(models.ProjectChange).values(version=version), [
+        {"project_id": project_id, "entity": entity, "entity_id": i, "deleted": deleted} for i in ids
+    ])
+
+
+def record_hotspots(db, hotspot_projects: dict, deleted: bool = False):
+    """{hotspot_id: project_id}，热点可能分属多个项目"""
+    by_project = {}
+    for hotspot_id, project_id in hotspot_projects.items():
+        by_project.setdefault(project_id, []).append(hotspot_id)
+    for project_id, ids in by_project.items():
+        record(db, project_id, "hotspot", ids, deleted)
+
+
+def hotspots_targeting(db, scene_ids) -> list:
+    """
+    指向这些场景的跳转热点：场景删除后数据库把它们的 target_scene_id 置空，
+    要在删除之前查出来，之后按修改记录
+    """
+    if not scene_ids:
+        return []
+    return list(db.scalars(select(models.Hotspot.id).where(models.Hotspot.target_scene_id.in_(scene_ids))))
+
+
+def delta(db, project_id: int, since: int, version: int) -> dict:
+    """
+    since 之后到 version 为止的变更：改动过的对象取当前状态，删除的只给 id。
+    since 早于日志保留范围 (或者客户端的版本比服务端还新) 时返回 reset，客户端应整体重新加载
+    """
+    PC = models.ProjectChange
+    result = {"project_id": project_id, "since": since, "version": version, "reset": False}
+    if since == version:
+        return {**result, "project": None, **{key: [] for key in _KEYS.values()}, "deleted": {key: [] for key in _KEYS.values()}}
+
+    oldest = db.scalar(select(func.min(PC.version)).where(PC.project_id == project_id))
+    if since > version or oldest is None or since < oldest - 1:
+        return {**result, "reset": True}
+
+    # 同一个对象只看最后一次变更
+    latest = {}
+    for entity, entity_id, deleted in db.execute(
+        select(PC.entity, PC.entity_id, PC.deleted)
+        .where(PC.project_id == project_id, PC.version > since, PC.version <= version)
+        .order_by(PC.id)
+    ):
+        latest[(entity, entity_id)] = deleted
+    changed = {e: [i for (kind, i), deleted in latest.items() if kind == e and not deleted] for e in ENTITIES}
+    removed = {e: {i for (kind, i), deleted in latest.items() if kind == e and deleted} for e in _KEYS}
+
+    data = loaders.load_changed(
+        db, project_id, bool(changed["project"]), changed["group"], changed["scene"], changed["hotspot"],
+    )
+    # 记为修改、但之后被级联删除的对象 (例如所在分组被删) 也按删除处理
+    for entity, key in _KEYS.items():
+        found = {item["id"] for item in data[key]}
+        removed[entity].update(i for i in changed[entity] if i not in found)
+    return {**result, **data, "deleted": {_KEYS[e]: sorted(ids) for e, ids in removed.items()}}
+
+
+def _poll(project_id: int, since: int):
+    """事件流的一次轮询：版本号没变返回 None，项目已被删除返回 False"""
+    with metrics.untracked(), SessionLocal() as db:
+        version = db.scalar(select(models.Project.version).where(models.Project.id == project_id))
+        if version is None:
+            return False
+        if version == since:
+            return None
+        return delta(db, project_id, since, version)
+
+
+async def stream(request, project_id: int, since: int):
+    """
+    Server-Sent Events：有新版本时推送一条 changes 事件 (id 为版本号，断线重连时浏览器
+    会带上 Last-Event-ID)，空闲时定期发注释行保活
+    """
+    idle = 0.0
+    while not await request.is_disconnected():
+        payload = await run_in_threadpool(_poll, project_id, since)
+        if payload is False:
+            yield "event: deleted\ndata: {}\n\n"
+            return
+        if payload is not None:
+            since = payload["version"]
+            idle = 0.0
+            yield f"id: {since}\nevent: changes\ndata: {loaders.dump_json(payload).decode()}\n\n"
+        elif idle >= KEEPALIVE_SECONDS:
+            idle = 0.0
+            yield ": keepalive\n\n"
+        await asyncio.sleep(POLL_SECONDS)
+        idle += POLL_SECONDS
@@ -1,14 +1,67 @@
-from sqlalchemy import create_engine
+import os
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, func, inspect, text
+from sqlalchemy.schema import CreateTable
+
+import metrics
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-# 数据库文件会生成在当前目录下，叫 panorama.db
-SQLALCHEMY_DATABASE_URL = "sqlite:///./panorama.db"
+# 默认使用当前目录下的 panorama.db；生产环境可通过 DATABASE_URL 换成 PostgreSQL/MySQL 等
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./panorama.db")
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+# 连接池配置 (SQLite 文件库同样使用 QueuePool)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite 调优：WAL 让读写互不阻塞，busy_timeout 让写锁冲突时等待而不是直接报 "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_MB", "256")) * 1024 * 1024,
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000")),
+    "temp_store": "MEMORY",
+    # SQLite 默认不检查外键，ON DELETE CASCADE / SET NULL 也就不生效
+    "foreign_keys": "ON",
+}
+
+
+def _create_engine(url: str):
+    if url.startswith("sqlite"):
+        # check_same_thread=False：连接会在 FastAPI 线程池的不同线程间复用
+        kwargs = {"connect_args": {"check_same_thread": False}}
+        if ":memory:" not in url and url != "sqlite://":
+            kwargs.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
+        return create_engine(url, **kwargs)
+    return create_engine(
+        url,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+metrics.instrument_engine(engine)
+
+
+@event.listens_for(engine, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not IS_SQLITE:
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 
-# connect_args 是 SQLite 特有的配置，防止多线程报错
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -19,4 +72,76 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# create_all 不会给已存在的表补列、补索引，这里做最小的增量迁移
+def sync_schema(bind=engine):
+    Base.metadata.create_all(bind=bind)
+    insp = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(bind.dialect)}"
+                if col.server_default is not None:
+                    ddl += f" DEFAULT {col.server_default.arg}"
+                conn.execute(text(ddl))
+    with bind.begin() as conn:
+        # 作品列表按 (updated_at, id) 做游标分页，NULL 会让翻页漏掉或重复；早期数据的空值用创建时间补上
+        projects = Base.metadata.tables["projects"]
+        conn.execute(
+            projects.update()
+            .where(projects.c.updated_at.is_(None))
+            .values(updated_at=func.coalesce(projects.c.created_at, datetime.now()))
+        )
+    if bind.dialect.name == "sqlite":
+        _sync_sqlite_foreign_keys(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def _foreign_key_actions(foreign_keys):
+    return sorted(
+        (tuple(fk["constrained_columns"]), fk["referred_table"], ((fk.get("options") or {}).get("ondelete") or "").upper())
+        for fk in foreign_keys
+    )
+
+
+def _sync_sqlite_foreign_keys(bind):
+    """
+    SQLite 不能修改已有表的外键约束：ON DELETE 与模型不一致的表按官方推荐的步骤重建
+    (关闭外键检查 -> 建新表 -> 拷数据 -> 删旧表 -> 改名)，索引随后由 sync_schema 补上。
+    已经存在的孤儿数据照搬过去，由 sweeper 清理
+    """
+    insp = inspect(bind)
+    stale = [
+        table for table in Base.metadata.sorted_tables
+        if _foreign_key_actions(insp.get_foreign_keys(table.name)) != _foreign_key_actions(
+            {"constrained_columns": [e.parent.name for e in fk.elements], "referred_table": fk.referred_table.name,
+             "options": {"ondelete": fk.ondelete}}
+            for fk in table.foreign_key_constraints
+        )
+    ]
+    if not stale:
+        return
+    with bind.connect() as conn:
+        # 必须在事务外切换，pysqlite 不会为 PRAGMA 开启事务
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        try:
+            for table in stale:
+                tmp_name = f"_rebuild_{table.name}"
+                ddl = str(CreateTable(table).compile(bind)).strip()
+                columns = ", ".join(c.name for c in table.columns)
+                conn.exec_driver_sql(ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {tmp_name} ", 1))
+                conn.exec_driver_sql(f"INSERT INTO {tmp_name} ({columns}) SELECT {columns} FROM {table.name}")
+                conn.exec_driver_sql(f"DROP TABLE {table.name}")
+                conn.exec_driver_sql(f"ALTER TABLE {tmp_name} RENAME TO {table.name}")
+                print(f"已重建数据表 {table.name} 的外键约束")
+            conn.commit()
+        finally:
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+            conn.commit()
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+
+import auth
+
+# bcrypt 计算放到独立的小进程池里，登录高峰不会占满处理其它请求的线程池
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+# 排队 + 执行中的请求超过这个数直接返回 503，避免无限排队
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "64"))
+
+_executor = None
+_pending = 0
+stats = {
+    "completed": 0,
+    "rejected": 0,
+    "wait_ms_total": 0.0,
+    "wait_ms_max": 0.0,
+    "run_ms_total": 0.0,
+}
+
+
+def _timed(fn, *args):
+    started = time.time()
+    result = fn(*args)
+    return started, time.time(), result
+
+
+def _hash(password: str) -> str:
+    return auth.pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str):
+    # cost 变化时 passlib 会顺便返回新哈希
+    return auth.pwd_context.verify_and_update(password, hashed)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _executor
+
+
+def _discard_executor(broken: ProcessPoolExecutor):
+    """子进程被杀掉 (OOM 等) 后进程池不可用；并发的请求可能同时发现，只丢弃还在用的那个"""
+    global _executor
+    if _executor is broken:
+        _executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _submit(fn, *args):
+    executor = _get_executor()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, _timed, fn, *args)
+    except BrokenProcessPool:
+        # 哈希计算没有副作用，换一个新进程池重算一次
+        _discard_executor(executor)
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), _timed, fn, *args)
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= HASH_MAX_PENDING:
+        stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Too many login attempts, retry shortly", headers={"Retry-After": "1"})
+    _pending += 1
+    submitted = time.time()
+    try:
+        started, finished, result = await _submit(fn, *args)
+    finally:
+        _pending -= 1
+    wait_ms = (started - submitted) * 1000
+    stats["completed"] += 1
+    stats["wait_ms_total"] += wait_ms
+    stats["wait_ms_max"] = max(stats["wait_ms_max"], wait_ms)
+    stats["run_ms_total"] += (finished - started) * 1000
+    return result
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def verify_and_update(password: str, hashed: str):
+    """返回 (是否正确, 新哈希或 None)"""
+    return await _run(_verify_and_update, password, hashed)
+
+
+def snapshot() -> dict:
+    completed = stats["completed"] or 1
+    return {
+        "workers": HASH_WORKERS,
+        "max_pending": HASH_MAX_PENDING,
+        "pending": _pending,
+        "completed": stats["completed"],
+        "rejected": stats["rejected"],
+        "wait_ms_avg": round(stats["wait_ms_total"] / completed, 2),
+        "wait_ms_max": round(stats["wait_ms_max"], 2),
+        "run_ms_avg": round(stats["run_ms_total"] / completed, 2),
+    }
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,91 @@
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, select, update
+
+import changes
+import models
+import versioning
+
+
+def _owned_scene_projects(db, scene_ids, owner_id):
+    """scene_id -> project_id，只包含属于 owner_id 的场景"""
+    if not scene_ids:
+        return {}
+    rows = db.execute(
+        select(models.Scene.id, models.SceneGroup.project_id)
+        .join(models.SceneGroup, models.Scene.group_id == models.SceneGroup.id)
+        .join(models.Project, models.SceneGroup.project_id == models.Project.id)
+        .where(models.Scene.id.in_(scene_ids), models.Project.owner_id == owner_id)
+    )
+    return dict(rows.all())
+
+
+def _owned_hotspot_projects(db, hotspot_ids, owner_id):
+    """hotspot_id -> project_id，只包含属于 owner_id 的热点"""
+    if not hotspot_ids:
+        return {}
+    rows = db.execute(
+        select(models.Hotspot.id, models.SceneGroup.project_id)
+        .join(models.Scene, models.Hotspot.source_scene_id == models.Scene.id)
+        .join(models.SceneGroup, models.Scene.group_id == models.SceneGroup.id)
+        .join(models.Project, models.SceneGroup.project_id == models.Project.id)
+        .where(models.Hotspot.id.in_(hotspot_ids), models.Project.owner_id == owner_id)
+    )
+    return dict(rows.all())
+
+
+def apply_batch(db, batch, owner_id: int):
+    """
+    先校验归属，再依次批量删除、批量更新、批量插入，最后统一 bump 版本号。
+    不提交事务，由调用方 commit；任何一步失败整批都不会生效
+    """
+    update_ids = [u.id for u in batch.update]
+    delete_ids = list(dict.fromkeys(batch.delete))
+    if len(set(update_ids)) != len(update_ids):
+        raise HTTPException(status_code=400, detail="Duplicate hotspot id in update")
+    if set(update_ids) & set(delete_ids):
+        raise HTTPException(status_code=400, detail="Hotspot both updated and deleted")
+
+    scene_projects = _owned_scene_projects(db, {c.source_scene_id for c in batch.create}, owner_id)
+    missing_scenes = {c.source_scene_id for c in batch.create} - scene_projects.keys()
+    if missing_scenes:
+        raise HTTPException(status_code=404, detail=f"Scene not found: {sorted(missing_scenes)}")
+    hotspot_projects = _owned_hotspot_projects(db, update_ids + delete_ids, owner_id)
+    missing_hotspots = set(update_ids + delete_ids) - hotspot_projects.keys()
+    if missing_hotspots:
+        raise HTTPException(status_code=404, detail=f"Hotspot not found: {sorted(missing_hotspots)}")
+
+    if delete_ids:
+        db.execute(delete(models.Hotspot).where(models.Hotspot.id.in_(delete_ids)), execution_options={"synchronize_session": False})
+
+    if batch.update:
+        # 按主键批量 UPDATE，字段组合相同的行合并成一次 executemany
+        db.execute(update(models.Hotspot), [u.model_dump(exclude_unset=True) | {"id": u.id} for u in batch.update])
+
+    created_ids = []
+    if batch.create:
+        # 多行 INSERT ... RETURNING 一次拿回新 id。RETURNING 的行序没有保证，但 SQLite 在一条多行 INSERT 里
+        # 按 VALUES 的顺序逐行分配递增的 rowid (insertmanyvalues 分页时各页也是依次执行)，排序后即与 create 一一对应。
+        # 不用 sort_by_parameter_order：SQLite 上它会退化成逐行 INSERT
+        created_ids = sorted(db.scalars(
+            insert(models.Hotspot).returning(models.Hotspot.id),
+            [c.model_dump() for c in batch.create],
+        ))
+
+    versioning.bump_version(db, *(set(scene_projects.values()) | set(hotspot_projects.values())))
+    changes.record_hotspots(db, {i: hotspot_projects[i] for i in delete_ids}, deleted=True)
+    changes.record_hotspots(db, {i: hotspot_projects[i] for i in update_ids})
+    changes.record_hotspots(db, {i: scene_projects[c.source_scene_id] for i, c in zip(created_ids, batch.create)})
+    db.flush()
+
+    rows = {}
+    ids = created_ids + update_ids
+    if ids:
+        rows = {h.id: h for h in db.scalars(
+            select(models.Hotspot).where(models.Hotspot.id.in_(ids)).execution_options(populate_existing=True)
+        )}
+    return {
+        "created_ids": created_ids,
+        "updated_ids": update_ids,
+        "deleted_ids": delete_ids,
+        "hotspots": [rows[i] for i in ids],
+    }
@@ -0,0 +1,230 @@
+import itertools
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from sqlalchemy import update
+
+import changes
+import models
+import placeholders
+import renderer
+import sprites
+import storage
+import tiles
+import variants
+import versioning
+from database import SessionLocal, engine
+
+# 媒体处理是 CPU 密集型，放到独立进程里，不占用请求线程
+MAX_WORKERS = int(os.getenv("JOB_WORKERS", "0")) or os.cpu_count() or 1
+
+HANDLERS = {}
+_executor = None
+
+
+def handler(kind: str):
+    """
+    注册任务处理函数: fn(db, report, **params) -> 可 JSON 序列化的结果。
+    report(done, total) 单独提交进度，调用时 db 上不能有未提交的写入
+    """
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def _worker_init():
+    # fork 出来的子进程不能复用父进程连接池里的连接
+    engine.dispose(close=False)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=_worker_init)
+    return _executor
+
+
+def create_job(db, kind: str, **params) -> models.Job:
+    """在当前事务里登记任务，调用方 commit 之后再 start"""
+    job = models.Job(kind=kind, params=json.dumps(params))
+    db.add(job)
+    db.flush()
+    return job
+
+
+def start(job_id: int):
+    global _executor
+    try:
+        _get_executor().submit(run_job, job_id)
+    except BrokenProcessPool:
+        # 子进程被杀掉后进程池不可用，重建一次
+        _executor = None
+        _get_executor().submit(run_job, job_id)
+
+
+def recover_jobs():
+    """
+    启动时把上次退出时还没开始的任务重新派发。
+    进程池只在这个进程里，此时仍是 running 的任务所在的进程已经不在了 (被杀、重启)，改回 pending 一起重跑
+    """
+    db = SessionLocal()
+    try:
+        db.execute(update(models.Job).where(models.Job.status == "running").values(status="pending", progress=0.0))
+        db.commit()
+        ids = [j.id for j in db.query(models.Job.id).filter(models.Job.status == "pending").all()]
+    finally:
+        db.close()
+    for job_id in ids:
+        start(job_id)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def run_job(job_id: int):
+    """在工作进程里执行，状态和进度都写回任务表"""
+    db = SessionLocal()
+    try:
+        # 原子地认领任务，多个 worker 同时恢复任务时只有一个能执行
+        claimed = db.execute(
+            update(models.Job)
+            .where(models.Job.id == job_id, models.Job.status == "pending")
+            .values(status="running")
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return
+        job = db.get(models.Job, job_id)
+
+        def report(done, total):
+            # 进度用单独的会话写，不会顺带提交处理函数做到一半的修改，任务失败时它们整体回滚。
+            # SQLite 同时只有一个写者：处理函数调用 report 时不能持有未提交的写入
+            with SessionLocal() as progress_db:
+                progress_db.execute(
+                    update(models.Job).where(models.Job.id == job_id).values(progress=done / total if total else 1.0)
+                )
+                progress_db.commit()
+
+        try:
+            result = HANDLERS[job.kind](db, report, **json.loads(job.params or "{}"))
+            job.status = "done"
+            job.progress = 1.0
+            job.result = json.dumps(result)
+        except Exception:
+            db.rollback()
+            job.status = "failed"
+            job.error = traceback.format_exc()
+        db.commit()
+    finally:
+        db.close()
+
+
+# ===========================
+#        任务处理函数
+# ===========================
+
+@handler("tiles")
+def build_scene_tiles(db, report, scene_id: int, image_url: str):
+    manifest = tiles.generate_tiles(image_url.lstrip("/"), tiles.tile_key(image_url), progress=report)
+    scene = db.get(models.Scene, scene_id)
+    if scene is not None:
+        scene.tile_manifest = json.dumps(manifest)
+        project_id = versioning.project_id_for_scene(db, scene_id)
+        versioning.bump_version(db, project_id)
+        changes.record(db, project_id, "scene", [scene_id])
+    return {"scene_id": scene_id, "levels": len(manifest["levels"])}
+
+
+@handler("sprite")
+def build_icon_sprite(db, report, icon_id: int):
+    icon = db.get(models.HotspotIcon, icon_id)
+    if icon is None:
+        return {"icon_id": icon_id, "frames": 0}
+    sheet, manifest = sprites.transcode(icon.url.lstrip("/"))
+    # 换下来的旧精灵图由 sweeper 在宽限期后回收
+    icon.sprite_url = storage.save_bytes(sheet, ".png").url if sheet else None
+    icon.sprite_manifest = json.dumps(manifest)
+    return {"icon_id": icon_id, "frames": manifest["frames"]}
+
+
+@handler("variants")
+def build_image_variants(db, report, urls):
+    kept = 0
+    for i, url in enumerate(urls):
+        kept += variants.generate(db, url)
+        # 每张图的变体互不相关，各自提交；已经生成过的图重跑时直接跳过
+        db.commit()
+        report(i + 1, len(urls))
+    return {"images": len(urls), "variants": kept}
+
+
+@handler("cover")
+def render_scene_cover(db, report, scene_id: int, heading: float, pitch: float, fov: float):
+    """按给定视角从全景图渲染封面并设为场景封面"""
+    scene = db.get(models.Scene, scene_id)
+    if scene is None:
+        return {"scene_id": scene_id, "cover_url": None}
+    image, = renderer.render_file(scene.image_url.lstrip("/"), [(renderer.COVER_SIZE, heading, pitch, fov)])
+    scene.cover_url = storage.save_bytes(image, ".jpg").url
+    if scene.group and scene.group.project:
+        scene.group.project.updated_at = datetime.now()
+        versioning.bump_version(db, scene.group.project_id)
+        changes.record(db, scene.group.project_id, "scene", [scene_id])
+    variants.generate(db, scene.cover_url)
+    return {"scene_id": scene_id, "cover_url": scene.cover_url}
+
+
+@handler("thumbnails")
+def render_scene_thumbnails(db, report, scene_ids, covers: bool = False):
+    """
+    按各场景的初始视角渲染缩略图；covers=True 时顺便给还没有封面的场景生成封面，
+    还没有低清占位的场景一并生成。引用同一张原图的场景一起渲染，原图只解码一次
+    """
+    scenes = db.query(models.Scene).filter(models.Scene.id.in_(scene_ids)).order_by(models.Scene.image_url).all()
+    done = 0
+    generated = []
+    for image_url, group in itertools.groupby(scenes, key=lambda s: s.image_url):
+        targets = []  # (scene, 是否生成封面)
+        views = []
+        for scene in group:
+            view = (scene.initial_heading or 0.0, scene.initial_pitch or 0.0, scene.fov_default or 95.0)
+            make_cover = covers and not scene.cover_url
+            targets.append((scene, make_cover))
+            views.append((renderer.THUMB_SIZE, *view))
+            if make_cover:
+                views.append((renderer.COVER_SIZE, *view))
+        pano = renderer.load_panorama(image_url.lstrip("/"), renderer.panorama_width(views))
+        images = iter(renderer.render_panorama(pano, views))
+        placeholder = None
+
+        for scene, make_cover in targets:
+            if not scene.blurhash or not scene.preview:
+                placeholder = placeholder or placeholders.from_panorama(pano)
+                scene.blurhash, scene.preview = placeholder
+            scene.thumb_url = storage.save_bytes(next(images), ".jpg").url
+            generated.append(scene.thumb_url)
+            if make_cover:
+                scene.cover_url = storage.save_bytes(next(images), ".jpg").url
+                generated.append(scene.cover_url)
+            done += 1
+        report(done, len(scenes))
+
+    # 全部渲染完才写库 (variants.generate 会 flush)，中途失败时场景保持原样
+    for url in generated:
+        variants.generate(db, url)
+    versioning.bump_version(db, *{s.group.project_id for s in scenes if s.group})
+    by_project = {}
+    for s in scenes:
+        if s.group: by_project.setdefault(s.group.project_id, []).append(s.id)
+    for project_id, ids in by_project.items():
+        changes.record(db, project_id, "scene", ids)
+    return {"scene_ids": [s.id for s in scenes]}
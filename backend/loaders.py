@@ -0,0 +1,202 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_, select
+
+import models
+import navgraph
+import schemas
+from static_files import versioned_url
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，没有时退回标准库
+    orjson = None
+
+# 读路径专用的查询：直接取需要的列，不经过 ORM 关系懒加载
+
+
+def encode_cursor(updated_at: datetime, project_id: int) -> str:
+    raw = f"{updated_at.isoformat()}|{project_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """解析失败抛 ValueError"""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    updated_at, project_id = raw.split("|", 1)
+    return datetime.fromisoformat(updated_at), int(project_id)
+
+
+def project_summaries(db, owner_id: int, cursor: str = None, limit: int = 50):
+    """
+    作品列表摘要：场景数和兜底封面都在 SQL 里算好。
+    按 (updated_at, id) 倒序做游标分页，走 (owner_id, updated_at, id) 复合索引。
+    返回 (rows, next_cursor)
+    """
+    P, G, S = models.Project, models.SceneGroup, models.Scene
+
+    scene_count = (
+        select(func.count(S.id))
+        .join(G, S.group_id == G.id)
+        .where(G.project_id == P.id)
+        .correlate(P)
+        .scalar_subquery()
+    )
+    # 与前端原来的逻辑一致：第一个有场景的分组里排在最前的场景，优先用缩略图而不是原图
+    first_scene_cover = (
+        select(func.coalesce(S.cover_url, S.thumb_url, S.image_url))
+        .join(G, S.group_id == G.id)
+        .where(G.project_id == P.id)
+        .order_by(G.id, S.sort_order, S.id)
+        .limit(1)
+        .correlate(P)
+        .scalar_subquery()
+    )
+
+    stmt = (
+        select(
+            P.id, P.name, P.category, P.created_at, P.updated_at,
+            func.coalesce(P.cover_url, first_scene_cover).label("cover_url"),
+            scene_count.label("scene_count"),
+        )
+        .where(P.owner_id == owner_id)
+        .order_by(P.updated_at.desc(), P.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        after_updated, after_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            P.updated_at < after_updated,
+            and_(P.updated_at == after_updated, P.id < after_id),
+        ))
+
+    rows = db.execute(stmt).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def _columns(model, schema):
+    """schema 里与表字段同名的列，schema 加字段时这里自动跟上"""
+    table = model.__table__.c
+    return [table[name] for name in schema.model_fields if name in table]
+
+
+_PROJECT_COLS = _columns(models.Project, schemas.Project)
+_GROUP_COLS = _columns(models.SceneGroup, schemas.SceneGroup)
+_SCENE_COLS = _columns(models.Scene, schemas.Scene) + [models.Scene.tile_manifest]
+_HOTSPOT_COLS = _columns(models.Hotspot, schemas.Hotspot) + [models.Hotspot.source_scene_id]
+
+
+def _project_dict(row) -> dict:
+    project = row._asdict()
+    project["cover_url"] = versioned_url(project["cover_url"])
+    return project
+
+
+def _scene_dict(row) -> dict:
+    scene = row._asdict()
+    manifest = scene.pop("tile_manifest")
+    scene["tiles"] = json.loads(manifest) if manifest else None
+    scene["image_url"] = versioned_url(scene["image_url"])
+    scene["cover_url"] = versioned_url(scene["cover_url"])
+    scene["thumb_url"] = versioned_url(scene["thumb_url"])
+    return scene
+
+
+def load_project_tree(db, project_id: int, owner_id: int):
+    """
+    一次性取出整个项目：项目、分组、场景、热点各一条查询，排序在 SQL 里完成。
+    返回与 schemas.Project 结构一致的 dict，项目不存在返回 None
+    """
+    P, G, S, H = models.Project, models.SceneGroup, models.Scene, models.Hotspot
+
+    row = db.execute(select(*_PROJECT_COLS).where(P.id == project_id, P.owner_id == owner_id)).first()
+    if row is None:
+        return None
+    project = _project_dict(row)
+
+    groups = []
+    group_map = {}
+    for g in db.execute(select(*_GROUP_COLS).where(G.project_id == project_id).order_by(G.id)):
+        group = g._asdict()
+        group["scenes"] = []
+        groups.append(group)
+        group_map[group["id"]] = group
+    project["groups"] = groups
+
+    scene_map = {}
+    scene_rows = db.execute(
+        select(*_SCENE_COLS)
+        .join(G, S.group_id == G.id)
+        .where(G.project_id == project_id)
+        .order_by(S.group_id, S.sort_order, S.id)
+    )
+    for s in scene_rows:
+        scene = _scene_dict(s)
+        scene["hotspots"] = []
+        group_map[scene["group_id"]]["scenes"].append(scene)
+        scene_map[scene["id"]] = scene
+
+    hotspot_rows = db.execute(
+        select(*_HOTSPOT_COLS)
+        .join(S, H.source_scene_id == S.id)
+        .join(G, S.group_id == G.id)
+        .where(G.project_id == project_id)
+        .order_by(H.source_scene_id, H.sort_order, H.id)
+    )
+    for h in hotspot_rows:
+        hotspot = h._asdict()
+        scene_map[hotspot.pop("source_scene_id")]["hotspots"].append(hotspot)
+
+    navgraph.annotate(project)
+    return project
+
+
+def load_changed(db, project_id: int, project: bool, group_ids, scene_ids, hotspot_ids) -> dict:
+    """
+    增量同步用：按 id 取出项目里改动过的对象，结构与 load_project_tree 里的节点一致，
+    但分组不带 scenes、场景不带 hotspots，热点带上 source_scene_id。已经不存在的对象不返回
+    """
+    P, G, S, H = models.Project, models.SceneGroup, models.Scene, models.Hotspot
+    result = {"project": None, "groups": [], "scenes": [], "hotspots": []}
+    if project:
+        row = db.execute(select(*_PROJECT_COLS).where(P.id == project_id)).first()
+        result["project"] = _project_dict(row) if row else None
+    if group_ids:
+        result["groups"] = [g._asdict() for g in db.execute(
+            select(*_GROUP_COLS).where(G.project_id == project_id, G.id.in_(group_ids)).order_by(G.id)
+        )]
+    if scene_ids:
+        result["scenes"] = [_scene_dict(s) for s in db.execute(
+            select(*_SCENE_COLS)
+            .join(G, S.group_id == G.id)
+            .where(G.project_id == project_id, S.id.in_(scene_ids))
+            .order_by(S.group_id, S.sort_order, S.id)
+        )]
+    if hotspot_ids:
+        result["hotspots"] = [h._asdict() for h in db.execute(
+            select(*_HOTSPOT_COLS)
+            .join(S, H.source_scene_id == S.id)
+            .join(G, S.group_id == G.id)
+            .where(G.project_id == project_id, H.id.in_(hotspot_ids))
+            .order_by(H.source_scene_id, H.sort_order, H.id)
+        )]
+    return result
+
+
+def _default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def dump_json(data) -> bytes:
+    """直接把 dict 编码成 JSON，跳过 pydantic 校验"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
@@ -1,20 +1,23 @@
+import asyncio
 import os
-import shutil
-from typing import List
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from datetime import datetime
 import base64
-import time
 
-from fastapi import FastAPI, Depends, UploadFile, File, Form, HTTPException
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, BackgroundTasks, Depends, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from database import engine, Base, get_db
-import models, schemas
+from database import SessionLocal, get_db
+import models, schemas, tiles, jobs, storage, loaders, versioning, publish, hashing, hotspots, navgraph, startup, atlas, variants, sweeper, metrics, changes, archive
+from static_files import CachedStaticFiles, cached_file_response, IMMUTABLE, REVALIDATE
 
-from auth import get_password_hash, verify_password, create_access_token, get_current_user
+from auth import create_access_token, get_current_user, CurrentUser
+import auth
 #标签栏，目的是为了区分不同API的功能
 tags_metadata = [
     {
@@ -39,8 +42,19 @@ tags_metadata = [
     }
 ]
 
-Base.metadata.create_all(bind=engine)
-app = FastAPI(openapi_tags=tags_metadata)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 建表和图标同步放在启动钩子里：导入 main 不再触碰数据库，多 worker 由文件锁串行
+    await run_in_threadpool(startup.run)
+    jobs.recover_jobs()
+    # 后台按分片增量回收孤儿记录和没人引用的文件
+    sweep_task = asyncio.create_task(sweeper.run_periodically())
+    yield
+    sweep_task.cancel()
+    jobs.shutdown()
+    hashing.shutdown()
+
+app = FastAPI(openapi_tags=tags_metadata, lifespan=lifespan)
 
 # 2. CORS
 app.add_middleware(
@@ -52,100 +66,96 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 上传请求体大小限制；项目导入的归档可能有几个 GB，用单独的上限
+app.add_middleware(storage.RequestSizeLimitMiddleware, path_limits={"/projects/import": storage.MAX_IMPORT_BYTES})
+
+# 请求耗时和 SQL 条数统计，放在最外层，被拒绝的请求也计入
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.register_collector("auth_password_hash", hashing.snapshot)
+metrics.register_collector("auth_token_cache", lambda: {**auth.token_cache.stats(), **auth.auth_stats})
+metrics.register_collector("project_cache", versioning.project_cache.stats)
+metrics.register_collector("graph_cache", navgraph.graph_cache.stats)
+
 # 3. 静态文件
 os.makedirs("static/uploads", exist_ok=True)
 os.makedirs("static/icons/system", exist_ok=True)
 os.makedirs("static/icons/custom", exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-def init_system_icons():
-    print("正在全量同步系统图标...")
-    db = next(get_db())
-    system_dir = "static/icons/system"
-    
-    if not os.path.exists(system_dir):
-        os.makedirs(system_dir)
-
-    # 1. 获取【磁盘】上的真实文件集合
-    try:
-        disk_files = set([
-            f for f in os.listdir(system_dir) 
-            if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.svg'))
-        ])
-    except Exception as e:
-        print(f"读取系统图标目录失败: {e}")
-        return
-
-    # 2. 获取【数据库】里的现有系统图标集合
-    db_icons = db.query(models.HotspotIcon).filter(models.HotspotIcon.category == "system").all()
-    # 建立 name -> icon对象 的映射，方便后面删除
-    db_icon_map = {icon.name: icon for icon in db_icons}
-    db_files = set(db_icon_map.keys())
-
-    # 3. 计算差异
-    to_add = disk_files - db_files      # 需要新增的
-    to_delete = db_files - disk_files   # 需要删除的
-
-    # 4. 执行新增
-    for filename in to_add:
-        icon = models.HotspotIcon(
-            name=filename,
-            url=f"/static/icons/system/{filename}",
-            category="system",
-            owner_id=None
-        )
-        db.add(icon)
-
-    # 5. 执行删除
-    for filename in to_delete:
-        print(f"检测到文件缺失，正在从数据库移除: {filename}")
-        db.delete(db_icon_map[filename])
-
-    # 6. 提交更改
-    if to_add or to_delete:
-        db.commit()
-        print(f"✅ 同步完成：新增 {len(to_add)} 个，删除 {len(to_delete)} 个")
-    else:
-        print("系统图标已是最新 (无变动)")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
-# 启动时运行初始化
-init_system_icons()
 # ===========================
 #         Auth API
 # ===========================
 
+async def authenticate(db: Session, username: str, password: str):
+    """校验用户名密码；bcrypt 成本变化时顺便把哈希升级到当前成本"""
+    db_user = await run_in_threadpool(lambda: db.query(models.User).filter(models.User.username == username).first())
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+    valid, new_hash = await hashing.verify_and_update(password, db_user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+    if new_hash:
+        db_user.hashed_password = new_hash
+        await run_in_threadpool(db.commit)
+    return db_user
+
 #用户注册
 @app.post("/auth/register",tags=["users"])
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
-    if db_user:
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    exists = await run_in_threadpool(lambda: db.query(models.User.id).filter(models.User.username == user.username).first())
+    if exists:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_pw = get_password_hash(user.password)
-    new_user = models.User(username=user.username, hashed_password=hashed_pw)
-    db.add(new_user)
-    db.commit()
+    hashed_pw = await hashing.hash_password(user.password)
+
+    def persist():
+        db.add(models.User(username=user.username, hashed_password=hashed_pw))
+        db.commit()
+    await run_in_threadpool(persist)
     return {"msg": "Registration successful"}
 
 #用户登录
 @app.post("/auth/login", response_model=schemas.Token,tags=["users"])
-def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
-    if not db_user or not verify_password(user.password, db_user.hashed_password):
-        raise HTTPException(status_code=401, detail="Incorrect username or password")
-    
-    access_token = create_access_token(data={"sub": db_user.username})
+async def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
+    db_user = await authenticate(db, user.username, user.password)
+    access_token = create_access_token(data={"sub": db_user.username, "uid": db_user.id})
     return {"access_token": access_token, "token_type": "bearer", "username": db_user.username}
 
 #fastapi文档登录测试专用接口
 @app.post("/auth/swagger_login", response_model=schemas.Token, include_in_schema=False)
-def login_for_docs(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not db_user or not verify_password(form_data.password, db_user.hashed_password):
-        raise HTTPException(status_code=401, detail="Incorrect username or password")
-    
-    access_token = create_access_token(data={"sub": db_user.username})
+async def login_for_docs(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    db_user = await authenticate(db, form_data.username, form_data.password)
+    access_token = create_access_token(data={"sub": db_user.username, "uid": db_user.id})
     return {"access_token": access_token, "token_type": "bearer", "username": db_user.username}
 
+@app.get("/auth/hash_stats", tags=["users"])
+def hash_stats():
+    """
+    密码哈希进程池的排队情况
+    """
+    return hashing.snapshot()
+
+@app.get("/auth/cache_stats", tags=["users"])
+def auth_cache_stats():
+    """
+    登录态缓存命中情况：hits 即省下的 JWT 解码和用户查询次数
+    """
+    return {**auth.token_cache.stats(), **auth.auth_stats}
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """
+    Prometheus 抓取接口：各路由的延迟直方图、每请求 SQL 条数与耗时、上传字节数和各缓存统计
+    """
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/maintenance/sweep", tags=["project"])
+def sweep_report(current_user: CurrentUser = Depends(auth.get_operator), db: Session = Depends(get_db)):
+    """
+    垃圾回收的演练报告 (仅 OPERATOR_USERS)：只用查询统计一轮清理会删除的孤儿记录 (每张表最多 SWEEP_BATCH 条)
+    和全部分片里将被回收的文件，不做任何删除、不占写锁；以及后台清理的进度
+    """
+    report = sweeper.sweep(db, dry_run=True)
+    return {**report, "background": {k: sweeper.state[k] for k in ("cursor", "passes")}, "last_pass": sweeper.state["last_pass"]}
 
 # ===========================
 #         Project API
@@ -155,87 +165,247 @@ def login_for_docs(form_data: OAuth2PasswordRequestForm = Depends(), db: Session
 def get_projects(
     skip: int = 0, limit: int = 100, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     获得全部的作品资料，目的是载入用户的作品列表
     """
-    return db.query(models.Project).filter(models.Project.owner_id == current_user.id).order_by(models.Project.updated_at.desc()).offset(skip).limit(limit).all()
+    projects = db.query(models.Project).filter(models.Project.owner_id == current_user.id).order_by(models.Project.updated_at.desc()).offset(skip).limit(limit).all()
+    return [navgraph.annotate_project(db, p) for p in projects]
 
-# 获取详情
-# backend/main.py 中的 read_project 函数
+#获取作品列表摘要 (轻量)
+@app.get("/projects/summary", response_model=schemas.ProjectSummaryPage, tags=["project"])
+def get_project_summaries(
+    cursor: Optional[str] = None, limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    作品列表只需要名称、分类、时间、场景数和封面，不加载整棵场景树。
+    用上一页返回的 next_cursor 翻页
+    """
+    limit = max(1, min(limit, 200))
+    try:
+        rows, next_cursor = loaders.project_summaries(db, current_user.id, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": rows, "next_cursor": next_cursor}
 
+# 获取详情
 @app.get("/projects/{project_id}", response_model=schemas.Project)
 def read_project(
     project_id: int, 
+    request: Request,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    db_project = db.query(models.Project).filter(
+    """
+    固定四条查询取出整棵场景树 (排序在 SQL 里做)，直接编码成 JSON 返回。
+    序列化结果按版本号缓存；客户端带上 ETag 且项目未变化时返回 304
+    """
+    # 只查版本号 (同时校验归属)，未变化时不再加载场景树
+    stamp = db.query(models.Project.version, models.Project.created_at).filter(
         models.Project.id == project_id,
         models.Project.owner_id == current_user.id
     ).first()
-    
-    if db_project is None:
+    if stamp is None:
         raise HTTPException(status_code=404, detail="Project not found")
-    
-    # 手动排序 scenes 和 hotspots
-    for group in db_project.groups:
-        # 1. 排序场景
-        group.scenes.sort(key=lambda s: s.sort_order)
-        
-        # 2. [新增] 排序每个场景里的热点
-        for scene in group.scenes:
-            scene.hotspots.sort(key=lambda h: h.sort_order)
-            
-    return db_project
+    version, salt = stamp.version, versioning.project_salt(stamp.created_at)
+
+    headers = {"ETag": versioning.project_etag(project_id, salt, version), "Cache-Control": "private, no-cache"}
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    payload = versioning.get_cached_payload(project_id, salt, version)
+    if payload is None:
+        tree = loaders.load_project_tree(db, project_id, current_user.id)
+        if tree is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        payload = loaders.dump_json(tree)
+        # 加载期间若有人修改，内容只会比 version 更新，缓存仍以读到的 version 为键
+        versioning.put_cached_payload(project_id, salt, version, payload)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+@app.get("/projects/{project_id}/changes", response_model=schemas.ProjectChanges, tags=["editor"])
+def read_project_changes(
+    project_id: int,
+    since: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    since 为客户端手里的版本号，返回之后改动过的对象和删除的 id，客户端按此更新本地的项目树。
+    日志已经清理到 since 之后时 reset 为 true，客户端应重新请求整个项目
+    """
+    version = db.query(models.Project.version).filter(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user.id
+    ).scalar()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    payload = changes.delta(db, project_id, since, version)
+    return Response(content=loaders.dump_json(payload), media_type="application/json", headers={"Cache-Control": "private, no-cache"})
+
+@app.get("/projects/{project_id}/changes/stream", tags=["editor"])
+async def stream_project_changes(project_id: int, request: Request, token: str, since: Optional[int] = None):
+    """
+    Server-Sent Events：项目有新版本时推送一条 changes 事件，内容与 /changes 相同。
+    EventSource 不能设置请求头，token 放在查询参数里；断线重连时浏览器带上的 Last-Event-ID 优先于 since
+    """
+    def authorize():
+        # 不用 Depends(get_db)：连接会一直开着，不能在整个推送期间占着一个数据库会话
+        with SessionLocal() as db:
+            user = get_current_user(token, db)
+            return db.query(models.Project.version).filter(
+                models.Project.id == project_id,
+                models.Project.owner_id == user.id
+            ).scalar()
+
+    version = await run_in_threadpool(authorize)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(
+        changes.stream(request, project_id, version if since is None else since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/projects/{project_id}/graph", response_model=schemas.ProjectGraph, tags=["view"])
+def read_project_graph(
+    project_id: int,
+    source: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    场景导航图：每个场景的相邻场景、预加载建议和到其它场景的跳数。
+    传 source 时只返回该场景，查看器据此在用户浏览时预热接下来的场景
+    """
+    stamp = db.query(models.Project.version, models.Project.created_at).filter(
+        models.Project.id == project_id,
+        models.Project.owner_id == current_user.id
+    ).first()
+    if stamp is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    version = stamp.version
+    graph = navgraph.get_graph(db, project_id, versioning.project_salt(stamp.created_at), version)
+    if source is not None and source not in graph["edges"]:
+        raise HTTPException(status_code=404, detail="Scene not found")
+    return {
+        "project_id": project_id,
+        "version": version,
+        "order": graph["order"],
+        "scenes": [
+            {
+                "id": sid,
+                "neighbours": graph["edges"][sid],
+                "prefetch": navgraph.prefetch_hints(graph, sid),
+                "distances": navgraph.distances(graph, sid),
+            }
+            for sid in ([source] if source is not None else graph["order"])
+        ],
+    }
+
 # 创建项目
-@app.post("/projects/create_full/", response_model=schemas.Project,tags=["project"])
-def create_project_full(
+@app.post("/projects/create_full/", response_model=schemas.ProjectCreated,tags=["project"])
+async def create_project_full(
     name: str = Form(...),
     category: str = Form(...),
     files: List[UploadFile] = File(...),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    db_project = models.Project(name=name, category=category, owner_id=current_user.id)
-    db.add(db_project)
-    db.commit()
-    db.refresh(db_project)
+    """
+    多个全景图并发写入存储，项目、默认分组和全部场景在同一个事务里创建
+    """
+    blobs = await storage.save_uploads(files, storage.SCENE_TYPES)
+
+    def persist():
+        db_project = models.Project(name=name, category=category, owner_id=current_user.id)
+        default_group = models.SceneGroup(name="默认分组", project=db_project)
+        db_scenes = [
+            models.Scene(name=os.path.splitext(file.filename)[0], image_url=blob.url, group=default_group)
+            for file, blob in zip(files, blobs)
+        ]
+        db.add(db_project)
+        db.flush()
+        # 切片放到后台任务里，接口立即返回任务编号
+        new_jobs = [jobs.create_job(db, "tiles", scene_id=s.id, image_url=s.image_url) for s in db_scenes] if tiles.ENABLED else []
+        new_jobs.append(jobs.create_job(db, "thumbnails", scene_ids=[s.id for s in db_scenes]))
+        new_jobs.append(jobs.create_job(db, "variants", urls=[s.image_url for s in db_scenes]))
+        db.commit()
+        for job in new_jobs: jobs.start(job.id)
 
-    default_group = models.SceneGroup(name="默认分组", project_id=db_project.id)
-    db.add(default_group)
-    db.commit()
-    db.refresh(default_group)
+        db.refresh(db_project)
+        navgraph.annotate_project(db, db_project)
+        db_project.job_ids = [job.id for job in new_jobs]
+        # 在线程池里序列化，懒加载查询不占用事件循环
+        return schemas.ProjectCreated.model_validate(db_project)
 
-    for file in files:
-        filename = f"{int(time.time())}_{file.filename}"
-        file_path = f"static/uploads/{filename}"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        db_scene = models.Scene(
-            name=os.path.splitext(file.filename)[0],
-            image_url=f"/{file_path}",
-            group_id=default_group.id
-        )
-        db.add(db_scene)
+    return await run_in_threadpool(persist)
 
-    db.commit()
-    db.refresh(db_project)
-    return db_project
+@app.get("/projects/{project_id}/export", tags=["project"])
+def export_project(
+    project_id: int,
+    format: str = "tar",
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    导出项目归档 (tar 或 zip)：project.json 加上引用的全景图、封面和自定义图标。
+    边读文件边发送，不生成临时文件，大项目也不会占用大量内存
+    """
+    if format not in ("tar", "zip"):
+        raise HTTPException(status_code=400, detail="format must be tar or zip")
+    manifest = archive.build_manifest(db, project_id, current_user.id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return StreamingResponse(
+        archive.stream_tar(manifest) if format == "tar" else archive.stream_zip(manifest),
+        media_type="application/x-tar" if format == "tar" else "application/zip",
+        headers={"Content-Disposition": f'attachment; filename="project-{project_id}.{format}"'},
+    )
+
+@app.post("/projects/import", response_model=schemas.ProjectImportResult, tags=["project"])
+async def import_project(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    name: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    导入 /export 导出的归档，请求体直接是归档文件 (tar、tar.gz 或 zip)。
+    文件边收边写进存储，项目、分组、场景、热点批量创建，跳转热点指向新场景；name 可覆盖项目名
+    """
+    reader = archive.BodyReader(request.stream(), storage.MAX_IMPORT_BYTES)
+    result = await run_in_threadpool(archive.import_archive, db, reader, current_user.id, name)
+    for job_id in result["job_ids"]: jobs.start(job_id)
+    if result["icons"]:
+        background_tasks.add_task(atlas.rebuild_for_user, current_user.id)
+    return result
 
 @app.post("/projects/batch_delete/",tags=["project"])
 def delete_projects(
     project_ids: List[int], 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    db.query(models.Project).filter(
+    owned = db.query(models.Project).filter(
         models.Project.id.in_(project_ids),
         models.Project.owner_id == current_user.id
-    ).delete(synchronize_session=False)
+    )
+    owned_ids = [r.id for r in owned.with_entities(models.Project.id)]
+    owned.delete(synchronize_session=False)
     db.commit()
+    # 删除的作品不能继续公开访问；id 可能被新项目重用，缓存一并清掉
+    for pid in owned_ids:
+        publish.unpublish(pid)
+        versioning.forget(pid)
+        navgraph.forget(pid)
     return {"ok": True}
 
 @app.put("/projects/{project_id}",tags=["project"])
@@ -243,7 +413,7 @@ def update_project(
     project_id: int, 
     project_update: schemas.ProjectUpdate, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     db_project = db.query(models.Project).filter(models.Project.id == project_id, models.Project.owner_id == current_user.id).first()
     if not db_project:
@@ -253,10 +423,131 @@ def update_project(
     if project_update.category: db_project.category = project_update.category
     
     db_project.updated_at = datetime.now()
+    versioning.bump_version(db, project_id)
+    changes.record(db, project_id, "project", [project_id])
     db.commit()
     db.refresh(db_project)
     return db_project
 
+# ===========================
+#        Publish API
+# ===========================
+
+@app.post("/projects/{project_id}/publish", response_model=schemas.PublishResult, tags=["project"])
+def publish_project(
+    project_id: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    把项目编译成静态的查看器清单写到磁盘，公开访问不再经过数据库
+    """
+    manifest = publish.compile_manifest(db, project_id, current_user.id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    # 先登记清单引用的文件再写出清单：之后换封面、删场景都不会回收已发布版本还在用的文件
+    publish.pin_uploads(db, manifest)
+    db.commit()
+    publish.write_manifest(manifest)
+
+    db_project = db.query(models.Project).filter(models.Project.id == project_id).first()
+    db_project.published_version = manifest["version"]
+    db_project.published_at = datetime.fromisoformat(manifest["published_at"])
+    db.commit()
+    return {
+        "project_id": project_id,
+        "version": manifest["version"],
+        "url": f"/public/projects/{project_id}",
+        "version_url": f"/public/projects/{project_id}/v/{manifest['version']}",
+        "published_at": db_project.published_at,
+    }
+
+@app.delete("/projects/{project_id}/publish", tags=["project"])
+def unpublish_project(
+    project_id: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    db_project = db.query(models.Project).filter(models.Project.id == project_id, models.Project.owner_id == current_user.id).first()
+    if not db_project:
+        raise HTTPException(status_code=404, detail="Not found")
+    publish.unpublish(project_id)
+    publish.unpin_uploads(db, project_id)
+    db_project.published_version = None
+    db_project.published_at = None
+    db.commit()
+    return {"ok": True}
+
+@app.post("/projects/{project_id}/thumbnails", response_model=schemas.JobProgress, tags=["project"])
+def render_project_thumbnails(
+    project_id: int,
+    covers: bool = False,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    后台批量重新渲染项目内所有场景的缩略图；covers=true 时给没有封面的场景生成封面
+    """
+    if not db.query(models.Project.id).filter(models.Project.id == project_id, models.Project.owner_id == current_user.id).first():
+        raise HTTPException(status_code=404, detail="Not found")
+    scene_ids = [
+        sid for sid, in db.query(models.Scene.id)
+        .join(models.SceneGroup, models.Scene.group_id == models.SceneGroup.id)
+        .filter(models.SceneGroup.project_id == project_id)
+    ]
+    job = jobs.create_job(db, "thumbnails", scene_ids=scene_ids, covers=covers)
+    db.commit()
+    jobs.start(job.id)
+    return job
+
+@app.post("/projects/{project_id}/variants", response_model=schemas.JobProgress, tags=["project"])
+def build_project_variants(
+    project_id: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    后台给项目里还没有 WebP / AVIF 变体的图片补生成 (升级前上传的图片)
+    """
+    if not db.query(models.Project.id).filter(models.Project.id == project_id, models.Project.owner_id == current_user.id).first():
+        raise HTTPException(status_code=404, detail="Not found")
+    urls = list(dict.fromkeys(url for _, _, url in variants.project_images(db, project_id)))
+    job = jobs.create_job(db, "variants", urls=urls)
+    db.commit()
+    jobs.start(job.id)
+    return job
+
+@app.get("/projects/{project_id}/images/report", response_model=schemas.ImageReport, tags=["project"])
+def project_image_report(
+    project_id: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    项目内每张图片原图与各格式变体的大小、解码耗时，以及按 Accept 协商后实际节省的流量
+    """
+    if not db.query(models.Project.id).filter(models.Project.id == project_id, models.Project.owner_id == current_user.id).first():
+        raise HTTPException(status_code=404, detail="Not found")
+    return variants.project_report(db, project_id)
+
+def _published_file(path: str, request: Request, cache_control: str):
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Project not published")
+    return cached_file_response(path, stat_result, request.headers, cache_control, media_type="application/json")
+
+@app.get("/public/projects/{project_id}", tags=["view"])
+def get_published_project(project_id: int, request: Request):
+    """
+    公开查看器入口：直接读取发布好的清单，不查数据库、不需要登录
+    """
+    return _published_file(publish.manifest_path(project_id), request, REVALIDATE)
+
+@app.get("/public/projects/{project_id}/v/{version}", tags=["view"])
+def get_published_project_version(project_id: int, version: int, request: Request):
+    return _published_file(publish.manifest_path(project_id, version), request, IMMUTABLE)
+
 # ===========================
 #      Group & Scene API 
 # ===========================
@@ -272,6 +563,9 @@ def create_group(group: schemas.SceneGroupCreate, db: Session = Depends(get_db))
     # 更新时间
     proj = db.query(models.Project).filter(models.Project.id == group.project_id).first()
     if proj: proj.updated_at = datetime.now()
+    versioning.bump_version(db, group.project_id)
+    db.flush()
+    changes.record(db, group.project_id, "group", [db_group.id])
     db.commit()
     db.refresh(db_group)
     return db_group
@@ -284,32 +578,69 @@ def update_group(group_id: int, u: schemas.SceneGroupUpdate, db: Session = Depen
     g = db.query(models.SceneGroup).filter(models.SceneGroup.id == group_id).first()
     if g:
         g.name = u.name
+        versioning.bump_version(db, g.project_id)
+        changes.record(db, g.project_id, "group", [g.id])
         db.commit()
     return g
 
 @app.delete("/groups/{group_id}")
 def delete_group(group_id: int, db: Session = Depends(get_db)):
+    project_id = versioning.project_id_for_group(db, group_id)
+    scene_ids = db.query(models.Scene.id).filter(models.Scene.group_id == group_id).all()
+    retargeted = changes.hotspots_targeting(db, [sid for sid, in scene_ids])
+    versioning.bump_version(db, project_id)
     db.query(models.SceneGroup).filter(models.SceneGroup.id == group_id).delete()
+    # 下面的场景和热点随分组级联删除，客户端删掉整棵子树即可
+    changes.record(db, project_id, "group", [group_id], deleted=True)
+    changes.record(db, project_id, "hotspot", retargeted)
     db.commit()
     return {"ok": True}
 
-@app.post("/groups/{group_id}/upload_scene", response_model=schemas.Scene)
-def upload_scene_to_group(group_id: int, files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+@app.post("/groups/{group_id}/upload_scene", response_model=schemas.SceneUpload)
+async def upload_scene_to_group(group_id: int, files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
     file = files[0]
-    filename = f"{int(time.time())}_{file.filename}"
-    file_path = f"static/uploads/{filename}"
-    with open(file_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    
-    db_scene = models.Scene(name=os.path.splitext(file.filename)[0], image_url=f"/{file_path}", group_id=group_id)
-    db.add(db_scene)
-    
-    g = db.query(models.SceneGroup).filter(models.SceneGroup.id == group_id).first()
-    if g and g.project: g.project.updated_at = datetime.now()
-    
-    db.commit()
-    db.refresh(db_scene)
-    return db_scene
+    blob = await storage.save_upload(file, storage.SCENE_TYPES)
+
+    def persist():
+        db_scene = models.Scene(name=os.path.splitext(file.filename)[0], image_url=blob.url, group_id=group_id)
+        db.add(db_scene)
+        
+        g = db.query(models.SceneGroup).filter(models.SceneGroup.id == group_id).first()
+        if g and g.project: g.project.updated_at = datetime.now()
+        if g: versioning.bump_version(db, g.project_id)
+        
+        db.flush()
+        if g: changes.record(db, g.project_id, "scene", [db_scene.id])
+        job = jobs.create_job(db, "tiles", scene_id=db_scene.id, image_url=db_scene.image_url) if tiles.ENABLED else None
+        thumb_job = jobs.create_job(db, "thumbnails", scene_ids=[db_scene.id])
+        variant_job = jobs.create_job(db, "variants", urls=[db_scene.image_url])
+        db.commit()
+        if job: jobs.start(job.id)
+        jobs.start(thumb_job.id)
+        jobs.start(variant_job.id)
+        db.refresh(db_scene)
+        if g: db_scene.prefetch = navgraph.prefetch_hints(navgraph.graph_for(db, g.project), db_scene.id)
+        db_scene.job_id = job.id if job else None
+        db_scene.thumb_job_id = thumb_job.id
+        return schemas.SceneUpload.model_validate(db_scene)
+
+    return await run_in_threadpool(persist)
+
+@app.get("/tiles/{key}/{level}/{face}/{tile}", tags=["view"])
+def get_tile(key: str, level: int, face: str, tile: str, request: Request):
+    """
+    获取单个立方体面瓦片，查看器按当前视野只请求可见的瓦片
+    """
+    path = tiles.tile_path(key, level, face, tile)
+    try:
+        stat_result = os.stat(path) if path else None
+    except OSError:
+        stat_result = None
+    if stat_result is None:
+        raise HTTPException(status_code=404, detail="Tile not found")
+    # 瓦片路径由原图决定，内容不会变化
+    return cached_file_response(path, stat_result, request.headers, IMMUTABLE,
+                                etag=f"{key}-{level}-{face}-{tile}", media_type="image/jpeg")
 
 @app.put("/scenes/{scene_id}")
 def update_scene(scene_id: int, u: schemas.SceneUpdate, db: Session = Depends(get_db)):
@@ -317,17 +648,54 @@ def update_scene(scene_id: int, u: schemas.SceneUpdate, db: Session = Depends(ge
     if not s: raise HTTPException(status_code=404)
     
     data = u.dict(exclude_unset=True)
+    view_changed = any(k in data and data[k] != getattr(s, k) for k in ("initial_heading", "initial_pitch", "fov_default"))
     for k, v in data.items(): setattr(s, k, v)
     
     if s.group and s.group.project: s.group.project.updated_at = datetime.now()
+    if s.group:
+        versioning.bump_version(db, s.group.project_id)
+        changes.record(db, s.group.project_id, "scene", [s.id])
+    # 初始视角变了，缩略图要重新渲染
+    thumb_job = jobs.create_job(db, "thumbnails", scene_ids=[s.id]) if view_changed else None
     db.commit()
+    if thumb_job: jobs.start(thumb_job.id)
     return s
 
+@app.post("/scenes/{scene_id}/cover", response_model=schemas.JobProgress)
+def render_scene_cover(scene_id: int, view: Optional[schemas.SceneView] = None, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    """
+    在后台按给定视角 (默认为初始视角) 从全景图渲染封面并设为场景封面，返回任务；
+    大全景图解码要几秒，不占用请求线程
+    """
+    s = (
+        db.query(models.Scene)
+        .join(models.SceneGroup, models.Scene.group_id == models.SceneGroup.id)
+        .join(models.Project, models.SceneGroup.project_id == models.Project.id)
+        .filter(models.Scene.id == scene_id, models.Project.owner_id == current_user.id)
+        .first()
+    )
+    if not s: raise HTTPException(status_code=404, detail="Scene not found")
+    view = view or schemas.SceneView()
+    job = jobs.create_job(
+        db, "cover", scene_id=s.id,
+        heading=s.initial_heading if view.heading is None else view.heading,
+        pitch=s.initial_pitch if view.pitch is None else view.pitch,
+        fov=s.fov_default if view.fov is None else view.fov,
+    )
+    db.commit()
+    jobs.start(job.id)
+    return job
+
 @app.delete("/scenes/{scene_id}")
 def delete_scene(scene_id: int, db: Session = Depends(get_db)):
     s = db.query(models.Scene).filter(models.Scene.id == scene_id).first()
     if s:
         if s.group and s.group.project: s.group.project.updated_at = datetime.now()
+        retargeted = changes.hotspots_targeting(db, [s.id])
+        if s.group:
+            versioning.bump_version(db, s.group.project_id)
+            changes.record(db, s.group.project_id, "scene", [s.id], deleted=True)
+            changes.record(db, s.group.project_id, "hotspot", retargeted)
         db.delete(s)
         db.commit()
     return {"ok": True}
@@ -338,6 +706,9 @@ def reorder_scenes(group_id: int, scene_ids: List[int], db: Session = Depends(ge
     s_map = {s.id: s for s in scenes}
     for idx, sid in enumerate(scene_ids):
         if sid in s_map: s_map[sid].sort_order = idx
+    project_id = versioning.project_id_for_group(db, group_id)
+    versioning.bump_version(db, project_id)
+    changes.record(db, project_id, "scene", s_map.keys())
     db.commit()
     return {"ok": True}
 
@@ -349,6 +720,10 @@ def reorder_scenes(group_id: int, scene_ids: List[int], db: Session = Depends(ge
 def create_hotspot(h: schemas.HotspotCreate, db: Session = Depends(get_db)):
     db_h = models.Hotspot(**h.dict())
     db.add(db_h)
+    project_id = versioning.project_id_for_scene(db, h.source_scene_id)
+    versioning.bump_version(db, project_id)
+    db.flush()
+    changes.record(db, project_id, "hotspot", [db_h.id])
     db.commit()
     db.refresh(db_h)
     return db_h
@@ -361,72 +736,140 @@ def update_hotspot(hotspot_id: int, u: schemas.HotspotUpdate, db: Session = Depe
     data = u.dict(exclude_unset=True)
     for k, v in data.items(): setattr(h, k, v)
     
+    project_id = versioning.project_id_for_scene(db, h.source_scene_id)
+    versioning.bump_version(db, project_id)
+    changes.record(db, project_id, "hotspot", [h.id])
     db.commit()
     db.refresh(h)
     return h
 
 @app.delete("/hotspots/{hotspot_id}")
 def delete_hotspot(hotspot_id: int, db: Session = Depends(get_db)):
+    projects = versioning.projects_by_hotspot(db, [hotspot_id])
+    versioning.bump_version(db, *projects.values())
+    changes.record_hotspots(db, projects, deleted=True)
     db.query(models.Hotspot).filter(models.Hotspot.id == hotspot_id).delete()
     db.commit()
     return {"ok": True}
 
 @app.post("/hotspots/batch_delete/")
 def delete_hotspots_batch(hotspot_ids: List[int], db: Session = Depends(get_db)):
+    projects = versioning.projects_by_hotspot(db, hotspot_ids)
+    versioning.bump_version(db, *projects.values())
+    changes.record_hotspots(db, projects, deleted=True)
     db.query(models.Hotspot).filter(models.Hotspot.id.in_(hotspot_ids)).delete(synchronize_session=False)
     db.commit()
     return {"ok": True}
 
+@app.post("/hotspots/batch", response_model=schemas.HotspotBatchResult)
+def apply_hotspot_batch(batch: schemas.HotspotBatch, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    """
+    批量新增 / 修改 / 删除热点，可跨场景，一个事务内完成
+    """
+    # commit 之前序列化，避免提交后逐行重新加载
+    result = schemas.HotspotBatchResult.model_validate(hotspots.apply_batch(db, batch, current_user.id))
+    db.commit()
+    return result
+
+# ===========================
+#          Jobs API
+# ===========================
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    """
+    查询后台任务的状态、结果和错误信息
+    """
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job: raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/progress", response_model=schemas.JobProgress)
+def get_job_progress(job_id: int, db: Session = Depends(get_db)):
+    """
+    轮询用的轻量接口，只返回状态和进度
+    """
+    job = db.query(models.Job.id, models.Job.status, models.Job.progress).filter(models.Job.id == job_id).first()
+    if not job: raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 # ===========================
 #        Icons & Utils
 # ===========================
 
 @app.get("/icons/", response_model=List[schemas.HotspotIcon])
-def get_icons(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_icons(db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     return db.query(models.HotspotIcon).filter(
         (models.HotspotIcon.category == "system") | 
         ((models.HotspotIcon.category == "custom") & (models.HotspotIcon.owner_id == current_user.id))
     ).all()
 
-@app.post("/icons/", response_model=schemas.HotspotIcon)
-def upload_icon(
+@app.get("/icons/atlas", tags=["editor"])
+def get_icon_atlas(request: Request, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    """
+    当前用户可见图标的纹理图集：页图片地址和每个图标 (按 url) 的像素区域与 UV。
+    excluded 里的图标 (SVG、动图) 不在图集中，需要单独加载
+    """
+    manifest = atlas.get_atlas(db, current_user.id)
+    headers = {"ETag": f'"atlas-{manifest["key"]}"', "Cache-Control": "private, no-cache"}
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=loaders.dump_json(manifest), media_type="application/json", headers=headers)
+
+@app.post("/icons/", response_model=schemas.HotspotIconUpload)
+async def upload_icon(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    if file.content_type not in ["image/png", "image/jpeg", "image/gif", "image/svg+xml"]:
+    if file.content_type not in storage.ICON_TYPES:
         raise HTTPException(status_code=400, detail="Invalid format")
     
-    fname = f"icon_{int(time.time())}_{file.filename}"
-    fpath = f"static/icons/custom/{fname}"
-    with open(fpath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-        
-    icon = models.HotspotIcon(name=file.filename, url=f"/{fpath}", category="custom", owner_id=current_user.id)
-    db.add(icon)
-    db.commit()
-    db.refresh(icon)
-    return icon
+    blob = await storage.save_upload(file, max_bytes=storage.MAX_ICON_BYTES, kind="icon")
+
+    def persist():
+        icon = models.HotspotIcon(name=file.filename, url=blob.url, category="custom", owner_id=current_user.id)
+        db.add(icon)
+        db.flush()
+        # 动图在后台转成精灵图，前端不用再逐帧解码；位图图标生成 WebP / AVIF 变体
+        if file.content_type == "image/gif":
+            job = jobs.create_job(db, "sprite", icon_id=icon.id)
+        elif file.content_type in ("image/png", "image/jpeg"):
+            job = jobs.create_job(db, "variants", urls=[icon.url])
+        else:
+            job = None
+        db.commit()
+        if job: jobs.start(job.id)
+        db.refresh(icon)
+        icon.job_id = job.id if job else None
+        return schemas.HotspotIconUpload.model_validate(icon)
+
+    # 图标集合变了，响应之后在后台把新图集准备好
+    background_tasks.add_task(atlas.rebuild_for_user, current_user.id)
+
+    return await run_in_threadpool(persist)
 
 @app.post("/upload_base64/")
 def upload_base64(data: schemas.ImageBase64):
+    if len(data.image_data) > storage.MAX_UPLOAD_BYTES * 4 // 3 + 1024:
+        raise HTTPException(status_code=413, detail="File too large")
     try:
         header, encoded = data.image_data.split(",", 1)
         ext = header.split(";")[0].split("/")[1]
         if ext == "jpeg": ext = "jpg"
         ibytes = base64.b64decode(encoded)
-        fname = f"cover_{int(time.time())}.{ext}"
-        fpath = f"static/uploads/{fname}"
-        with open(fpath, "wb") as f: f.write(ibytes)
-        return {"url": f"/{fpath}"}
+        blob = storage.save_bytes(ibytes, f".{ext}")
+        return {"url": blob.url}
     except:
         raise HTTPException(status_code=500, detail="Upload failed")
 
 @app.delete("/icons/{icon_id}")
 def delete_icon(
     icon_id: int, 
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     # 1. 查找图标 (必须是当前用户的 custom 图标)
     icon = db.query(models.HotspotIcon).filter(
@@ -438,19 +881,11 @@ def delete_icon(
     if not icon:
         raise HTTPException(status_code=404, detail="图标不存在或无权删除")
 
-    # 2. 删除物理文件 (尝试删除，忽略错误以免数据库删不掉)
-    try:
-        # icon.url 格式通常是 /static/icons/custom/xxx.png
-        # 需要去掉开头的 /，转为相对路径
-        file_path = icon.url.lstrip("/")
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    except Exception as e:
-        print(f"文件删除失败: {e}")
-
-    # 3. 删除数据库记录
+    # 2. 删除数据库记录；文件可能被别处共用，也可能正被并发的上传重新引用，
+    #    由 sweeper 在没人引用且超过宽限期后回收
     db.delete(icon)
     db.commit()
+    background_tasks.add_task(atlas.rebuild_for_user, current_user.id)
     
     return {"ok": True}
 
@@ -462,19 +897,22 @@ def reorder_hotspots(
     scene_id: int, 
     hotspot_ids: List[int], 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     # 查出该场景下所有的热点
     # (为了简化，这里先不校验 scene 的 owner，实际项目建议校验)
-    hotspots = db.query(models.Hotspot).filter(models.Hotspot.source_scene_id == scene_id).all()
+    scene_hotspots = db.query(models.Hotspot).filter(models.Hotspot.source_scene_id == scene_id).all()
     
     # 转成字典方便查找
-    h_map = {h.id: h for h in hotspots}
+    h_map = {h.id: h for h in scene_hotspots}
     
     # 遍历前端传来的 ID 列表，更新序号
     for index, h_id in enumerate(hotspot_ids):
         if h_id in h_map:
             h_map[h_id].sort_order = index
             
+    project_id = versioning.project_id_for_scene(db, scene_id)
+    versioning.bump_version(db, project_id)
+    changes.record(db, project_id, "hotspot", h_map.keys())
     db.commit()
     return {"ok": True}
\ No newline at end of file
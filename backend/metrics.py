@@ -0,0 +1,240 @@
+import contextlib
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+# 请求级指标：各路由的延迟直方图、每个请求执行的 SQL 条数和耗时、上传字节数，
+# 以 Prometheus 文本格式从 /metrics 导出。指标保存在进程内，多 worker 部署时每个进程各自统计
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "50"))  # 单个请求的 SQL 条数超过它时记一条警告，0 表示不检查
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+logger = logging.getLogger("panorama.metrics")
+
+_lock = threading.Lock()
+# 当前请求的 SQL 统计；同步接口跑在线程池里，anyio 会把 contextvar 带过去
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("queries", "sql_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+
+
+# 指标名 -> (类型, 说明, {标签元组: 数值或直方图})
+_metrics = {}
+
+
+def _define(name: str, kind: str, help_text: str, label_names=()):
+    _metrics[name] = (kind, help_text, label_names, {})
+
+
+_define("http_requests_total", "counter", "处理完成的请求数", ("method", "route", "status"))
+_define("http_request_duration_seconds", "histogram", "请求耗时", ("method", "route"))
+_define("http_request_db_queries", "histogram", "单个请求执行的 SQL 条数", ("method", "route"))
+_define("http_request_db_seconds_total", "counter", "请求内 SQL 的累计耗时", ("method", "route"))
+_define("http_query_budget_exceeded_total", "counter", "SQL 条数超过预算的请求数", ("method", "route"))
+_define("db_statements_total", "counter", "执行的 SQL 总条数 (包括请求之外的后台任务)")
+_define("db_statement_seconds_total", "counter", "SQL 累计耗时")
+_define("upload_files_total", "counter", "写入存储的上传文件数", ("kind",))
+_define("upload_bytes_total", "counter", "写入存储的上传字节数", ("kind",))
+_define("upload_seconds_total", "counter", "接收上传文件的累计耗时，与字节数相除即吞吐量", ("kind",))
+
+
+def _inc(name: str, labels=(), value: float = 1.0):
+    series = _metrics[name][3]
+    series[labels] = series.get(labels, 0) + value
+
+
+def _observe(name: str, labels, value: float, buckets):
+    series = _metrics[name][3]
+    hist = series.get(labels)
+    if hist is None:
+        hist = series[labels] = _Histogram(buckets)
+    hist.observe(value)
+
+
+# ===========================
+#        SQL 统计
+# ===========================
+
+def instrument_engine(engine):
+    """在引擎上挂执行前后的事件，按当前请求累计 SQL 条数和耗时"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += elapsed
+        with _lock:
+            _inc("db_statements_total")
+            _inc("db_statement_seconds_total", value=elapsed)
+
+
+@contextlib.contextmanager
+def untracked():
+    """长连接 (事件流) 里的轮询不计入所在请求的 SQL 统计，否则连接越久越像 N+1"""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def record_upload(kind: str, size: int, seconds: float):
+    with _lock:
+        _inc("upload_files_total", (kind,))
+        _inc("upload_bytes_total", (kind,), size)
+        _inc("upload_seconds_total", (kind,), seconds)
+
+
+# ===========================
+#        请求统计
+# ===========================
+
+def _route_label(scope) -> str:
+    # 用路由模板而不是实际路径，避免 /projects/1、/projects/2 各成一组
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    # 挂载的子应用 (/static) 不写 route，但会把挂载前缀加到 root_path 上
+    mount = scope.get("root_path", "")[len(scope.get("app_root_path", "")):]
+    return mount or "<unmatched>"
+
+
+class MetricsMiddleware:
+    """纯 ASGI 中间件，不包装响应体，流式响应和文件响应不受影响"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # 浏览器开发者工具里可以直接看到每个请求的 SQL 条数和耗时
+                timing = f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.queries} queries"'
+                message.setdefault("headers", []).append((b"server-timing", timing.encode()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self._record(scope, status, time.perf_counter() - started, stats)
+
+    @staticmethod
+    def _record(scope, status: int, elapsed: float, stats: RequestStats):
+        method, route = scope["method"], _route_label(scope)
+        labels = (method, route)
+        with _lock:
+            _inc("http_requests_total", (method, route, str(status)))
+            _observe("http_request_duration_seconds", labels, elapsed, LATENCY_BUCKETS)
+            _observe("http_request_db_queries", labels, stats.queries, QUERY_BUCKETS)
+            _inc("http_request_db_seconds_total", labels, stats.sql_seconds)
+            over_budget = QUERY_BUDGET and stats.queries > QUERY_BUDGET
+            if over_budget:
+                _inc("http_query_budget_exceeded_total", labels)
+        if over_budget:
+            logger.warning(
+                "%s %s 执行了 %d 条 SQL (预算 %d)，耗时 %.1f ms，可能存在 N+1 查询",
+                method, scope["path"], stats.queries, QUERY_BUDGET, stats.sql_seconds * 1000,
+            )
+
+
+# ===========================
+#        导出
+# ===========================
+
+# 其它模块已有的统计 (缓存命中、密码哈希排队等)，导出时以 gauge 形式附带
+_collectors = []
+
+
+def register_collector(prefix: str, fn):
+    """fn 返回 {名称: 数值}，导出为 <prefix>_<名称>"""
+    _collectors.append((prefix, fn))
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        for name, (kind, help_text, label_names, series) in _metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if not series and not label_names:
+                lines.append(f"{name} 0")
+            for labels, value in sorted(series.items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(label_names, labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(value.buckets + (math.inf,), value.counts):
+                    cumulative += count
+                    le = _format_labels(label_names, labels, [("le", _format_value(bound))])
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(label_names, labels)} {_format_value(value.sum)}")
+                lines.append(f"{name}_count{_format_labels(label_names, labels)} {cumulative}")
+
+    for prefix, fn in _collectors:
+        try:
+            values = fn()
+        except Exception as e:
+            logger.warning("指标收集失败 %s: %s", prefix, e)
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f"# TYPE {prefix}_{key} gauge")
+            lines.append(f"{prefix}_{key} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
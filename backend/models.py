@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
+import json
 from database import Base
 
 # 1. 用户表 (登录功能基础)
@@ -26,6 +27,16 @@ class HotspotIcon(Base):
     owner = relationship("User", back_populates="icons")
     created_at = Column(DateTime, default=datetime.now)
 
+    # 动图预先转成的精灵图和帧时长清单 (JSON)；静态图标清单里 frames 为 1，转码前为空
+    sprite_url = Column(String, nullable=True)
+    sprite_manifest = Column(Text, nullable=True)
+
+    @property
+    def sprite(self):
+        if not self.sprite_url or not self.sprite_manifest:
+            return None
+        return {"url": self.sprite_url, **json.loads(self.sprite_manifest)}
+
 # 3. 项目表 (带 owner_id)
 class Project(Base):
     __tablename__ = "projects"
@@ -34,23 +45,31 @@ class Project(Base):
     category = Column(String, default="其他")
     cover_url = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+    # 内容版本号，任何修改都会 +1 (用于缓存和 ETag)
+    version = Column(Integer, default=0, server_default="0", nullable=False)
+    # 已发布的版本，未发布为空
+    published_version = Column(Integer, nullable=True)
+    published_at = Column(DateTime, nullable=True)
 
     # 归属用户
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="projects")
 
-    groups = relationship("SceneGroup", back_populates="project", cascade="all, delete-orphan")
+    groups = relationship("SceneGroup", back_populates="project", cascade="all, delete-orphan", passive_deletes=True)
+
+    # 作品列表按 (owner_id, updated_at, id) 做游标分页
+    __table_args__ = (Index("ix_projects_owner_updated_id", "owner_id", "updated_at", "id"),)
 
 # 4. 分组表
 class SceneGroup(Base):
     __tablename__ = "scene_groups"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), index=True)
     
     project = relationship("Project", back_populates="groups")
-    scenes = relationship("Scene", back_populates="group", cascade="all, delete-orphan")
+    scenes = relationship("Scene", back_populates="group", cascade="all, delete-orphan", passive_deletes=True)
 
 # 5. 场景表 (含排序、视角参数)
 class Scene(Base):
@@ -59,7 +78,12 @@ class Scene(Base):
     name = Column(String)
     image_url = Column(String)
     cover_url = Column(String, nullable=True)
-    group_id = Column(Integer, ForeignKey("scene_groups.id"))
+    # 服务端按初始视角渲染的小缩略图，没有手动封面时用它代替原图
+    thumb_url = Column(String, nullable=True)
+    # 低清占位：BlurHash 和一张很小的等距柱状预览图 (data URL)，原图和缩略图加载前先显示
+    blurhash = Column(String, nullable=True)
+    preview = Column(Text, nullable=True)
+    group_id = Column(Integer, ForeignKey("scene_groups.id", ondelete="CASCADE"), index=True)
     sort_order = Column(Integer, default=0, index=True)
     
     # 视角参数
@@ -72,9 +96,16 @@ class Scene(Base):
     limit_h_max = Column(Float, default=180.0)
     limit_v_min = Column(Float, default=-90.0)
     limit_v_max = Column(Float, default=90.0)
+
+    # 多分辨率瓦片清单 (JSON)，切片完成前为空
+    tile_manifest = Column(Text, nullable=True)
     
     group = relationship("SceneGroup", back_populates="scenes")
-    hotspots = relationship("Hotspot", back_populates="source_scene", foreign_keys="Hotspot.source_scene_id", cascade="all, delete-orphan")
+    hotspots = relationship("Hotspot", back_populates="source_scene", foreign_keys="Hotspot.source_scene_id", cascade="all, delete-orphan", passive_deletes=True)
+
+    @property
+    def tiles(self):
+        return json.loads(self.tile_manifest) if self.tile_manifest else None
 
 # 6. 热点表 (包含详细样式与类型)
 class Hotspot(Base):
@@ -88,14 +119,62 @@ class Hotspot(Base):
     text = Column(String, nullable=True)
     type = Column(String, default="scene") # scene, link, text, image, video
     content = Column(Text, nullable=True) 
-    target_scene_id = Column(Integer, ForeignKey("scenes.id"), nullable=True)
+    target_scene_id = Column(Integer, ForeignKey("scenes.id", ondelete="SET NULL"), nullable=True, index=True)
     
     # 样式
     icon_type = Column(String, default="system")
-    icon_url = Column(String, default="arrow_move") 
+    icon_url = Column(String, default="arrow_move", index=True)
     scale = Column(Float, default=1.0)
     use_fixed_size = Column(Boolean, default=False)
     sort_order = Column(Integer, default=0)
     
-    source_scene_id = Column(Integer, ForeignKey("scenes.id"))
-    source_scene = relationship("Scene", foreign_keys=[source_scene_id], back_populates="hotspots")
\ No newline at end of file
+    source_scene_id = Column(Integer, ForeignKey("scenes.id", ondelete="CASCADE"), index=True)
+    source_scene = relationship("Scene", foreign_keys=[source_scene_id], back_populates="hotspots")
+
+# 7. 后台任务表 (切片等耗时的媒体处理)
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, index=True)  # 'tiles' ...
+    status = Column(String, default="pending", index=True)  # pending | running | done | failed
+    progress = Column(Float, default=0.0)  # 0 ~ 1
+    params = Column(Text, nullable=True)  # JSON
+    result = Column(Text, nullable=True)  # JSON
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# 8. 图片格式变体 (原图旁预先生成的 WebP / AVIF)，每个格式一行，original 行记录原图本身
+class ImageVariant(Base):
+    __tablename__ = "image_variants"
+    id = Column(Integer, primary_key=True, index=True)
+    source_url = Column(String, index=True)
+    format = Column(String)  # 'original' | 'webp' | 'avif'
+    url = Column(String, nullable=True)  # 比已有版本更大而没有保留时为空
+    bytes = Column(Integer)
+    width = Column(Integer)
+    height = Column(Integer)
+    decode_ms = Column(Float)
+    created_at = Column(DateTime, default=datetime.now)
+
+# 9. 项目变更日志：每次修改记下改了哪些对象、对应的项目版本号，编辑器据此增量同步
+class ProjectChange(Base):
+    __tablename__ = "project_changes"
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False)  # 修改后的项目版本号
+    entity = Column(String, nullable=False)  # 'project' | 'group' | 'scene' | 'hotspot'
+    entity_id = Column(Integer, nullable=False)
+    deleted = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (Index("ix_project_changes_project_version", "project_id", "version"),)
+
+# 10. 已发布清单引用的上传文件：发布时登记，取消发布或删除项目时随之删除。
+# 固定版本的清单永久可访问，它引用的文件不能因为编辑器里换了封面就被回收
+class PublishedUpload(Base):
+    __tablename__ = "published_uploads"
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    url = Column(String, nullable=False, index=True)
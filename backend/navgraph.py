@@ -0,0 +1,120 @@
+import os
+from collections import deque
+
+import models
+import versioning
+from cache import LRUCache
+
+# 场景导航图：节点是场景，边是 type == "scene" 的热点 (source -> target)
+PREFETCH_LIMIT = int(os.getenv("PREFETCH_LIMIT", "6"))
+PREFETCH_HOPS = 2
+GRAPH_CACHE_BYTES = int(float(os.getenv("GRAPH_CACHE_MB", "8")) * 1024 * 1024)
+
+# project_id -> (salt, version, graph)；版本号变了 (热点增删改都会 bump) 或 id 被新项目重用就重建
+graph_cache = LRUCache(GRAPH_CACHE_BYTES)
+
+
+def build(order, links) -> dict:
+    """
+    order: 按导航顺序 (分组, sort_order, id) 排好的场景 id；
+    links: 按热点顺序排列的 (source_scene_id, target_scene_id)。
+    指向项目外、指向自己以及重复的边都会被丢掉
+    """
+    edges = {sid: [] for sid in order}
+    for source, target in links:
+        if source in edges and target in edges and source != target and target not in edges[source]:
+            edges[source].append(target)
+    return {"order": list(order), "position": {sid: i for i, sid in enumerate(order)}, "edges": edges}
+
+
+def from_tree(tree: dict) -> dict:
+    """从 loaders.load_project_tree 的结果构建，不需要额外查询"""
+    scenes = [scene for group in tree["groups"] for scene in group["scenes"]]
+    return build(
+        [scene["id"] for scene in scenes],
+        [(scene["id"], h["target_scene_id"]) for scene in scenes for h in scene["hotspots"] if h["type"] == "scene"],
+    )
+
+
+def load(db, project_id: int) -> dict:
+    S, G, H = models.Scene, models.SceneGroup, models.Hotspot
+    order = [
+        sid for sid, in db.query(S.id)
+        .join(G, S.group_id == G.id)
+        .filter(G.project_id == project_id)
+        .order_by(S.group_id, S.sort_order, S.id)
+    ]
+    links = (
+        db.query(H.source_scene_id, H.target_scene_id)
+        .join(S, H.source_scene_id == S.id)
+        .join(G, S.group_id == G.id)
+        .filter(G.project_id == project_id, H.type == "scene", H.target_scene_id.isnot(None))
+        .order_by(H.source_scene_id, H.sort_order, H.id)
+        .all()
+    )
+    return build(order, links)
+
+
+def remember(project_id: int, salt: str, version: int, graph: dict):
+    size = 128 * (len(graph["order"]) + sum(len(t) for t in graph["edges"].values()))
+    graph_cache.put(project_id, (salt, version, graph), size)
+
+
+def forget(project_id: int):
+    graph_cache.pop(project_id)
+
+
+def get_graph(db, project_id: int, salt: str, version: int) -> dict:
+    cached = graph_cache.get(project_id)
+    if cached is not None and cached[:2] == (salt, version):
+        return cached[2]
+    graph = load(db, project_id)
+    remember(project_id, salt, version, graph)
+    return graph
+
+
+def distances(graph: dict, source: int, max_hops: int = None) -> dict:
+    """从 source 出发 BFS，返回 {可达场景: 跳数}，包含 source 自己 (0)"""
+    if source not in graph["edges"]:
+        return {}
+    dist = {source: 0}
+    queue = deque([source])
+    while queue:
+        sid = queue.popleft()
+        if max_hops is not None and dist[sid] >= max_hops:
+            continue
+        for target in graph["edges"][sid]:
+            if target not in dist:
+                dist[target] = dist[sid] + 1
+                queue.append(target)
+    return dist
+
+
+def prefetch_hints(graph: dict, source: int, limit: int = PREFETCH_LIMIT) -> list:
+    """先直接相邻、再两跳可达的场景，同一跳数内按导航顺序排列"""
+    dist = distances(graph, source, PREFETCH_HOPS)
+    ranked = sorted((hops, graph["position"][sid], sid) for sid, hops in dist.items() if hops > 0)
+    return [sid for _, _, sid in ranked[:limit]]
+
+
+def graph_for(db, project: models.Project) -> dict:
+    return get_graph(db, project.id, versioning.project_salt(project.created_at), project.version)
+
+
+def annotate_project(db, project: models.Project):
+    """ORM 加载的项目 (作品列表、新建项目) 同样给场景填上 prefetch，与 load_project_tree 的结果一致"""
+    graph = graph_for(db, project)
+    for group in project.groups:
+        for scene in group.scenes:
+            scene.prefetch = prefetch_hints(graph, scene.id)
+    return project
+
+
+def annotate(tree: dict):
+    """给项目树里的每个场景加上 prefetch，同时把图按项目版本缓存起来"""
+    graph = from_tree(tree)
+    for group in tree["groups"]:
+        for scene in group["scenes"]:
+            scene["prefetch"] = prefetch_hints(graph, scene["id"])
+    remember(tree["id"], versioning.project_salt(tree["created_at"]), tree["version"], graph)
+    return graph
@@ -0,0 +1,74 @@
+import base64
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+# 场景的低清占位：BlurHash (二三十个字符，列表里画模糊色块) 和一张很小的等距柱状预览图
+# (data URL，查看器先把它贴到球面上，原图下载完再替换)，都随项目数据一起下发，不用额外请求
+HASH_COMPONENTS = (4, 3)
+PREVIEW_WIDTH = int(os.getenv("PREVIEW_WIDTH", "64"))
+PREVIEW_SIZE = (PREVIEW_WIDTH, PREVIEW_WIDTH // 2)
+PREVIEW_QUALITY = 50
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(values: np.ndarray) -> np.ndarray:
+    v = values / 255.0
+    return np.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = min(max(value, 0.0), 1.0)
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(pixels: np.ndarray, components=HASH_COMPONENTS) -> str:
+    """按 BlurHash 规范编码 (https://github.com/woltapp/blurhash)，pixels 为 (高, 宽, 3) 的 uint8"""
+    cx, cy = components
+    height, width = pixels.shape[:2]
+    linear = _srgb_to_linear(pixels.astype(np.float64))
+    xs = np.arange(width) / width
+    ys = np.arange(height) / height
+    factors = []
+    for j in range(cy):
+        for i in range(cx):
+            basis = np.outer(np.cos(np.pi * j * ys), np.cos(np.pi * i * xs))
+            norm = 1.0 if i == 0 and j == 0 else 2.0
+            factors.append(norm * np.tensordot(basis, linear, axes=([0, 1], [0, 1])) / (width * height))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((cx - 1) + (cy - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(float(np.abs(ac).max()) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1.0
+    result += _base83(quantised_max, 1)
+    r, g, b = (_linear_to_srgb(c) for c in dc)
+    result += _base83((r << 16) + (g << 8) + b, 4)
+    for factor in ac:
+        q = [
+            max(0, min(18, int(np.sign(c) * abs(c / max_value) ** 0.5 * 9 + 9.5)))
+            for c in factor
+        ]
+        result += _base83(q[0] * 19 * 19 + q[1] * 19 + q[2], 2)
+    return result
+
+
+def from_panorama(pano: np.ndarray):
+    """由已解码的全景图 (RGB 数组) 生成 (BlurHash, 预览图 data URL)"""
+    preview = Image.fromarray(pano).resize(PREVIEW_SIZE, Image.BOX)
+    buf = io.BytesIO()
+    preview.save(buf, format="JPEG", quality=PREVIEW_QUALITY, optimize=True)
+    data_url = "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
+    # 编码只需要很少的像素，用预览图算即可
+    return blurhash(np.asarray(preview)), data_url
@@ -0,0 +1,157 @@
+import os
+import re
+import shutil
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select
+
+import loaders
+import models
+from static_files import versioned_url
+
+# 发布后的查看器清单：预先编译好的 JSON，公开访问时不需要查数据库
+PUBLISH_ROOT = "static/published"
+DEFAULT_ICON = "/static/icons/system/arrow.png"
+# 清单里出现的上传文件地址 (场景图、封面、缩略图、图标以及热点内容里的图片)
+_UPLOAD_URL_RE = re.compile(r"/static/uploads/[^\"'\s?#]+")
+_VERSION_FILE_RE = re.compile(r"^v(\d+)\.json$")
+
+VIEW_FIELDS = (
+    "initial_heading", "initial_pitch", "fov_min", "fov_max", "fov_default",
+    "limit_h_min", "limit_h_max", "limit_v_min", "limit_v_max",
+)
+
+
+def manifest_path(project_id: int, version: int = None) -> str:
+    name = "manifest.json" if version is None else f"v{version}.json"
+    return os.path.join(PUBLISH_ROOT, str(project_id), name)
+
+
+def _icon_resolver(db):
+    """热点里的 icon_url 可能是地址，也可能是早期数据里的系统图标名"""
+    system = {}
+    for name, url in db.query(models.HotspotIcon.name, models.HotspotIcon.url).filter(models.HotspotIcon.category == "system"):
+        system[name] = url
+        system.setdefault(os.path.splitext(name)[0], url)
+
+    def resolve(icon_url):
+        if icon_url and (icon_url.startswith("/") or icon_url.startswith("http")):
+            return versioned_url(icon_url)
+        return versioned_url(system.get(icon_url or "", DEFAULT_ICON))
+    return resolve
+
+
+def compile_manifest(db, project_id: int, owner_id: int):
+    """把项目编译成查看器需要的全部数据，项目不存在返回 None"""
+    tree = loaders.load_project_tree(db, project_id, owner_id)
+    if tree is None:
+        return None
+    resolve_icon = _icon_resolver(db)
+
+    ordered = [(group, scene) for group in tree["groups"] for scene in group["scenes"]]
+    scene_ids = {scene["id"] for _, scene in ordered}
+
+    scenes = []
+    for i, (group, scene) in enumerate(ordered):
+        neighbours = []
+        for h in scene["hotspots"]:
+            target = h["target_scene_id"]
+            if h["type"] == "scene" and target in scene_ids and target != scene["id"] and target not in neighbours:
+                neighbours.append(target)
+        scenes.append({
+            "id": scene["id"],
+            "name": scene["name"],
+            "group_id": group["id"],
+            "image_url": scene["image_url"],
+            "cover_url": scene["cover_url"],
+            "thumb_url": scene["thumb_url"],
+            "blurhash": scene["blurhash"],
+            "preview": scene["preview"],
+            "tiles": scene["tiles"],
+            "view": {k: scene[k] for k in VIEW_FIELDS},
+            "hotspots": [
+                {
+                    "id": h["id"], "x": h["x"], "y": h["y"], "z": h["z"],
+                    "text": h["text"], "type": h["type"], "content": h["content"],
+                    "target_scene_id": h["target_scene_id"] if h["target_scene_id"] in scene_ids else None,
+                    "icon_url": resolve_icon(h["icon_url"]),
+                    "scale": h["scale"], "use_fixed_size": h["use_fixed_size"],
+                }
+                for h in scene["hotspots"]
+            ],
+            "neighbours": neighbours,
+            "prefetch": scene["prefetch"],
+            "prev": ordered[i - 1][1]["id"] if i > 0 else None,
+            "next": ordered[i + 1][1]["id"] if i + 1 < len(ordered) else None,
+        })
+
+    return {
+        "id": tree["id"],
+        "name": tree["name"],
+        "category": tree["category"],
+        "cover_url": tree["cover_url"],
+        "version": tree["version"],
+        "published_at": datetime.now().isoformat(),
+        "groups": [{"id": g["id"], "name": g["name"], "scene_ids": [s["id"] for s in g["scenes"]]} for g in tree["groups"]],
+        "scenes": scenes,
+    }
+
+
+def write_manifest(manifest: dict):
+    """先写带版本号的文件，再原子替换 manifest.json，读者不会看到写了一半的文件"""
+    project_id, version = manifest["id"], manifest["version"]
+    payload = loaders.dump_json(manifest)
+    os.makedirs(os.path.dirname(manifest_path(project_id)), exist_ok=True)
+    for path in (manifest_path(project_id, version), manifest_path(project_id)):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+
+def unpublish(project_id: int):
+    shutil.rmtree(os.path.join(PUBLISH_ROOT, str(project_id)), ignore_errors=True)
+
+
+def _uploads_in(payload: str) -> list:
+    return sorted(set(_UPLOAD_URL_RE.findall(payload)))
+
+
+def pin_uploads(db, manifest: dict):
+    """
+    登记清单引用的上传文件 (storage.URL_COLUMNS 会把它们算作引用)，
+    要在写出清单之前提交，否则 sweeper 可能在两者之间把文件回收掉
+    """
+    PU = models.PublishedUpload
+    project_id, version = manifest["id"], manifest["version"]
+    db.execute(delete(PU).where(PU.project_id == project_id, PU.version == version))
+    urls = _uploads_in(loaders.dump_json(manifest).decode())
+    if urls:
+        db.execute(insert(PU), [{"project_id": project_id, "version": version, "url": url} for url in urls])
+
+
+def unpin_uploads(db, project_id: int):
+    db.execute(delete(models.PublishedUpload).where(models.PublishedUpload.project_id == project_id))
+
+
+def backfill_pins(db) -> int:
+    """升级前发布的清单没有登记过引用，启动时补一次；已有登记时直接跳过"""
+    PU = models.PublishedUpload
+    if db.scalar(select(PU.id).limit(1)) is not None:
+        return 0
+    existing = set(db.scalars(select(models.Project.id)))
+    rows = []
+    for entry in os.scandir(PUBLISH_ROOT) if os.path.isdir(PUBLISH_ROOT) else ():
+        if not (entry.is_dir() and entry.name.isdigit() and int(entry.name) in existing):
+            continue
+        for name in os.listdir(entry.path):
+            match = _VERSION_FILE_RE.match(name)
+            if not match:
+                continue
+            with open(os.path.join(entry.path, name), encoding="utf-8") as f:
+                urls = _uploads_in(f.read())
+            rows += [{"project_id": int(entry.name), "version": int(match.group(1)), "url": url} for url in urls]
+    if rows:
+        db.execute(insert(PU), rows)
+        db.commit()
+    return len(rows)
@@ -0,0 +1,90 @@
+import io
+import math
+
+import numpy as np
+from PIL import Image
+
+import tiles
+
+# 封面和缩略图的尺寸 (宽, 高)
+COVER_SIZE = (1280, 720)
+THUMB_SIZE = (384, 216)
+JPEG_QUALITY = 82
+
+# 俯仰角到 ±90° 时视线与"上"方向平行，无法确定画面朝向
+MAX_PITCH = 89.9
+
+
+def view_directions(width: int, height: int, heading: float, pitch: float, fov: float, row0: int, row1: int):
+    """
+    透视相机画面 [row0, row1) 行每个像素的视线方向，坐标系与 tiles 相同 (x 右, y 上, z 前)。
+    heading / pitch / fov 与 Scene.initial_* 相同，fov 为垂直视场角。
+    pitch 沿用编辑器和查看器保存的约定：轨道相机在水平面上方的角度 (90° - 极角)，
+    正值时视线朝下。所有调用方都直接传这个值，只在这里换算成视线的仰角
+    """
+    h = math.radians(heading)
+    p = -math.radians(max(-MAX_PITCH, min(MAX_PITCH, pitch)))
+    # 编辑器的球面网格做了 x 镜像，换算到 tiles 坐标系后 heading 0 对应原图 3/4 宽度处
+    forward = np.array([math.cos(p) * math.cos(h), math.sin(p), math.cos(p) * math.sin(h)], dtype=np.float32)
+    right = np.cross([0.0, 1.0, 0.0], forward).astype(np.float32)
+    right /= np.linalg.norm(right)
+    up = np.cross(forward, right)
+
+    tan_v = math.tan(math.radians(fov) / 2)
+    tan_h = tan_v * width / height
+    a = ((np.arange(width, dtype=np.float32) + 0.5) / width * 2 - 1) * tan_h
+    b = (1 - (np.arange(row0, row1, dtype=np.float32) + 0.5) / height * 2) * tan_v
+    a, b = np.broadcast_arrays(a[None, :], b[:, None])
+    return tuple(forward[i] + a * right[i] + b * up[i] for i in range(3))
+
+
+def render_view(pano: np.ndarray, size, heading: float, pitch: float, fov: float) -> Image.Image:
+    width, height = size
+    out = np.empty((height, width, 3), dtype=np.uint8)
+    for row0 in range(0, height, tiles.CHUNK_ROWS):
+        row1 = min(height, row0 + tiles.CHUNK_ROWS)
+        out[row0:row1] = tiles.sample_equirect(pano, *view_directions(width, height, heading, pitch, fov, row0, row1))
+    return Image.fromarray(out)
+
+
+def source_width(size, fov: float) -> int:
+    """输出画面每个像素约对应原图一个像素时所需的全景图宽度"""
+    width, height = size
+    hfov = 2 * math.atan(math.tan(math.radians(fov) / 2) * width / height)
+    return int(math.ceil(width * 2 * math.pi / max(hfov, 1e-3)))
+
+
+def load_panorama(path: str, min_width: int) -> np.ndarray:
+    """
+    读入全景图，只保留渲染需要的分辨率：JPEG 用 draft 在解码阶段按 1/2~1/8 缩小，
+    其它格式解码后再缩小，16K 原图渲染缩略图时不必完整解码
+    """
+    with Image.open(path) as im:
+        im.draft("RGB", (min_width, min_width // 2))
+        im = im.convert("RGB")
+        if im.width > min_width * 2:
+            im = im.resize((min_width, max(1, im.height * min_width // im.width)), Image.BILINEAR)
+        return np.asarray(im)
+
+
+def to_jpeg(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+
+def render_file(path: str, views):
+    """
+    同一张全景图按多个视角 / 尺寸渲染，只解码一次。
+    views: [(size, heading, pitch, fov), ...]，返回对应的 JPEG 字节
+    """
+    return render_panorama(load_panorama(path, panorama_width(views)), views)
+
+
+def panorama_width(views) -> int:
+    return max(source_width(size, fov) for size, _, _, fov in views)
+
+
+def render_panorama(pano: np.ndarray, views):
+    """已解码的全景图按多个视角渲染，返回 JPEG 字节"""
+    return [to_jpeg(render_view(pano, size, heading, pitch, fov)) for size, heading, pitch, fov in views]
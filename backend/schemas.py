@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, field_validator
+from typing import Dict, List, Optional
 from datetime import datetime
+from static_files import versioned_url
 
 # --- Auth ---
 class UserCreate(BaseModel):
@@ -22,11 +23,30 @@ class HotspotIconBase(BaseModel):
     url: str
     category: str
 
+class IconSprite(BaseModel):
+    url: str
+    frames: int
+    columns: int
+    rows: int
+    frame_width: int
+    frame_height: int
+    delays: List[int]  # 每帧时长 (毫秒)
+    duration: int
+    loop: int = 0  # 0 表示无限循环
+
 class HotspotIcon(HotspotIconBase):
     id: int
     owner_id: Optional[int] = None
+    sprite: Optional[IconSprite] = None  # 动图转码完成后才有值
     class Config: from_attributes = True
 
+    @field_validator("url")
+    @classmethod
+    def _versioned(cls, v): return versioned_url(v)
+
+class HotspotIconUpload(HotspotIcon):
+    job_id: Optional[int] = None  # 动图的精灵图转码任务
+
 # --- Hotspot ---
 class HotspotBase(BaseModel):
     x: float
@@ -59,14 +79,45 @@ class HotspotUpdate(BaseModel):
 
 class Hotspot(HotspotBase):
     id: int
+    sort_order: int = 0
     class Config: from_attributes = True
 
+class HotspotBatchUpdate(HotspotUpdate):
+    id: int
+
+# 一次请求里的新增 / 修改 / 删除，在同一个事务里执行
+class HotspotBatch(BaseModel):
+    create: List[HotspotCreate] = []
+    update: List[HotspotBatchUpdate] = []
+    delete: List[int] = []
+
+class HotspotBatchResult(BaseModel):
+    created_ids: List[int]  # 与 create 的顺序一致
+    updated_ids: List[int]
+    deleted_ids: List[int]
+    hotspots: List[Hotspot]  # 新增和修改后的热点
+
 # --- Scene ---
+class SceneTileLevel(BaseModel):
+    level: int
+    face_size: int
+    tiles: int  # 每个面每行/列的瓦片数
+
+class SceneTiles(BaseModel):
+    key: str
+    tile_size: int
+    faces: List[str]
+    levels: List[SceneTileLevel]
+    url: str  # 瓦片地址模板，含 {level} {face} {y} {x}
+
 class Scene(BaseModel):
     id: int
     name: str
     image_url: str
     cover_url: Optional[str] = None
+    thumb_url: Optional[str] = None
+    blurhash: Optional[str] = None
+    preview: Optional[str] = None  # data:image/jpeg;base64,...
     group_id: int
     hotspots: List[Hotspot] = []
     initial_heading: float
@@ -79,8 +130,18 @@ class Scene(BaseModel):
     limit_v_min: float
     limit_v_max: float
     sort_order: int = 0
+    tiles: Optional[SceneTiles] = None
+    prefetch: List[int] = []  # 建议预加载的场景：先直接相邻、再两跳可达，按导航顺序
     class Config: from_attributes = True
 
+    @field_validator("image_url", "cover_url", "thumb_url")
+    @classmethod
+    def _versioned(cls, v): return versioned_url(v)
+
+class SceneUpload(Scene):
+    job_id: Optional[int] = None  # 切片任务，完成后 tiles 才有值；未开启切片 (TILES_ENABLED) 时为空
+    thumb_job_id: Optional[int] = None  # 缩略图任务，完成后 thumb_url 才有值
+
 class SceneUpdate(BaseModel):
     name: Optional[str] = None
     initial_heading: Optional[float] = None
@@ -94,6 +155,12 @@ class SceneUpdate(BaseModel):
     limit_v_max: Optional[float] = None
     cover_url: Optional[str] = None
 
+# 服务端渲染封面用的视角，不传的字段取场景的初始视角
+class SceneView(BaseModel):
+    heading: Optional[float] = None
+    pitch: Optional[float] = None
+    fov: Optional[float] = None
+
 # --- Group ---
 class SceneGroupBase(BaseModel):
     name: str
@@ -118,13 +185,132 @@ class Project(ProjectBase):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     owner_id: Optional[int] = None
+    version: int = 0
+    published_version: Optional[int] = None
     class Config: from_attributes = True
 
+    @field_validator("cover_url")
+    @classmethod
+    def _versioned(cls, v): return versioned_url(v)
+
+# 增量同步：since 之后改动过的对象 (当前状态) 和删除的 id。
+# 分组不带 scenes、场景不带 hotspots，热点带上所属场景
+class HotspotChange(Hotspot):
+    source_scene_id: int
+
+class ProjectChangesDeleted(BaseModel):
+    groups: List[int] = []
+    scenes: List[int] = []  # 场景下的热点随场景一起删除
+    hotspots: List[int] = []
+
+class ProjectChanges(BaseModel):
+    project_id: int
+    since: int
+    version: int  # 应用之后客户端的版本号
+    reset: bool = False  # 日志里已经没有 since 之后的完整记录，客户端应重新加载整个项目
+    project: Optional[Project] = None
+    groups: List[SceneGroup] = []
+    scenes: List[Scene] = []
+    hotspots: List[HotspotChange] = []
+    deleted: ProjectChangesDeleted = ProjectChangesDeleted()
+
+class ProjectSummary(ProjectBase):
+    id: int
+    cover_url: Optional[str] = None  # 没有项目封面时取第一个场景的封面或原图
+    scene_count: int = 0
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    class Config: from_attributes = True
+
+    @field_validator("cover_url")
+    @classmethod
+    def _versioned(cls, v): return versioned_url(v)
+
+class ProjectSummaryPage(BaseModel):
+    items: List[ProjectSummary] = []
+    next_cursor: Optional[str] = None  # 为空表示没有下一页
+
+# --- 场景导航图 ---
+class SceneGraphNode(BaseModel):
+    id: int
+    neighbours: List[int]  # 热点直接跳转到的场景
+    prefetch: List[int]
+    distances: Dict[int, int]  # 可达场景 -> 跳数 (含自己 0)，不在其中的即不可达
+
+class ProjectGraph(BaseModel):
+    project_id: int
+    version: int
+    order: List[int]  # 导航顺序
+    scenes: List[SceneGraphNode]
+
+class ProjectCreated(Project):
+    job_ids: List[int] = []
+
+class ProjectImportResult(BaseModel):
+    project_id: int
+    groups: int
+    scenes: int
+    hotspots: int
+    icons: int  # 新加进图标库的自定义图标
+    files: int
+    job_ids: List[int] = []
+
+class PublishResult(BaseModel):
+    project_id: int
+    version: int
+    url: str  # 公开访问地址，始终指向最新发布的版本
+    version_url: str  # 固定版本的地址，内容不会变化
+    published_at: datetime
+
 class ProjectUpdate(BaseModel):
     name: Optional[str] = None
     category: Optional[str] = None
     cover_url: Optional[str] = None
 
+# --- Jobs ---
+class JobProgress(BaseModel):
+    id: int
+    status: str
+    progress: float
+    class Config: from_attributes = True
+
+class Job(JobProgress):
+    kind: str
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+# --- Image Variants ---
+class ImageVariant(BaseModel):
+    format: str
+    url: Optional[str] = None
+    bytes: int
+    width: int
+    height: int
+    decode_ms: float
+    class Config: from_attributes = True
+
+class ImageReportItem(BaseModel):
+    kind: str  # 'panorama' | 'cover' | 'thumb' | 'project_cover'
+    scene_id: Optional[int] = None
+    source_url: str
+    served_format: str
+    saved_bytes: int
+    variants: List[ImageVariant]
+
+class ImageReport(BaseModel):
+    project_id: int
+    formats: List[str]
+    original_bytes: int
+    served_bytes: int
+    saved_bytes: int
+    saved_ratio: float
+    original_decode_ms: float
+    served_decode_ms: float
+    images: List[ImageReportItem]
+    pending: List[str]
+
 # --- Utils ---
 class ImageBase64(BaseModel):
     image_data: str
\ No newline at end of file
@@ -0,0 +1,60 @@
+import io
+import math
+import os
+
+from PIL import Image, ImageSequence
+
+# 动图图标转成精灵图：所有帧按网格排在一张 PNG 里，前端按帧时长平移 UV 播放
+FRAME_MAX = int(os.getenv("SPRITE_FRAME_MAX", "256"))   # 单帧最长边
+SHEET_MAX = int(os.getenv("SPRITE_SHEET_MAX", "4096"))  # 整张图最长边，WebGL 普遍支持
+MAX_FRAMES = int(os.getenv("SPRITE_MAX_FRAMES", "256"))
+# 与浏览器和原来前端的 GifLoader 一致：帧时长为 0 时按 100ms 播放
+DEFAULT_DELAY_MS = 100
+
+
+def _frame_size(width: int, height: int, count: int):
+    """单帧尺寸：不超过 FRAME_MAX，并保证整张网格不超过 SHEET_MAX"""
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    scale = min(1.0, FRAME_MAX / max(width, height), SHEET_MAX / (columns * width), SHEET_MAX / (rows * height))
+    return max(1, int(width * scale)), max(1, int(height * scale)), columns, rows
+
+
+def transcode(path: str):
+    """
+    把动图解码成精灵图，返回 (PNG 字节, 清单)；只有一帧时返回 (None, 清单)。
+    每帧都是按 GIF 的 disposal 规则合成后的完整画面
+    """
+    with Image.open(path) as im:
+        width, height = im.size
+        frames, delays = [], []
+        for frame in ImageSequence.Iterator(im):
+            if len(frames) >= MAX_FRAMES:
+                break
+            frames.append(frame.convert("RGBA"))
+            delays.append(frame.info.get("duration") or DEFAULT_DELAY_MS)
+        loop = im.info.get("loop", 0)
+
+    if len(frames) <= 1:
+        return None, {"frames": len(frames)}
+
+    frame_w, frame_h, columns, rows = _frame_size(width, height, len(frames))
+    sheet = Image.new("RGBA", (columns * frame_w, rows * frame_h), (0, 0, 0, 0))
+    for i, frame in enumerate(frames):
+        if frame.size != (frame_w, frame_h):
+            frame = frame.resize((frame_w, frame_h), Image.LANCZOS)
+        sheet.paste(frame, ((i % columns) * frame_w, (i // columns) * frame_h))
+
+    buf = io.BytesIO()
+    sheet.save(buf, format="PNG", optimize=True)
+    manifest = {
+        "frames": len(frames),
+        "columns": columns,
+        "rows": rows,
+        "frame_width": frame_w,
+        "frame_height": frame_h,
+        "delays": delays,
+        "duration": sum(delays),
+        "loop": loop,  # 0 表示无限循环
+    }
+    return buf.getvalue(), manifest
@@ -0,0 +1,147 @@
+import contextlib
+import json
+import os
+import time
+
+from sqlalchemy import delete, func, insert, select
+
+import jobs
+import models
+import publish
+from database import SessionLocal, engine, sync_schema
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境只有单进程，不加锁
+    fcntl = None
+
+SYSTEM_ICON_DIR = "static/icons/system"
+ICON_EXTS = (".png", ".jpg", ".jpeg", ".gif", ".svg")
+# 上次同步时系统图标目录的清单 (文件名、大小、修改时间)，目录没变就不再扫描
+ICON_MANIFEST = "static/icons/.system_manifest.json"
+# 多个 worker 同时启动时只让一个做建表和同步
+LOCK_PATH = "static/.startup.lock"
+
+
+@contextlib.contextmanager
+def process_lock(path: str = LOCK_PATH):
+    """跨进程互斥锁 (flock)，进程退出时自动释放"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_manifest():
+    try:
+        with open(ICON_MANIFEST, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(manifest: dict):
+    tmp_path = ICON_MANIFEST + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, ICON_MANIFEST)
+
+
+def _scan(directory: str) -> dict:
+    """文件名 -> [大小, mtime_ns]，scandir 的 stat 结果大多来自目录项本身"""
+    files = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.lower().endswith(ICON_EXTS) and entry.is_file():
+                st = entry.stat()
+                files[entry.name] = [st.st_size, st.st_mtime_ns]
+    return files
+
+
+def _system_icon_count(db) -> int:
+    return db.scalar(select(func.count(models.HotspotIcon.id)).where(models.HotspotIcon.category == "system"))
+
+
+def _up_to_date(db, manifest, dir_mtime_ns: int) -> bool:
+    # 增删文件都会改变目录的 mtime；数据库被换掉时条数对不上，也要重新同步
+    return (
+        manifest is not None
+        and manifest.get("dir_mtime_ns") == dir_mtime_ns
+        and _system_icon_count(db) == len(manifest.get("files", {}))
+    )
+
+
+def sync_system_icons(db) -> dict:
+    """
+    按目录清单增量同步系统图标：目录未变化时只 stat 一次目录、查一次条数；
+    有变化时只插入新增、删除缺失的文件对应的记录
+    """
+    os.makedirs(SYSTEM_ICON_DIR, exist_ok=True)
+    # 先取目录 mtime 再扫描：扫描期间若有变动，下次启动时 mtime 对不上会重新扫描
+    dir_mtime_ns = os.stat(SYSTEM_ICON_DIR).st_mtime_ns
+    manifest = _read_manifest()
+    if _up_to_date(db, manifest, dir_mtime_ns):
+        return {"scanned": False, "added": 0, "removed": 0, "changed": 0}
+
+    disk = _scan(SYSTEM_ICON_DIR)
+    Icon = models.HotspotIcon
+    db_names = set(db.scalars(select(Icon.name).where(Icon.category == "system")))
+    to_add = sorted(disk.keys() - db_names)
+    to_delete = sorted(db_names - disk.keys())
+    old_files = (manifest or {}).get("files", {})
+    changed = sum(1 for name, meta in disk.items() if name in old_files and old_files[name] != meta)
+
+    if to_add:
+        db.execute(insert(Icon), [
+            {"name": name, "url": f"/static/icons/system/{name}", "category": "system", "owner_id": None}
+            for name in to_add
+        ])
+    if to_delete:
+        for name in to_delete:
+            print(f"检测到文件缺失，正在从数据库移除: {name}")
+        db.execute(delete(Icon).where(Icon.category == "system", Icon.name.in_(to_delete)))
+    db.commit()
+    _write_manifest({"dir_mtime_ns": dir_mtime_ns, "files": disk})
+    return {"scanned": True, "added": len(to_add), "removed": len(to_delete), "changed": changed}
+
+
+def enqueue_missing_sprites(db) -> int:
+    """
+    还没转码过的 GIF 图标 (升级前上传的、新同步进来的系统图标) 登记精灵图任务，
+    随后由 jobs.recover_jobs 统一派发；已在排队的不重复登记
+    """
+    Icon, Job = models.HotspotIcon, models.Job
+    queued = {
+        json.loads(params or "{}").get("icon_id")
+        for params, in db.query(Job.params).filter(Job.kind == "sprite", Job.status.in_(("pending", "running")))
+    }
+    missing = [
+        icon_id for icon_id, in db.query(Icon.id).filter(Icon.sprite_manifest.is_(None), func.lower(Icon.url).like("%.gif"))
+        if icon_id not in queued
+    ]
+    for icon_id in missing:
+        jobs.create_job(db, "sprite", icon_id=icon_id)
+    db.commit()
+    return len(missing)
+
+
+def run():
+    """建表 / 补列和系统图标同步，多进程启动时串行执行，后来者只做一次廉价的检查"""
+    started = time.perf_counter()
+    with process_lock():
+        sync_schema(engine)
+        with SessionLocal() as db:
+            result = sync_system_icons(db)
+            result["sprite_jobs"] = enqueue_missing_sprites(db)
+            result["published_pins"] = publish.backfill_pins(db)
+    if result["scanned"]:
+        print(f"✅ 系统图标同步完成：新增 {result['added']} 个，删除 {result['removed']} 个，修改 {result['changed']} 个")
+    else:
+        print("系统图标已是最新 (无变动)")
+    print(f"启动初始化耗时 {(time.perf_counter() - started) * 1000:.1f} ms")
+    return result
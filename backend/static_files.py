@@ -0,0 +1,146 @@
+import hashlib
+import os
+import re
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+STATIC_DIR = "static"
+
+# 内容不会变的资源缓存一年；其余资源每次都带 ETag 回源验证，未变化返回 304
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# 内容寻址存储的文件: uploads/<xx>/<sha256>.<ext>
+_BLOB_RE = re.compile(r"^uploads/[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]+$")
+
+# 原图的更小编码 variants/<xx>/<sha256>.<格式>，按优先级排列，由 variants.py 生成
+VARIANT_FORMATS = (("avif", "image/avif"), ("webp", "image/webp"))
+_NEGOTIABLE_RE = re.compile(r"\.(jpg|png|webp)$")
+
+
+def blob_digest(url):
+    """内容寻址文件的 sha256，其它地址返回 None"""
+    if not url or not url.startswith("/static/"):
+        return None
+    blob = _BLOB_RE.match(url[len("/static/"):])
+    return blob.group(1) if blob else None
+
+
+def variant_rel(digest: str, fmt: str) -> str:
+    return f"variants/{digest[:2]}/{digest}.{fmt}"
+
+
+def variant_marker_rel(digest: str) -> str:
+    """原图的变体处理完成 (不论是否保留了更小的编码) 后写的空文件"""
+    return f"variants/{digest[:2]}/{digest}.done"
+
+
+def accepted_types(accept: str) -> set:
+    """Accept 里明确列出且 q > 0 的类型；通配符不算，只有明确声明支持的浏览器才换格式"""
+    types = set()
+    for part in (accept or "").split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0 and "*" not in media_type:
+            types.add(media_type.lower())
+    return types
+
+
+def file_version(stat_result: os.stat_result) -> str:
+    return hashlib.md5(f"{stat_result.st_mtime_ns}-{stat_result.st_size}".encode()).hexdigest()[:12]
+
+
+def versioned_url(url):
+    """
+    给 /static 下的地址加上版本号，内容变化时 URL 跟着变，前端不用再拼时间戳。
+    内容寻址的文件名本身就是版本，不需要处理。
+    """
+    if not url or not url.startswith("/static/") or "?" in url:
+        return url
+    rel = url[len("/static/"):]
+    if _BLOB_RE.match(rel):
+        return url
+    try:
+        stat_result = os.stat(os.path.join(STATIC_DIR, rel))
+    except OSError:
+        return url
+    return f"{url}?v={file_version(stat_result)}"
+
+
+def cached_file_response(path, stat_result, request_headers: Headers, cache_control: str,
+                         etag: str = None, media_type: str = None, status_code: int = 200, vary: str = None):
+    """
+    带缓存策略的文件响应：ETag/304、Range 分段以及服务器支持时的 pathsend 零拷贝
+    都由 starlette 的 FileResponse 处理
+    """
+    headers = {"cache-control": cache_control}
+    if etag:
+        headers["etag"] = f'"{etag}"'
+    if vary:
+        headers["vary"] = vary
+    response = FileResponse(path, status_code=status_code, stat_result=stat_result, headers=headers, media_type=media_type)
+    if _is_not_modified(response.headers, request_headers):
+        return NotModifiedResponse(response.headers)
+    return response
+
+
+def _is_not_modified(response_headers, request_headers) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return if_none_match.strip() == "*" or response_headers["etag"] in tags
+    return False
+
+
+class CachedStaticFiles(StaticFiles):
+    """按资源是否带版本决定缓存策略的 /static 挂载"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        path = self.get_path(scope).replace(os.sep, "/")
+        query = QueryParams(scope.get("query_string", b""))
+        blob = _BLOB_RE.match(path)
+
+        if blob and _NEGOTIABLE_RE.search(path):
+            return self._negotiated_response(full_path, stat_result, scope, blob.group(1), status_code)
+
+        # 瓦片、图集页和格式变体的路径都由内容决定
+        if blob or path.startswith(("tiles/", "atlas/", "variants/")) or query.get("v") == file_version(stat_result):
+            cache_control = IMMUTABLE
+        else:
+            cache_control = REVALIDATE
+        # 内容哈希本身就是强 ETag；其它文件沿用 starlette 基于 mtime/size 的 ETag
+        etag = blob.group(1) if blob else None
+        return cached_file_response(full_path, stat_result, Headers(scope=scope), cache_control,
+                                    etag=etag, status_code=status_code)
+
+    def _negotiated_response(self, full_path, stat_result, scope, digest: str, status_code: int):
+        """
+        原图按 Accept 换成已生成的 AVIF / WebP，URL 不变。无论是否换了格式都带 Vary: Accept，
+        否则共享缓存可能把 WebP 发给不支持的客户端。
+        变体还没生成完时每次回源验证，否则刚上传就被访问的原图会被浏览器缓存一年、再也换不成变体
+        """
+        request_headers = Headers(scope=scope)
+        settled = os.path.exists(os.path.join(STATIC_DIR, variant_marker_rel(digest)))
+        cache_control = IMMUTABLE if settled else REVALIDATE
+        accepted = accepted_types(request_headers.get("accept"))
+        for fmt, media_type in VARIANT_FORMATS:
+            if media_type not in accepted:
+                continue
+            variant_path = os.path.join(STATIC_DIR, variant_rel(digest, fmt))
+            try:
+                variant_stat = os.stat(variant_path)
+            except OSError:
+                continue
+            return cached_file_response(variant_path, variant_stat, request_headers, cache_control,
+                                        etag=f"{digest}.{fmt}", media_type=media_type,
+                                        status_code=status_code, vary="Accept")
+        return cached_file_response(full_path, stat_result, request_headers, cache_control,
+                                    etag=digest, status_code=status_code, vary="Accept")
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import time
+from collections import namedtuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+import metrics
+import models
+
+# 内容寻址存储：文件名就是内容的 sha256，相同内容只存一份，URL 永不变化
+UPLOAD_ROOT = "static/uploads"
+CHUNK_SIZE = 1024 * 1024
+
+# 上传限制，可通过环境变量调整
+MAX_UPLOAD_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "200")) * 1024 * 1024)
+MAX_ICON_BYTES = int(float(os.getenv("UPLOAD_ICON_MAX_MB", "5")) * 1024 * 1024)
+MAX_REQUEST_BYTES = int(float(os.getenv("UPLOAD_MAX_REQUEST_MB", "4096")) * 1024 * 1024)
+# 项目导入的请求体是整个归档，单独设上限 (默认 64 GB)
+MAX_IMPORT_BYTES = int(float(os.getenv("UPLOAD_MAX_IMPORT_MB", "65536")) * 1024 * 1024)
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+
+SCENE_TYPES = {"image/jpeg", "image/png", "image/webp"}
+ICON_TYPES = {"image/png", "image/jpeg", "image/gif", "image/svg+xml"}
+
+_EXT_RE = re.compile(r"^\.[a-z0-9]{1,8}$")
+
+StoredBlob = namedtuple("StoredBlob", ["url", "digest", "size", "created"])
+
+# 所有可能引用上传文件的列 (包括已发布清单登记的文件)。文件只由 sweeper 按这份清单计数回收：
+# 请求里换下来的旧文件不直接删，并发的上传可能正因去重重新引用它
+URL_COLUMNS = (
+    models.Scene.image_url,
+    models.Scene.cover_url,
+    models.Scene.thumb_url,
+    models.Project.cover_url,
+    models.HotspotIcon.url,
+    models.HotspotIcon.sprite_url,
+    models.Hotspot.icon_url,
+    models.PublishedUpload.url,
+)
+
+
+def normalize_ext(filename: str) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".jpeg":
+        ext = ".jpg"
+    return ext if _EXT_RE.match(ext) else ""
+
+
+def blob_path(digest: str, ext: str) -> str:
+    return os.path.join(UPLOAD_ROOT, digest[:2], digest + ext)
+
+
+def _commit(tmp_path: str, digest: str, ext: str, size: int) -> StoredBlob:
+    path = blob_path(digest, ext)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    created = not os.path.exists(path)
+    if created:
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+        # 刷新修改时间：sweeper 只回收超过宽限期的文件，刚被重新上传、即将被引用的不会误删
+        os.utime(path)
+    return StoredBlob("/" + path.replace(os.sep, "/"), digest, size, created)
+
+
+def save_stream(fileobj, filename: str) -> StoredBlob:
+    """边拷贝边计算哈希，写到临时文件后按哈希改名；已存在则丢弃临时文件"""
+    os.makedirs(UPLOAD_ROOT, exist_ok=True)
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_ROOT, prefix=".incoming-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                h.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return _commit(tmp_path, h.hexdigest(), normalize_ext(filename), size)
+
+
+def _write_chunk(out, h, chunk: bytes):
+    h.update(chunk)
+    out.write(chunk)
+
+
+async def save_upload(upload, allowed_types=None, max_bytes: int = MAX_UPLOAD_BYTES, kind: str = "scene") -> StoredBlob:
+    """
+    异步分块写入：每块的哈希和磁盘写入放到线程池里，不阻塞事件循环。
+    类型不允许返回 415，超过大小限制返回 413，已写的临时文件会删掉
+    """
+    if allowed_types and upload.content_type not in allowed_types:
+        raise HTTPException(status_code=415, detail=f"Unsupported file type: {upload.content_type}")
+    started = time.perf_counter()
+    os.makedirs(UPLOAD_ROOT, exist_ok=True)
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_ROOT, prefix=".incoming-")
+    out = os.fdopen(fd, "wb")
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File too large: {upload.filename}")
+            await run_in_threadpool(_write_chunk, out, h, chunk)
+        out.close()
+    except BaseException:
+        out.close()
+        os.remove(tmp_path)
+        raise
+    blob = await run_in_threadpool(_commit, tmp_path, h.hexdigest(), normalize_ext(upload.filename), size)
+    metrics.record_upload(kind, size, time.perf_counter() - started)
+    return blob
+
+
+async def save_uploads(uploads, allowed_types=None, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    多个文件并发写入 (最多 UPLOAD_CONCURRENCY 个同时进行)，结果与输入顺序一致。
+    一个失败 (类型不对、超限) 就取消其余的，它们写了一半的临时文件随之删除
+    """
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def one(upload):
+        async with semaphore:
+            return await save_upload(upload, allowed_types, max_bytes)
+    tasks = [asyncio.ensure_future(one(u)) for u in uploads]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def save_bytes(data: bytes, ext: str) -> StoredBlob:
+    os.makedirs(UPLOAD_ROOT, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_ROOT, prefix=".incoming-")
+    with os.fdopen(fd, "wb") as out:
+        out.write(data)
+    return _commit(tmp_path, hashlib.sha256(data).hexdigest(), normalize_ext("x" + ext), len(data))
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Content-Length 超限的请求在读取请求体之前直接返回 413。
+    分块上传没有 Content-Length，Content-Length 也可能与实际不符，所以 receive 再按实际收到的字节数计数，
+    超限时在解析表单、写临时文件的途中抛出 413，不会先把整个请求体收进 UploadFile。
+    path_limits 给个别路径 (项目导入) 单独的上限，其余路径用 max_bytes，不传时取 MAX_REQUEST_BYTES
+    """
+
+    def __init__(self, app, max_bytes: int = None, path_limits: dict = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes or MAX_REQUEST_BYTES)
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > max_bytes:
+                response = JSONResponse(status_code=413, content={"detail": "Request too large"})
+                return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise HTTPException(status_code=413, detail="Request too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
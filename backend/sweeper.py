@@ -0,0 +1,269 @@
+import asyncio
+import os
+import re
+import shutil
+import time
+import traceback
+from collections import Counter
+
+from sqlalchemy import delete, func, or_, select, update
+from starlette.concurrency import run_in_threadpool
+
+import changes
+import models
+import storage
+import tiles
+import variants
+import versioning
+from database import SessionLocal
+from static_files import STATIC_DIR, blob_digest, variant_marker_rel
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境只有单进程，不加锁
+    fcntl = None
+
+# 引用计数式的垃圾回收：删掉已经不属于任何项目的孤儿记录，以及没有任何记录引用的
+# 上传文件、格式变体和瓦片目录。后台每轮只处理一部分分片，单轮耗时有上限
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL_S", "300"))  # 0 表示关闭后台清理
+SWEEP_BATCH = int(os.getenv("SWEEP_BATCH", "500"))  # 每轮每张表最多删除的行数
+SHARDS_PER_PASS = int(os.getenv("SWEEP_SHARDS_PER_PASS", "16"))  # 256 个分片，默认 16 轮扫完一遍
+# 刚写入磁盘、记录还没提交的文件不能删，只回收修改时间早于宽限期的文件
+GRACE_SECONDS = float(os.getenv("SWEEP_GRACE_S", "3600"))
+LOCK_PATH = "static/.sweep.lock"
+VARIANT_ROOT = os.path.join(STATIC_DIR, "variants")
+SHARDS = [f"{i:02x}" for i in range(256)]
+SAMPLE_SIZE = 20
+
+_UPLOAD_URL_RE = re.compile(r"/static/uploads/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+")
+
+# 后台清理的进度，单个进程内有效
+state = {"cursor": 0, "passes": 0, "last_pass": None}
+
+
+def _orphan_queries():
+    P, G, S, H = models.Project, models.SceneGroup, models.Scene, models.Hotspot
+    return (
+        (G, select(G.id).where(or_(G.project_id.is_(None), ~select(P.id).where(P.id == G.project_id).exists()))),
+        (S, select(S.id).where(or_(S.group_id.is_(None), ~select(G.id).where(G.id == S.group_id).exists()))),
+        (H, select(H.id).where(or_(H.source_scene_id.is_(None), ~select(S.id).where(S.id == H.source_scene_id).exists()))),
+    )
+
+
+def sweep_rows(db, dry_run: bool, limit):
+    """
+    外键级联生效之前 (批量删除绕过了 ORM 级联、SQLite 没开外键检查) 留下的孤儿记录。
+    先删分组，数据库级联会带走其下的场景和热点。dry_run 时只执行查询统计，
+    不会拿到 SQLite 的写锁；孤儿分组下的场景要等分组真正删除后才会被计入
+    """
+    report = {}
+    for model, query in _orphan_queries():
+        ids = db.scalars(query.limit(limit) if limit else query).all()
+        report[model.__tablename__] = len(ids)
+        if ids and not dry_run:
+            db.execute(delete(model).where(model.id.in_(ids)))
+
+    # 指向已删除场景的跳转热点改为不跳转
+    H, S, G = models.Hotspot, models.Scene, models.SceneGroup
+    dangling = select(H.id).where(H.target_scene_id.is_not(None), ~select(S.id).where(S.id == H.target_scene_id).exists())
+    ids = db.scalars(dangling.limit(limit) if limit else dangling).all()
+    report["dangling_targets"] = len(ids)
+    if ids and not dry_run:
+        projects = versioning.projects_by_hotspot(db, ids)
+        db.execute(update(H).where(H.id.in_(ids)).values(target_scene_id=None))
+        versioning.bump_version(db, *projects.values())
+        changes.record_hotspots(db, projects)
+
+    # 变更日志每个项目只保留最近的若干个版本，更早的客户端会整体重新加载。
+    # 同一个版本的记录必须一起删，不按 limit 分批
+    PC, P = models.ProjectChange, models.Project
+    current = select(P.version).where(P.id == PC.project_id).scalar_subquery()
+    expired = PC.version <= current - changes.RETAIN_VERSIONS
+    if dry_run:
+        report["project_changes"] = db.scalar(select(func.count(PC.id)).where(expired))
+    else:
+        report["project_changes"] = db.execute(
+            delete(PC).where(expired), execution_options={"synchronize_session": False}
+        ).rowcount
+
+    # 原图已经没人引用的格式变体记录 (原图文件随后按文件回收)
+    IV = models.ImageVariant
+    unreferenced = select(IV.source_url).distinct().where(
+        *(~select(col).where(col == IV.source_url).exists() for col in storage.URL_COLUMNS)
+    )
+    urls = db.scalars(unreferenced.limit(limit) if limit else unreferenced).all()
+    report["image_variants"] = len(urls)
+    if not dry_run:
+        for url in urls:
+            variants.discard(db, url)
+    return report
+
+
+def _referenced_uploads(db) -> Counter:
+    """上传文件的引用计数：各 URL 列 + 热点内容 (图片、视频热点) 里出现的地址"""
+    refs = Counter()
+    for col in storage.URL_COLUMNS:
+        for url, in db.query(col).filter(col.like("/static/uploads/%")):
+            refs[url] += 1
+    H = models.Hotspot
+    for content, in db.query(H.content).filter(H.content.like("%/static/uploads/%")):
+        refs.update(_UPLOAD_URL_RE.findall(content))
+    return refs
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class _Reclaim:
+    """一类待回收文件的统计；dry_run 时只统计不删除"""
+
+    def __init__(self, dry_run: bool):
+        self.dry_run = dry_run
+        self.count = 0
+        self.bytes = 0
+        self.sample = []
+
+    def add(self, url: str, path: str, is_dir: bool = False):
+        size = _tree_size(path) if is_dir else os.path.getsize(path)
+        if not self.dry_run:
+            try:
+                if is_dir:
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                print(f"文件删除失败: {e}")
+                return
+        self.count += 1
+        self.bytes += size
+        if len(self.sample) < SAMPLE_SIZE:
+            self.sample.append(url)
+
+    def report(self) -> dict:
+        return {"count": self.count, "bytes": self.bytes, "sample": self.sample}
+
+
+def _expired(entry, cutoff: float) -> bool:
+    return entry.stat().st_mtime < cutoff
+
+
+def _scan_dir(path: str):
+    try:
+        with os.scandir(path) as it:
+            return list(it)
+    except OSError:
+        return []
+
+
+def sweep_files(db, dry_run: bool, shards):
+    """按分片扫描磁盘，回收引用计数为 0 且超过宽限期的文件"""
+    cutoff = time.time() - GRACE_SECONDS
+    uploads, variant_files, tile_dirs, temp_files = (_Reclaim(dry_run) for _ in range(4))
+
+    refs = _referenced_uploads(db)
+    variant_urls = {url for url, in db.query(models.ImageVariant.url).filter(models.ImageVariant.url.like("/static/variants/%"))}
+    # 变体处理完成的标记文件，原图还有变体记录就保留
+    variant_urls.update(
+        "/static/" + variant_marker_rel(digest)
+        for digest in (blob_digest(url) for url, in db.query(models.ImageVariant.source_url).distinct())
+        if digest
+    )
+    tile_keys = {tiles.tile_key(url) for url, in db.query(models.Scene.image_url).distinct() if url}
+
+    for shard in shards:
+        for entry in _scan_dir(os.path.join(storage.UPLOAD_ROOT, shard)):
+            url = f"/static/uploads/{shard}/{entry.name}"
+            if entry.is_file() and not refs[url] and _expired(entry, cutoff):
+                uploads.add(url, entry.path)
+                if not dry_run:
+                    variants.discard(db, url)
+        for entry in _scan_dir(os.path.join(VARIANT_ROOT, shard)):
+            url = f"/static/variants/{shard}/{entry.name}"
+            if entry.is_file() and url not in variant_urls and _expired(entry, cutoff):
+                variant_files.add(url, entry.path)
+
+    # 瓦片目录名是原图 URL 的 sha1，也按前两位分片
+    shard_set = set(shards)
+    for entry in _scan_dir(tiles.TILE_ROOT):
+        if entry.name[:2] in shard_set and entry.is_dir() and entry.name not in tile_keys and _expired(entry, cutoff):
+            tile_dirs.add(f"/tiles/{entry.name}", entry.path, is_dir=True)
+
+    # 中断的上传留下的临时文件，每扫完一遍清一次
+    if SHARDS[0] in shard_set:
+        for entry in _scan_dir(storage.UPLOAD_ROOT):
+            if entry.name.startswith(".incoming-") and entry.is_file() and _expired(entry, cutoff):
+                temp_files.add(f"/static/uploads/{entry.name}", entry.path)
+
+    return {
+        "uploads": uploads.report(),
+        "variants": variant_files.report(),
+        "tiles": tile_dirs.report(),
+        "temp": temp_files.report(),
+    }
+
+
+def sweep(db, dry_run: bool = False, shards=None, limit=SWEEP_BATCH) -> dict:
+    """清理一轮；shards 为空时扫描全部分片。dry_run 只用查询报告将会删除的内容"""
+    started = time.perf_counter()
+    shards = list(shards or SHARDS)
+    rows = sweep_rows(db, dry_run, limit)
+    # 先提交删掉的孤儿记录，它们引用的文件在同一轮里就能回收
+    if not dry_run:
+        db.commit()
+    files = sweep_files(db, dry_run, shards)
+    if dry_run:
+        # 只读事务，结束掉即可
+        db.rollback()
+    else:
+        db.commit()
+    return {
+        "dry_run": dry_run,
+        "shards": len(shards),
+        "grace_seconds": GRACE_SECONDS,
+        "limit": limit,  # 每张表统计 / 删除的行数上限，为空表示不限
+        "rows": rows,
+        "files": files,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def sweep_next():
+    """后台的一轮：接着上次的分片继续；别的进程正在清理时跳过"""
+    os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+    with open(LOCK_PATH, "a") as lock:
+        if fcntl:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+        start = state["cursor"]
+        shards = SHARDS[start:start + SHARDS_PER_PASS]
+        with SessionLocal() as db:
+            report = sweep(db, shards=shards)
+        state["cursor"] = (start + len(shards)) % len(SHARDS)
+        state["passes"] += 1
+        state["last_pass"] = report
+    removed = sum(report["rows"].values()) + sum(f["count"] for f in report["files"].values())
+    if removed:
+        freed = sum(f["bytes"] for f in report["files"].values())
+        print(f"🧹 清理完成：删除 {removed} 项，释放 {freed / 1024 / 1024:.1f} MB")
+    return report
+
+
+async def run_periodically():
+    if SWEEP_INTERVAL <= 0:
+        return
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            await run_in_threadpool(sweep_next)
+        except Exception:
+            traceback.print_exc()
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def workdir(monkeypatch):
+    """数据库和 static 都是相对路径，切到临时目录，测试数据不会写进真实的 panorama.db"""
+    path = tempfile.mkdtemp(prefix="panorama-test-")
+    monkeypatch.chdir(path)
+    return path
+
+
+@pytest.fixture
+def client(workdir, monkeypatch):
+    """已登录用户 u 的 TestClient"""
+    monkeypatch.setenv("BCRYPT_ROUNDS", "4")
+    import jobs
+    # 切片等任务不派发到进程池
+    monkeypatch.setattr(jobs, "start", lambda job_id: None)
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as c:
+        c.post("/auth/register", json={"username": "u", "password": "p"})
+        token = c.post("/auth/login", json={"username": "u", "password": "p"}).json()["access_token"]
+        c.headers["Authorization"] = f"Bearer {token}"
+        yield c
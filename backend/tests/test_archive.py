@@ -0,0 +1,86 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+
+def _panorama() -> bytes:
+    pixels = (np.random.default_rng(0).random((128, 256, 3)) * 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=95)
+    return buf.getvalue()
+
+
+def test_import_accepts_body_over_general_request_limit(client, monkeypatch):
+    import storage
+    project = client.post(
+        "/projects/create_full/", data={"name": "tour", "category": "x"},
+        files=[("files", ("a.jpg", _panorama(), "image/jpeg"))],
+    ).json()
+    archive = client.get(f"/projects/{project['id']}/export").content
+
+    # 通用上限比归档小：其它上传接口被拒，导入接口不受影响
+    monkeypatch.setattr(storage, "MAX_REQUEST_BYTES", len(archive) // 2)
+    rejected = client.post("/projects/create_full/", content=archive, headers={"Content-Type": "application/octet-stream"})
+    assert rejected.status_code == 413
+
+    imported = client.post("/projects/import", content=archive)
+    assert imported.status_code == 200, imported.text
+    assert imported.json()["scenes"] == 1
+
+
+def test_import_enforces_its_own_limit(client, monkeypatch):
+    import storage
+    monkeypatch.setattr(storage, "MAX_IMPORT_BYTES", 1024)
+    # 不带 Content-Length 的分块请求也按实际字节数限制
+    response = client.post("/projects/import", content=iter([b"\0" * 4096]))
+    assert response.status_code == 413
+
+
+def _manifest_archive(manifest: dict) -> bytes:
+    import json
+    import tarfile
+    data = json.dumps(manifest).encode()
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        info = tarfile.TarInfo("project.json")
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def test_import_drops_local_paths_not_in_archive(client, monkeypatch):
+    with open("victim.txt", "w") as f:
+        f.write("keep me")
+    manifest = {
+        "format": "panorama-project", "version": 1,
+        "project": {"name": "evil", "category": "x", "cover_url": "/victim.txt"},
+        "groups": [{"id": 1, "name": "g"}],
+        "scenes": [{"id": 1, "group_id": 1, "name": "s", "image_url": "/victim.txt",
+                    "cover_url": "/static/uploads/00/" + "0" * 64 + ".jpg", "thumb_url": "/../victim.txt"}],
+        "hotspots": [{"source_scene_id": 1, "target_scene_id": None, "icon_type": "system",
+                      "icon_url": "/static/icons/system/arrow.png", "content": "/victim.txt"}],
+        "icons": [{"name": "i", "url": "/victim.txt", "sprite_url": "/victim.txt"}],
+        "files": {},
+    }
+    imported = client.post("/projects/import", content=_manifest_archive(manifest))
+    assert imported.status_code == 200, imported.text
+    assert imported.json()["icons"] == 0
+
+    project = client.get(f"/projects/{imported.json()['project_id']}").json()
+    assert project["cover_url"] is None
+    scene = project["groups"][0]["scenes"][0]
+    assert (scene["image_url"], scene["cover_url"], scene["thumb_url"]) == (None, None, None)
+    hotspot = scene["hotspots"][0]
+    assert hotspot["icon_url"] == "/static/icons/system/arrow.png"
+    assert hotspot["content"] is None
+    assert all(icon["url"] != "/victim.txt" for icon in client.get("/icons/").json())
+
+    # 回收文件只扫内容寻址存储
+    import sweeper
+    from database import SessionLocal
+    monkeypatch.setattr(sweeper, "GRACE_SECONDS", 0)
+    with SessionLocal() as db:
+        sweeper.sweep(db)
+    with open("victim.txt") as f:
+        assert f.read() == "keep me"
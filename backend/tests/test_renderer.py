@@ -0,0 +1,34 @@
+import numpy as np
+
+import renderer
+
+SIZE = (160, 90)
+
+
+def _top_bottom_panorama():
+    """上半部分红色、下半部分蓝色的等距柱状图"""
+    pano = np.zeros((256, 512, 3), dtype=np.uint8)
+    pano[:128, :, 0] = 255
+    pano[128:, :, 2] = 255
+    return pano
+
+
+def _mean(image):
+    return np.asarray(image, dtype=np.float32).reshape(-1, 3).mean(axis=0)
+
+
+def test_positive_pitch_looks_down():
+    # 与编辑器、查看器保存的 initial_pitch 一致：正值为相机在水平面上方，视线朝下
+    r, _, b = _mean(renderer.render_view(_top_bottom_panorama(), SIZE, 0, 30, 60))
+    assert b > 200 and r < 50
+
+
+def test_negative_pitch_looks_up():
+    r, _, b = _mean(renderer.render_view(_top_bottom_panorama(), SIZE, 0, -30, 60))
+    assert r > 200 and b < 50
+
+
+def test_level_view_splits_at_horizon():
+    image = np.asarray(renderer.render_view(_top_bottom_panorama(), SIZE, 0, 0, 60))
+    assert image[0, SIZE[0] // 2, 0] > 200
+    assert image[-1, SIZE[0] // 2, 2] > 200
@@ -0,0 +1,26 @@
+import os
+
+
+def _multipart(boundary: str, size: int):
+    """不带 Content-Length 的分块请求体：name、category 和一个 size 字节的文件"""
+    yield (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"name\"\r\n\r\ntour\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"category\"\r\n\r\nx\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"a.jpg\"\r\n"
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode()
+    for _ in range(size // 4096):
+        yield b"\xff" * 4096
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def test_chunked_upload_over_request_limit(client, monkeypatch):
+    import storage
+    monkeypatch.setattr(storage, "MAX_REQUEST_BYTES", 64 * 1024)
+    response = client.post(
+        "/projects/create_full/", content=_multipart("b0undary", 256 * 1024),
+        headers={"Content-Type": "multipart/form-data; boundary=b0undary"},
+    )
+    assert response.status_code == 413
+    # 表单解析到一半就被拒绝，没有写进存储
+    assert not os.path.isdir(storage.UPLOAD_ROOT) or not os.listdir(storage.UPLOAD_ROOT)
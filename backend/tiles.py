@@ -0,0 +1,149 @@
+import hashlib
+import json
+import math
+import os
+import re
+
+import numpy as np
+from PIL import Image
+
+# 16K-24K 的全景图远超 Pillow 默认的"解压炸弹"像素阈值
+Image.MAX_IMAGE_PIXELS = None
+
+# 查看器目前整张加载原图，还没有读瓦片的渲染器；默认不切，省下每次上传的解码和磁盘。
+# 有了按视野加载瓦片的查看器后再打开
+ENABLED = os.getenv("TILES_ENABLED", "0") == "1"
+TILE_ROOT = "static/tiles"
+TILE_SIZE = 512
+TILE_QUALITY = 85
+
+# 立方体六个面：前/右/后/左/上/下 (前 = heading 0，右 = heading 90)
+FACES = ("f", "r", "b", "l", "u", "d")
+
+# 每次只投影这么多行，避免一次性为整个面生成坐标数组
+CHUNK_ROWS = 256
+
+_KEY_RE = re.compile(r"^[0-9a-f]{16,64}$")
+_TILE_RE = re.compile(r"^(\d+)_(\d+)\.jpg$")
+
+
+def tile_key(image_url: str) -> str:
+    """瓦片目录名，由原图 URL 决定，同一张图只切一次"""
+    return hashlib.sha1(image_url.encode("utf-8")).hexdigest()
+
+
+def tile_path(key: str, level: int, face: str, tile: str):
+    """校验瓦片请求参数并返回磁盘路径，非法参数返回 None"""
+    if not _KEY_RE.match(key) or face not in FACES or level < 0 or not _TILE_RE.match(tile):
+        return None
+    return os.path.join(TILE_ROOT, key, str(level), face, tile)
+
+
+def face_directions(face: str, size: int, row0: int, row1: int):
+    """面上 [row0, row1) 行每个像素中心对应的视线方向 (x 右, y 上, z 前)"""
+    coords = (np.arange(size, dtype=np.float32) + 0.5) / size * 2 - 1
+    a, b = np.broadcast_arrays(coords[None, :], coords[row0:row1, None])
+    one = np.ones_like(a)
+    if face == "f":
+        return a, -b, one
+    if face == "r":
+        return one, -b, -a
+    if face == "b":
+        return -a, -b, -one
+    if face == "l":
+        return -one, -b, a
+    if face == "u":
+        return a, one, b
+    if face == "d":
+        return a, -one, -b
+    raise ValueError(face)
+
+
+def sample_equirect(pano: np.ndarray, x, y, z) -> np.ndarray:
+    """按视线方向对等距柱状全景图做双线性采样，水平方向环绕"""
+    h, w = pano.shape[:2]
+    lon = np.arctan2(x, z)
+    lat = np.arctan2(y, np.hypot(x, z))
+    px = (lon / (2 * np.pi) + 0.5) * w - 0.5
+    py = np.clip((0.5 - lat / np.pi) * h - 0.5, 0, h - 1)
+
+    x0 = np.floor(px).astype(np.int64)
+    y0 = np.floor(py).astype(np.int64)
+    fx = (px - x0)[..., None]
+    fy = (py - y0)[..., None]
+    x1 = (x0 + 1) % w
+    x0 %= w
+    y1 = np.minimum(y0 + 1, h - 1)
+
+    top = pano[y0, x0] * (1 - fx) + pano[y0, x1] * fx
+    bottom = pano[y1, x0] * (1 - fx) + pano[y1, x1] * fx
+    out = top * (1 - fy) + bottom * fy
+    return np.clip(out + 0.5, 0, 255).astype(np.uint8)
+
+
+def render_face(pano: np.ndarray, face: str, size: int) -> Image.Image:
+    out = np.empty((size, size, 3), dtype=np.uint8)
+    for row0 in range(0, size, CHUNK_ROWS):
+        row1 = min(size, row0 + CHUNK_ROWS)
+        out[row0:row1] = sample_equirect(pano, *face_directions(face, size, row0, row1))
+    return Image.fromarray(out)
+
+
+def level_sizes(pano_width: int):
+    """各级立方体面边长，从小到大。最高级与原图赤道分辨率相当 (宽 / π)"""
+    top = max(TILE_SIZE, int(round(pano_width / math.pi / TILE_SIZE)) * TILE_SIZE)
+    sizes = [top]
+    while sizes[-1] > TILE_SIZE:
+        sizes.append(sizes[-1] // 2)
+    return sizes[::-1]
+
+
+def _save_tiles(face_img: Image.Image, level_dir: str):
+    os.makedirs(level_dir, exist_ok=True)
+    size = face_img.width
+    for y in range(0, size, TILE_SIZE):
+        for x in range(0, size, TILE_SIZE):
+            tile = face_img.crop((x, y, min(size, x + TILE_SIZE), min(size, y + TILE_SIZE)))
+            tile.save(os.path.join(level_dir, f"{y // TILE_SIZE}_{x // TILE_SIZE}.jpg"), quality=TILE_QUALITY)
+
+
+def generate_tiles(src_path: str, key: str, progress=None) -> dict:
+    """
+    把等距柱状全景图切成多级立方体面瓦片，返回瓦片清单。
+    清单最后写入，作为完成标记；同一个 key 已切好时直接复用。
+    """
+    out_dir = os.path.join(TILE_ROOT, key)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    with Image.open(src_path) as im:
+        pano = np.asarray(im.convert("RGB"))
+    sizes = level_sizes(pano.shape[1])
+
+    for i, face in enumerate(FACES):
+        # 最高级直接投影，低级别逐级缩小，不再回到原图采样
+        face_img = render_face(pano, face, sizes[-1])
+        for level in range(len(sizes) - 1, -1, -1):
+            if face_img.width != sizes[level]:
+                face_img = face_img.resize((sizes[level], sizes[level]), Image.LANCZOS)
+            _save_tiles(face_img, os.path.join(out_dir, str(level), face))
+        if progress:
+            progress(i + 1, len(FACES))
+
+    manifest = {
+        "key": key,
+        "tile_size": TILE_SIZE,
+        "faces": list(FACES),
+        "levels": [
+            {"level": level, "face_size": size, "tiles": math.ceil(size / TILE_SIZE)}
+            for level, size in enumerate(sizes)
+        ],
+        "url": f"/tiles/{key}/{{level}}/{{face}}/{{y}}_{{x}}.jpg",
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+    return manifest
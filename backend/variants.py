@@ -0,0 +1,185 @@
+import io
+import os
+import time
+
+from PIL import Image, features
+
+import models
+from static_files import STATIC_DIR, VARIANT_FORMATS, blob_digest, variant_marker_rel, variant_rel
+
+# 原图 (全景图、封面、缩略图、图标) 旁边预先生成更小的 WebP / AVIF 编码，
+# /static 按请求的 Accept 挑最合适的一份返回，URL 不变
+Image.MAX_IMAGE_PIXELS = None
+NEGOTIABLE_EXTS = (".jpg", ".png", ".webp")
+
+WEBP_QUALITY = int(os.getenv("VARIANT_WEBP_QUALITY", "82"))
+AVIF_QUALITY = int(os.getenv("VARIANT_AVIF_QUALITY", "60"))
+# WebP 单边最长 16383；AVIF 编码大全景图很慢，超过像素上限的只生成 WebP
+WEBP_MAX_SIDE = 16383
+AVIF_MAX_PIXELS = int(float(os.getenv("VARIANT_AVIF_MAX_MP", "40")) * 1_000_000)
+
+
+def available_formats():
+    """按优先级排列，当前 Pillow 编译时不支持的格式跳过"""
+    return [fmt for fmt, _ in VARIANT_FORMATS if features.check(fmt)]
+
+
+def _encode(im: Image.Image, fmt: str):
+    buf = io.BytesIO()
+    if fmt == "webp":
+        if max(im.size) > WEBP_MAX_SIDE:
+            return None
+        im.save(buf, format="WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        if im.width * im.height > AVIF_MAX_PIXELS:
+            return None
+        im.save(buf, format="AVIF", quality=AVIF_QUALITY, speed=6)
+    return buf.getvalue()
+
+
+def _decode_ms(data) -> float:
+    started = time.perf_counter()
+    with Image.open(data) as im:
+        im.load()
+    return (time.perf_counter() - started) * 1000
+
+
+def _write(rel: str, data: bytes) -> str:
+    path = os.path.join(STATIC_DIR, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return f"/static/{rel}"
+
+
+def generate(db, url: str) -> int:
+    """
+    给一个内容寻址的原图生成各格式变体，记录大小和解码耗时，返回保留的变体个数。
+    按优先级从低到高编码 (先 WebP 后 AVIF)，只保留比之前的版本都小的编码，
+    这样协商时按优先级挑中的总是客户端能用的最小的那份；
+    已经处理过的原图直接跳过。处理完写标记文件，/static 见到它之后原图和变体才按一年缓存
+    """
+    digest = blob_digest(url)
+    if digest is None or not url.lower().endswith(NEGOTIABLE_EXTS):
+        return 0
+    if db.query(models.ImageVariant.id).filter(models.ImageVariant.source_url == url).first():
+        # 加标记之前处理过的原图补上标记
+        if not os.path.exists(os.path.join(STATIC_DIR, variant_marker_rel(digest))):
+            _write(variant_marker_rel(digest), b"")
+        return 0
+    path = url.lstrip("/")
+    try:
+        original_bytes = os.path.getsize(path)
+    except OSError:
+        return 0
+
+    with Image.open(path) as im:
+        started = time.perf_counter()
+        im.load()
+        original_ms = (time.perf_counter() - started) * 1000
+        has_alpha = im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info
+        pixels = im.convert("RGBA" if has_alpha else "RGB")
+    rows = [models.ImageVariant(
+        source_url=url, format="original", url=url, bytes=original_bytes,
+        width=pixels.width, height=pixels.height, decode_ms=original_ms,
+    )]
+
+    smallest = original_bytes
+    source_ext = os.path.splitext(url)[1].lstrip(".").lower()
+    for fmt in reversed(available_formats()):
+        if fmt == source_ext:
+            continue
+        data = _encode(pixels, fmt)
+        if data is None:
+            continue
+        kept = len(data) < smallest
+        if kept:
+            smallest = len(data)
+        rows.append(models.ImageVariant(
+            source_url=url, format=fmt, url=_write(variant_rel(digest, fmt), data) if kept else None,
+            bytes=len(data), width=pixels.width, height=pixels.height, decode_ms=_decode_ms(io.BytesIO(data)),
+        ))
+    db.add_all(rows)
+    db.flush()
+    _write(variant_marker_rel(digest), b"")
+    return sum(1 for r in rows[1:] if r.url)
+
+
+def discard(db, url: str):
+    """原图删除后一并删除它的变体文件、完成标记和记录；只删 variants/ 下由原图摘要决定路径的文件"""
+    digest = blob_digest(url)
+    if digest:
+        try:
+            os.remove(os.path.join(STATIC_DIR, variant_marker_rel(digest)))
+        except OSError:
+            pass
+    owned = {f"/static/{variant_rel(digest, fmt)}" for fmt, _ in VARIANT_FORMATS} if digest else set()
+    for variant in db.query(models.ImageVariant).filter(models.ImageVariant.source_url == url):
+        if variant.url in owned:
+            try:
+                os.remove(variant.url.lstrip("/"))
+            except OSError:
+                pass
+        db.delete(variant)
+
+
+def project_images(db, project_id: int):
+    """项目里用到的全部图片：(类型, 场景 id, URL)"""
+    images = []
+    project = db.get(models.Project, project_id)
+    if project and project.cover_url:
+        images.append(("project_cover", None, project.cover_url))
+    scenes = (
+        db.query(models.Scene.id, models.Scene.image_url, models.Scene.cover_url, models.Scene.thumb_url)
+        .join(models.SceneGroup, models.Scene.group_id == models.SceneGroup.id)
+        .filter(models.SceneGroup.project_id == project_id)
+        .order_by(models.Scene.id)
+    )
+    for scene_id, image_url, cover_url, thumb_url in scenes:
+        for kind, url in (("panorama", image_url), ("cover", cover_url), ("thumb", thumb_url)):
+            if url:
+                images.append((kind, scene_id, url))
+    return images
+
+
+def project_report(db, project_id: int) -> dict:
+    """每张图各格式的大小、解码耗时，以及支持 AVIF / WebP 的浏览器实际能省下多少"""
+    images = project_images(db, project_id)
+    urls = {url for _, _, url in images}
+    by_source = {}
+    if urls:
+        for v in db.query(models.ImageVariant).filter(models.ImageVariant.source_url.in_(urls)).order_by(models.ImageVariant.id):
+            by_source.setdefault(v.source_url, []).append(v)
+
+    items, pending = [], []
+    totals = {"original_bytes": 0, "served_bytes": 0, "original_decode_ms": 0.0, "served_decode_ms": 0.0}
+    for kind, scene_id, url in images:
+        variants = by_source.get(url)
+        if not variants:
+            pending.append(url)
+            continue
+        original = variants[0]
+        # 与 /static 的协商一致：按优先级取第一个保留下来的变体
+        kept = {v.format: v for v in variants[1:] if v.url}
+        served = next((kept[fmt] for fmt, _ in VARIANT_FORMATS if fmt in kept), original)
+        totals["original_bytes"] += original.bytes
+        totals["served_bytes"] += served.bytes
+        totals["original_decode_ms"] += original.decode_ms
+        totals["served_decode_ms"] += served.decode_ms
+        items.append({
+            "kind": kind, "scene_id": scene_id, "source_url": url,
+            "served_format": served.format, "saved_bytes": original.bytes - served.bytes,
+            "variants": variants,
+        })
+    saved = totals["original_bytes"] - totals["served_bytes"]
+    return {
+        "project_id": project_id,
+        "formats": available_formats(),
+        **totals,
+        "saved_bytes": saved,
+        "saved_ratio": saved / totals["original_bytes"] if totals["original_bytes"] else 0.0,
+        "images": items,
+        "pending": pending,
+    }
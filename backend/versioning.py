@@ -0,0 +1,82 @@
+import os
+
+import models
+from cache import LRUCache
+
+# 每个项目一个版本号，任何修改都会 +1；缓存和 ETag 都以它为准
+PROJECT_CACHE_BYTES = int(float(os.getenv("PROJECT_CACHE_MB", "64")) * 1024 * 1024)
+
+# (project_id, salt, version) -> 序列化好的 JSON；每个项目只留最新版本
+project_cache = LRUCache(PROJECT_CACHE_BYTES)
+_cached_versions = {}
+
+
+def project_salt(created_at) -> str:
+    """
+    SQLite 删掉 id 最大的项目后再新建会重用这个 id，版本号也从头开始；
+    缓存键和 ETag 都带上创建时间，新项目不会命中旧项目的缓存
+    """
+    return format(int(created_at.timestamp() * 1_000_000), "x") if created_at else "0"
+
+
+def project_etag(project_id: int, salt: str, version: int) -> str:
+    return f'"p{project_id}-{salt}-v{version}"'
+
+
+def get_cached_payload(project_id: int, salt: str, version: int):
+    return project_cache.get((project_id, salt, version))
+
+
+def put_cached_payload(project_id: int, salt: str, version: int, payload: bytes):
+    old = _cached_versions.get(project_id)
+    if old is not None and old != (salt, version):
+        project_cache.pop((project_id, *old))
+    _cached_versions[project_id] = (salt, version)
+    project_cache.put((project_id, salt, version), payload, len(payload))
+
+
+def forget(*project_ids):
+    """项目删除后清掉它的缓存"""
+    for pid in project_ids:
+        old = _cached_versions.pop(pid, None)
+        if old is not None:
+            project_cache.pop((pid, *old))
+
+
+def bump_version(db, *project_ids):
+    """在当前事务里把版本号 +1，随调用方的 commit 一起生效"""
+    ids = {pid for pid in project_ids if pid is not None}
+    if not ids:
+        return
+    db.query(models.Project).filter(models.Project.id.in_(ids)).update(
+        {models.Project.version: models.Project.version + 1}, synchronize_session=False
+    )
+
+
+def project_id_for_group(db, group_id: int):
+    return db.query(models.SceneGroup.project_id).filter(models.SceneGroup.id == group_id).scalar()
+
+
+def project_id_for_scene(db, scene_id: int):
+    return (
+        db.query(models.SceneGroup.project_id)
+        .join(models.Scene, models.Scene.group_id == models.SceneGroup.id)
+        .filter(models.Scene.id == scene_id)
+        .scalar()
+    )
+
+
+def project_ids_for_hotspots(db, hotspot_ids):
+    return sorted(set(projects_by_hotspot(db, hotspot_ids).values()))
+
+
+def projects_by_hotspot(db, hotspot_ids) -> dict:
+    """hotspot_id -> project_id"""
+    rows = (
+        db.query(models.Hotspot.id, models.SceneGroup.project_id)
+        .join(models.Scene, models.Hotspot.source_scene_id == models.Scene.id)
+        .join(models.SceneGroup, models.Scene.group_id == models.SceneGroup.id)
+        .filter(models.Hotspot.id.in_(hotspot_ids))
+        .all()
+    )
+    return dict(rows)
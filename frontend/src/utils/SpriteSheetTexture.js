@@ -0,0 +1,44 @@
+import * as THREE from 'three';
+
+// 服务端转码好的动图精灵图：整张图只上传一次 GPU，播放时按帧时长平移 UV，不再逐帧解码、重传像素
+export class SpriteSheetTexture extends THREE.Texture {
+  constructor(page, sprite) {
+    super();
+    // 与 clone 一样共享同一份图像数据 (source)，同一张精灵图的多个热点只加载一次
+    this.source = page.source;
+    // 新纹理的 version 为 0，渲染器不会上传；与 Texture.copy() 一样标记一次
+    this.needsUpdate = true;
+    this.sprite = sprite;
+    this.currentFrame = 0;
+    this.lastFrameTime = performance.now();
+    this.playedLoops = 0;
+
+    // 帧与帧紧挨着，mipmap 会把相邻帧混进来
+    this.minFilter = THREE.LinearFilter;
+    this.magFilter = THREE.LinearFilter;
+    this.generateMipmaps = false;
+    this.colorSpace = THREE.SRGBColorSpace;
+
+    this.repeat.set(1 / sprite.columns, 1 / sprite.rows);
+    this.showFrame(0);
+  }
+
+  showFrame(index) {
+    const { columns, rows } = this.sprite;
+    // 精灵图按行从左上角排列，WebGL 的 v 轴从下往上
+    this.offset.set((index % columns) / columns, 1 - (Math.floor(index / columns) + 1) / rows);
+  }
+
+  update() {
+    const { frames, delays, loop } = this.sprite;
+    if (frames <= 1 || (loop > 0 && this.playedLoops >= loop)) return;
+
+    const now = performance.now();
+    if (now - this.lastFrameTime >= delays[this.currentFrame]) {
+      this.currentFrame = (this.currentFrame + 1) % frames;
+      if (this.currentFrame === 0) this.playedLoops += 1;
+      this.lastFrameTime = now;
+      this.showFrame(this.currentFrame);
+    }
+  }
+}
@@ -2,6 +2,9 @@
 
 const BASE_URL = 'http://127.0.0.1:8000';
 
+// 接口的完整地址；EventSource 之类不经过 authFetch 的请求也用它
+export const apiUrl = (endpoint) => endpoint.startsWith('http') ? endpoint : `${BASE_URL}${endpoint}`;
+
 export const authFetch = async (endpoint, options = {}) => {
   // 1. 获取 Token
   const token = localStorage.getItem('auth_token');
@@ -17,7 +20,7 @@ export const authFetch = async (endpoint, options = {}) => {
 
   // 3. 发送请求
   // 如果 endpoint 是完整链接(http开头)就直接用，否则拼接 BASE_URL
-  const url = endpoint.startsWith('http') ? endpoint : `${BASE_URL}${endpoint}`;
+  const url = apiUrl(endpoint);
   
   const response = await fetch(url, {
     ...options,
@@ -35,6 +38,17 @@ export const authFetch = async (endpoint, options = {}) => {
   return response;
 };
 
+// 轮询后台任务直到结束，返回最终状态 ('done' | 'failed')
+export const waitForJob = async (jobId, interval = 500) => {
+  for (;;) {
+    const response = await authFetch(`/jobs/${jobId}/progress`);
+    if (!response.ok) throw new Error(`任务查询失败: ${response.status}`);
+    const { status } = await response.json();
+    if (status === 'done' || status === 'failed') return status;
+    await new Promise(resolve => setTimeout(resolve, interval));
+  }
+};
+
 // 辅助函数：生成图片完整 URL
 export const getImageUrl = (path) => {
   if (!path) return '';
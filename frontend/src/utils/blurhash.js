@@ -0,0 +1,85 @@
+// src/utils/blurhash.js
+// BlurHash 解码 (https://github.com/woltapp/blurhash)：后端给每个场景算好的几十个字符的占位串，
+// 解码成很小的图片当缩略图背景，真正的缩略图加载完之前先显示模糊色块
+const CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~';
+
+const decode83 = (str) => {
+  let value = 0;
+  for (const c of str) value = value * 83 + CHARS.indexOf(c);
+  return value;
+};
+
+const srgbToLinear = (value) => {
+  const v = value / 255;
+  return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4);
+};
+
+const linearToSrgb = (value) => {
+  const v = Math.max(0, Math.min(1, value));
+  return v <= 0.0031308 ? Math.round(v * 12.92 * 255 + 0.5) : Math.round((1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255 + 0.5);
+};
+
+const signPow = (v, exp) => Math.sign(v) * Math.pow(Math.abs(v), exp);
+
+export const decodeBlurhash = (hash, width, height) => {
+  const sizeFlag = decode83(hash[0]);
+  const numY = Math.floor(sizeFlag / 9) + 1;
+  const numX = (sizeFlag % 9) + 1;
+  const maxValue = (decode83(hash[1]) + 1) / 166;
+
+  const colors = [];
+  const dc = decode83(hash.substring(2, 6));
+  colors.push([srgbToLinear(dc >> 16), srgbToLinear((dc >> 8) & 255), srgbToLinear(dc & 255)]);
+  for (let i = 1; i < numX * numY; i++) {
+    const ac = decode83(hash.substring(4 + i * 2, 6 + i * 2));
+    colors.push([
+      signPow((Math.floor(ac / (19 * 19)) - 9) / 9, 2) * maxValue,
+      signPow((Math.floor(ac / 19) % 19 - 9) / 9, 2) * maxValue,
+      signPow((ac % 19 - 9) / 9, 2) * maxValue,
+    ]);
+  }
+
+  const pixels = new Uint8ClampedArray(width * height * 4);
+  for (let y = 0; y < height; y++) {
+    for (let x = 0; x < width; x++) {
+      let r = 0, g = 0, b = 0;
+      for (let j = 0; j < numY; j++) {
+        for (let i = 0; i < numX; i++) {
+          const basis = Math.cos((Math.PI * x * i) / width) * Math.cos((Math.PI * y * j) / height);
+          const color = colors[i + j * numX];
+          r += color[0] * basis;
+          g += color[1] * basis;
+          b += color[2] * basis;
+        }
+      }
+      const p = 4 * (x + y * width);
+      pixels[p] = linearToSrgb(r);
+      pixels[p + 1] = linearToSrgb(g);
+      pixels[p + 2] = linearToSrgb(b);
+      pixels[p + 3] = 255;
+    }
+  }
+  return pixels;
+};
+
+// 同一个占位串只解码一次；浏览器会把小图放大并平滑，32x16 足够
+const cache = new Map();
+
+export const blurhashToDataURL = (hash, width = 32, height = 16) => {
+  if (!hash || hash.length < 6) return null;
+  if (!cache.has(hash)) {
+    const canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = height;
+    const ctx = canvas.getContext('2d');
+    ctx.putImageData(new ImageData(decodeBlurhash(hash, width, height), width, height), 0, 0);
+    cache.set(hash, canvas.toDataURL());
+  }
+  return cache.get(hash);
+};
+
+// 缩略图容器的背景样式，没有占位串时不设置
+export const placeholderStyle = (hash) => {
+  const url = blurhashToDataURL(hash);
+  return url ? { backgroundImage: `url(${url})`, backgroundSize: 'cover' } : {};
+};
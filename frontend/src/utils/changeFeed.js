@@ -0,0 +1,116 @@
+// src/utils/changeFeed.js
+// 项目增量同步：保存之后只拉取自己版本号之后的变更 (/projects/{id}/changes)，
+// 并通过事件流实时接收别人对同一个项目的修改，按 id 更新本地的项目树，不再整棵重新下载
+import { authFetch, apiUrl } from './api';
+
+const bySortOrder = (a, b) => (a.sort_order ?? 0) - (b.sort_order ?? 0) || a.id - b.id;
+
+// 把一次变更应用到 /projects/{id} 结构的项目上 (原地修改)。
+// 返回 false 表示接不上 (日志已清理、中间缺了版本)，调用方应重新加载整个项目
+export const applyChanges = (project, delta) => {
+  if (!project || !delta || delta.reset || delta.since > project.version) return false;
+  // 自己保存后拉取的和事件流推送的可能是同一批变更
+  if (delta.version <= project.version) return true;
+
+  const groups = project.groups || (project.groups = []);
+  const groupMap = new Map(groups.map(g => [g.id, g]));
+  const sceneMap = new Map();
+  const hotspotScene = new Map();
+  groups.forEach(g => (g.scenes || (g.scenes = [])).forEach(s => {
+    sceneMap.set(s.id, s);
+    (s.hotspots || (s.hotspots = [])).forEach(h => hotspotScene.set(h.id, s));
+  }));
+
+  // 1. 删除：分组、场景删掉后其下的内容随之消失；指向被删场景的热点不再跳转
+  const { deleted } = delta;
+  if (deleted.groups.length) {
+    const ids = new Set(deleted.groups);
+    project.groups = groups.filter(g => !ids.has(g.id));
+    ids.forEach(id => groupMap.delete(id));
+  }
+  const removedScenes = new Set(deleted.scenes);
+  groups.forEach(g => {
+    if (deleted.groups.includes(g.id)) g.scenes.forEach(s => removedScenes.add(s.id));
+  });
+  if (removedScenes.size) {
+    groupMap.forEach(g => { g.scenes = g.scenes.filter(s => !removedScenes.has(s.id)); });
+    removedScenes.forEach(id => sceneMap.delete(id));
+    sceneMap.forEach(s => {
+      s.hotspots.forEach(h => { if (removedScenes.has(h.target_scene_id)) h.target_scene_id = null; });
+      if (s.prefetch) s.prefetch = s.prefetch.filter(id => !removedScenes.has(id));
+    });
+  }
+  deleted.hotspots.forEach(id => {
+    const owner = hotspotScene.get(id);
+    if (owner) owner.hotspots = owner.hotspots.filter(h => h.id !== id);
+  });
+
+  // 2. 新增或修改：按 id 合并，所属分组 / 场景变了的移过去
+  if (delta.project) Object.assign(project, delta.project);
+
+  delta.groups.forEach(g => {
+    const existing = groupMap.get(g.id);
+    if (existing) Object.assign(existing, g);
+    else {
+      const group = { ...g, scenes: [] };
+      project.groups.push(group);
+      groupMap.set(g.id, group);
+    }
+  });
+  project.groups.sort((a, b) => a.id - b.id);
+
+  const touchedGroups = new Set();
+  delta.scenes.forEach(s => {
+    const group = groupMap.get(s.group_id);
+    if (!group) return;
+    let scene = sceneMap.get(s.id);
+    if (scene && scene.group_id !== s.group_id) {
+      const from = groupMap.get(scene.group_id);
+      if (from) from.scenes = from.scenes.filter(x => x.id !== s.id);
+      group.scenes.push(scene);
+    }
+    if (scene) Object.assign(scene, s);
+    else {
+      scene = { ...s, hotspots: [], prefetch: [] };
+      group.scenes.push(scene);
+      sceneMap.set(s.id, scene);
+    }
+    touchedGroups.add(group);
+  });
+  touchedGroups.forEach(g => g.scenes.sort(bySortOrder));
+
+  const touchedScenes = new Set();
+  delta.hotspots.forEach(({ source_scene_id, ...h }) => {
+    const scene = sceneMap.get(source_scene_id);
+    if (!scene) return;
+    const from = hotspotScene.get(h.id);
+    const existing = from && from.hotspots.find(x => x.id === h.id);
+    if (existing && from !== scene) {
+      from.hotspots = from.hotspots.filter(x => x.id !== h.id);
+      scene.hotspots.push(existing);
+    }
+    if (existing) Object.assign(existing, h);
+    else scene.hotspots.push(h);
+    touchedScenes.add(scene);
+  });
+  touchedScenes.forEach(s => s.hotspots.sort(bySortOrder));
+
+  project.version = delta.version;
+  return true;
+};
+
+export const fetchChanges = async (projectId, since) => {
+  const res = await authFetch(`/projects/${projectId}/changes?since=${since}`);
+  return res.ok ? res.json() : null;
+};
+
+// 订阅实时变更，返回取消订阅的函数。EventSource 不能带请求头，token 放在查询参数里；
+// 断线后浏览器会自动重连，并带上最后收到的版本号
+export const subscribeChanges = (projectId, since, onChanges) => {
+  const token = encodeURIComponent(localStorage.getItem('auth_token') || '');
+  const source = new EventSource(apiUrl(`/projects/${projectId}/changes/stream?since=${since}&token=${token}`));
+  source.addEventListener('changes', (e) => onChanges(JSON.parse(e.data)));
+  // 项目已被删除
+  source.addEventListener('deleted', () => source.close());
+  return () => source.close();
+};
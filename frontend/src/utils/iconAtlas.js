@@ -0,0 +1,53 @@
+// src/utils/iconAtlas.js
+import * as THREE from 'three';
+import { authFetch, getImageUrl } from './api';
+import { SpriteSheetTexture } from './SpriteSheetTexture';
+
+// 图标纹理图集：整个会话只下载、上传一次页图片，各热点的纹理共享同一份图像数据，按 UV 取区域
+let atlasPromise = null;
+
+export const loadIconAtlas = () => {
+  if (!atlasPromise) {
+    atlasPromise = authFetch('/icons/atlas')
+      .then(res => (res.ok ? res.json() : null))
+      .then(manifest => {
+        if (!manifest) return null;
+        const loader = new THREE.TextureLoader();
+        const pages = manifest.pages.map(p => {
+          const tex = loader.load(getImageUrl(p.url));
+          tex.colorSpace = THREE.SRGBColorSpace;
+          return tex;
+        });
+        return { manifest, pages, sheets: {} };
+      })
+      .catch(() => null);
+  }
+  return atlasPromise;
+};
+
+// 上传 / 删除图标后调用，下次 loadIconAtlas 会取新的图集
+export const resetIconAtlas = () => { atlasPromise = null; };
+
+// 图标在图集里时返回共享页图片的纹理 (clone 只复制 UV 参数，不复制图像)，否则返回 null
+export const atlasTexture = (atlas, url) => {
+  if (!atlas || !url) return null;
+  const entry = atlas.manifest.icons[url.split('?')[0]];
+  if (!entry) return null;
+  const [u0, v0, u1, v1] = entry.uv;
+  const tex = atlas.pages[entry.page].clone();
+  tex.offset.set(u0, v0);
+  tex.repeat.set(u1 - u0, v1 - v0);
+  return tex;
+};
+
+// 动图图标服务端已转成精灵图时返回可播放的纹理 (每帧调用 update)，否则返回 null
+export const spriteTexture = (atlas, url) => {
+  const sprite = atlas && url && atlas.manifest.sprites?.[url.split('?')[0]];
+  if (!sprite) return null;
+  if (!atlas.sheets[sprite.url]) {
+    const sheet = new THREE.TextureLoader().load(getImageUrl(sprite.url));
+    sheet.colorSpace = THREE.SRGBColorSpace;
+    atlas.sheets[sprite.url] = sheet;
+  }
+  return new SpriteSheetTexture(atlas.sheets[sprite.url], sprite);
+};